@@ -0,0 +1,78 @@
+import time
+from common.settings import Settings
+
+
+class Budget:
+    """
+    Budget limits the number of attempts and the time spent by a retry
+    loop of the generation.
+
+    The limits are read from the Budgets section of the settings as
+    <name>Attempts and <name>Seconds, where 0 means no limit. Every run of
+    the loop calls start first and use for every attempt, and stops
+    trying once exhausted returns True. The first attempt of every run is
+    always allowed, so a loop that ends up exhausted has at least one
+    result to fall back to. Attempt limits keep the result reproducible,
+    time limits make it depend on the speed of the computer.
+    """
+
+    def __init__(self, settings: Settings, name: str) -> None:
+        """
+        Initialize the budget
+
+        Args:
+            settings (Settings): Settings object
+            name (str): Name of the budget in the Budgets section
+        """
+        self.name = name
+        self.attempts = settings.getItem("Budgets", name + "Attempts", int)
+        self.seconds = settings.getItem("Budgets", name + "Seconds", float)
+        self.used = 0
+        self.startTime = 0
+
+    def __repr__(self) -> str:
+        return f"{self.name} budget, {self.used} attempts in " \
+            f"{time.monotonic() - self.startTime:.2f} s"
+
+    def start(self) -> "Budget":
+        """
+        Start a new run of the loop with the whole budget.
+
+        Returns:
+            Budget: This budget
+        """
+        self.used = 0
+        self.startTime = time.monotonic()
+        return self
+
+    def use(self) -> None:
+        """
+        Use one attempt.
+        """
+        self.used += 1
+
+    def remaining(self) -> int:
+        """
+        Get the number of attempts left, ignoring the time limit.
+
+        Returns:
+            int: Number of attempts left, or a very large number without a limit
+        """
+        if self.attempts <= 0:
+            return 2**31
+        return max(0, self.attempts - self.used)
+
+    def exhausted(self) -> bool:
+        """
+        Check if the loop should stop trying.
+
+        Returns:
+            bool: True if all attempts are used or the time is up, never
+            before the first attempt
+        """
+        if self.used == 0:
+            return False
+        if self.attempts > 0 and self.used >= self.attempts:
+            return True
+        return self.seconds > 0 and \
+            time.monotonic() - self.startTime >= self.seconds
@@ -0,0 +1,54 @@
+import threading
+
+
+class Cancelled(Exception):
+    """
+    Raised when work is stopped by a CancellationToken
+    """
+
+
+class CancellationToken:
+    """
+    CancellationToken lets another thread stop long running work.
+
+    The work calls check inside its loops, which raises Cancelled once
+    cancel has been called, so the work stops within one iteration of the
+    innermost loop instead of finishing first.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize a token that is not cancelled
+        """
+        self.event = threading.Event()
+
+    def cancel(self) -> None:
+        """
+        Request the work to stop.
+        """
+        self.event.set()
+
+    def reset(self) -> None:
+        """
+        Allow new work to run with this token.
+        """
+        self.event.clear()
+
+    def isCancelled(self) -> bool:
+        """
+        Check if the work has been requested to stop.
+
+        Returns:
+            bool: True if cancel has been called after the last reset
+        """
+        return self.event.is_set()
+
+    def check(self) -> None:
+        """
+        Stop the work if it has been requested to stop.
+
+        Raises:
+            Cancelled: If cancel has been called after the last reset
+        """
+        if self.event.is_set():
+            raise Cancelled()
@@ -1,13 +1,30 @@
 import sys              # nopep8
 sys.path.append('..')   # nopep8
+import argparse
 from common.settings import Settings
+from system.bankfill import fillBank
 from system.environment import Environment
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Gendala mandala generator")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last checkpointed render")
+    parser.add_argument(
+        "--fill-bank",
+        type=int,
+        metavar="N",
+        help="generate N features into the feature bank and exit")
+    args = parser.parse_args()
     s = Settings('../settings.ini')
-    e = Environment(s)
+    if args.fill_bank is not None:
+        fillBank(s, args.fill_bank)
+        return
+    e = Environment(s, resume=args.resume)
     e.run()
 
 
-main()
+if __name__ == "__main__":
+    main()
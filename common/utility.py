@@ -1,6 +1,9 @@
 from __future__ import annotations
 import colorsys
-from typing import List, TypeVar
+import sys
+import time
+from typing import Dict, List, TypeVar
+from common.settings import Settings
 
 T = TypeVar('T')
 
@@ -103,10 +106,29 @@ def gradient(v1: T, v2: T, s: float) -> T:
     d = v2 - v1
     return v1 + d * s
 
+def redirectPrints(settings: Settings) -> None:
+    """
+    Print the messages of this process into standard error if the
+    animation frames are written into standard output.
+
+    Every process that prints messages has to call this, worker processes
+    do not inherit the redirection.
+
+    Args:
+        settings (Settings): Settings object
+    """
+    if settings.getBool("Animation", "animate") and \
+            settings.getItem("Animation", "output", str) == "-":
+        sys.stdout = sys.stderr
+
+
 class Logger:
     def __init__(self) -> None:
         self.maxLayer = 1
         self.layer = 1
+        # predicted seconds of every layer index, None hides the progress
+        self.estimates: Dict[int, float] = None
+        self.startTime = 0
     
     def setLayer(self, value):
         self.layer = value
@@ -117,6 +139,37 @@ class Logger:
     def layerPrint(self, txt):
         print("[" + str(self.layer).zfill(2) + "/" + str(self.maxLayer).zfill(2) + "] " + txt)
 
+    def setEstimates(self, estimates: Dict[int, float]) -> None:
+        """
+        Start timing the layers for progressPrint.
+
+        Args:
+            estimates (Dict[int, float]): Predicted seconds of every remaining layer by index, or None to stop showing the progress
+        """
+        self.estimates = estimates
+        self.startTime = time.monotonic()
+
+    def progressPrint(self) -> None:
+        """
+        Print the progress and the estimated remaining time once the
+        current layer is finished.
+
+        The predicted time of the remaining layers is corrected by the
+        ratio of the elapsed time to the predicted time of the finished
+        layers.
+        """
+        if not self.estimates:
+            return
+        total = sum(self.estimates.values())
+        done = sum(t for i, t in self.estimates.items() if i <= self.layer)
+        elapsed = time.monotonic() - self.startTime
+        remaining = total - done
+        if done > 0:
+            remaining *= elapsed / done
+        self.layerPrint(
+            f"Progress {done / total:.0%}, {elapsed:.1f} s elapsed, "
+            f"ETA {remaining:.1f} s.")
+
 class Color:
     """
     Color defines three rgb channels
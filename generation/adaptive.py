@@ -0,0 +1,206 @@
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List
+
+
+class AdaptiveSampler:
+    """
+    AdaptiveSampler proposes outcomes of a discrete distribution, biased
+    towards the outcomes that have been part of accepted candidates more
+    often than the others.
+
+    Every outcome starts with its configured probability. Candidates are
+    recorded with the outcomes they were made of and whether they were
+    accepted. While the sampler is learning, after every roundSize recorded
+    candidates the proposal probabilities are updated to the configured
+    probability times the smoothed acceptance rate of the outcome raised to
+    strength. Once frozen, the proposals no longer change. The ratio
+    of the proposal probability to the configured probability is limited
+    to 1 / maxRatio ... maxRatio, so no outcome becomes impossible and the
+    accepted candidates stay close to the configured distribution.
+
+    The importance weight of an outcome, configured probability divided
+    by proposal probability, is summed over the accepted candidates, so
+    the effective share of accepted candidates can be reported.
+    """
+
+    def __init__(
+            self,
+            weights: List[float],
+            strength: float = 1,
+            maxRatio: float = 4,
+            roundSize: int = 8) -> None:
+        """
+        Initialize the sampler
+
+        Args:
+            weights (List[float]): Configured weights of the outcomes
+            strength (float, optional): Exponent of the acceptance rate, 0 disables adaptation. Defaults to 1.
+            maxRatio (float, optional): Largest ratio between proposal and configured probability. Defaults to 4.
+            roundSize (int, optional): Number of recorded candidates between updates. Defaults to 8.
+        """
+        total = sum(weights)
+        self.configured = [w / total for w in weights]
+        self.strength = strength
+        self.maxRatio = maxRatio
+        self.roundSize = roundSize
+        self.resetStatistics()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the acceptance of the recorded candidates and propose the
+        configured distribution again.
+        """
+        self.proposed = [0] * len(self.configured)
+        self.accepted = [0] * len(self.configured)
+        self.recorded = 0
+        self.learning = True
+        self.setProbabilities(self.configured)
+
+    def freeze(self) -> None:
+        """
+        Stop updating the proposal probabilities.
+        """
+        self.learning = False
+
+    def resetStatistics(self) -> None:
+        """
+        Reset the statistics of the recorded candidates shown by report.
+        """
+        self.candidates = 0
+        self.acceptedCandidates = 0
+        self.acceptedWeight = 0
+        self.acceptedWeightSquared = 0
+
+    def setProbabilities(self, probabilities: List[float]) -> None:
+        """
+        Set the proposal probabilities, for example the ones of another
+        sampler.
+
+        Args:
+            probabilities (List[float]): Proposal probability of every outcome
+        """
+        self.probabilities = list(probabilities)
+        self.limits = list(accumulate(self.probabilities))[:-1]
+
+    def sample(self) -> int:
+        """
+        Propose an outcome using the random module.
+
+        Returns:
+            int: Index of the outcome
+        """
+        return self.outcome(random.random())
+
+    def outcome(self, u: float) -> int:
+        """
+        Get the proposed outcome for a uniform random number.
+
+        Args:
+            u (float): Random number between 0 and 1
+
+        Returns:
+            int: Index of the outcome
+        """
+        return bisect_right(self.limits, u)
+
+    def weight(self, outcomes: List[int]) -> float:
+        """
+        Get the importance weight of a candidate made of the given
+        outcomes.
+
+        Args:
+            outcomes (List[int]): Proposed outcomes of the candidate
+
+        Returns:
+            float: Configured probability divided by proposal probability
+        """
+        weight = 1
+        for i in outcomes:
+            weight *= self.configured[i] / self.probabilities[i]
+        return weight
+
+    def remaining(self) -> int:
+        """
+        Get the number of candidates that can be recorded before the
+        proposal probabilities are updated.
+
+        Returns:
+            int: Number of candidates
+        """
+        return self.roundSize - self.recorded % self.roundSize
+
+    def record(self, outcomes: List[int], accepted: bool) -> None:
+        """
+        Record a candidate, and update the proposal probabilities at the
+        end of a round while learning.
+
+        Args:
+            outcomes (List[int]): Proposed outcomes of the candidate
+            accepted (bool): True if the candidate was accepted
+        """
+        self.candidates += 1
+        if accepted:
+            self.acceptedCandidates += 1
+            weight = self.weight(outcomes)
+            self.acceptedWeight += weight
+            self.acceptedWeightSquared += weight**2
+        for i in outcomes:
+            self.proposed[i] += 1
+            if accepted:
+                self.accepted[i] += 1
+        self.recorded += 1
+        if self.recorded % self.roundSize == 0 and self.learning and \
+                self.strength > 0:
+            self.update()
+
+    def update(self) -> None:
+        """
+        Update the proposal probabilities from the recorded candidates.
+
+        The acceptance rate of every outcome is smoothed towards the
+        overall rate with a prior of one round of proposals.
+        """
+        proposed = sum(self.proposed)
+        if proposed == 0:
+            return
+        overall = sum(self.accepted) / proposed
+        if overall == 0:
+            return
+        prior = self.roundSize
+        scores = [
+            p * ((a + prior * overall) / (n + prior) / overall)**self.strength
+            for p, a, n in zip(self.configured, self.accepted, self.proposed)]
+        total = sum(scores)
+        probabilities = [s / total for s in scores]
+        # clamping and normalizing alternately converges in a few rounds
+        for _ in range(8):
+            probabilities = [
+                min(max(q, p / self.maxRatio), p * self.maxRatio)
+                for p, q in zip(self.configured, probabilities)]
+            total = sum(probabilities)
+            probabilities = [q / total for q in probabilities]
+        self.setProbabilities(probabilities)
+
+    def report(self) -> str:
+        """
+        Get a summary of the recorded candidates.
+
+        The effective share is the effective sample size of the accepted
+        candidates under their importance weights divided by their number.
+        It is 1 when the accepted candidates follow the configured
+        distribution and smaller the further they are from it.
+
+        Returns:
+            str: Summary
+        """
+        if self.acceptedCandidates == 0:
+            return f"0 of {self.candidates} candidates accepted."
+        effective = self.acceptedWeight**2 / self.acceptedWeightSquared
+        return (
+            f"{self.acceptedCandidates} of {self.candidates} candidates "
+            f"accepted ({self.acceptedCandidates / self.candidates:.1%}), "
+            f"{self.candidates / self.acceptedCandidates:.1f} per accepted, "
+            f"effective share {effective / self.acceptedCandidates:.2f}.")
@@ -0,0 +1,259 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import os
+import random
+from math import floor
+from typing import Dict, List, Tuple
+from common.utility import clamp
+from geometry.point import Point
+from hierarchy.pattern import Pattern
+
+# Version of the layout of the bank files
+bankVersion = 1
+
+# Left and right connection buckets and x and y mirroring of a feature
+BankKey = Tuple[int, int, bool, bool]
+
+
+class FeatureBank:
+    """
+    FeatureBank is a collection of generated feature patterns on the disk.
+
+    Features are defined in the unit square, independent of the radius and
+    colors of the layer, so a feature generated once can be used in any
+    layer whose connections and mirroring match. The connections are
+    rounded to the centers of a number of buckets, both when the bank is
+    filled and when the layers are generated, so a feature from the bank
+    connects exactly to its neighbours.
+
+    The bank folder contains:
+        info.npy:     Layout version, number of buckets and the
+                      connectionOverridesMirror setting.
+        points.npy:   Coordinates of the points of all runs as float32.
+        runEnds.npy:  Index in points after the last point of every run.
+        features.npy: First and last run, connection buckets and mirror
+                      flags of every feature, -1 for no connection.
+
+    The arrays are memory-mapped on load, so opening a large bank is fast
+    and worker processes share its pages.
+    """
+
+    def __init__(
+            self,
+            folder: str,
+            buckets: int,
+            connectionOverride: bool) -> None:
+        """
+        Initialize an empty bank
+
+        Args:
+            folder (str): Path to the bank folder
+            buckets (int): Number of connection buckets between -1 and 1
+            connectionOverride (bool): The connectionOverridesMirror setting the features are generated with
+        """
+        self.folder = folder
+        self.buckets = buckets
+        self.connectionOverride = connectionOverride
+        self.points = None
+        self.runEnds = None
+        self.features = None
+        # indices of the banked features of every key
+        self.index: Dict[BankKey, List[int]] = {}
+        # generated features not yet saved
+        self.pending: List[Tuple[BankKey, Pattern]] = []
+
+    def path(self, name: str) -> str:
+        """
+        Get the path of a file inside the bank folder.
+
+        Args:
+            name (str): File name
+
+        Returns:
+            str: Path to the file
+        """
+        return os.path.join(self.folder, name)
+
+    def bucket(self, y: float) -> int:
+        """
+        Get the bucket of a connection.
+
+        Args:
+            y (float): Y coordinate of the connection, or None
+
+        Returns:
+            int: Index of the bucket, or -1 for no connection
+        """
+        if y is None:
+            return -1
+        return clamp(floor((y + 1) / 2 * self.buckets), 0, self.buckets - 1)
+
+    def snap(self, y: float) -> float:
+        """
+        Round a connection to the center of its bucket.
+
+        Args:
+            y (float): Y coordinate of the connection, or None
+
+        Returns:
+            float: Center of the bucket, or None for no connection
+        """
+        if y is None:
+            return None
+        return -1 + (self.bucket(y) + 0.5) * 2 / self.buckets
+
+    def key(
+            self,
+            leftConnection: float,
+            rightConnection: float,
+            mirrorX: bool,
+            mirrorY: bool) -> BankKey:
+        """
+        Get the key of a feature.
+
+        Args:
+            leftConnection (float): Requested left connection, or None
+            rightConnection (float): Requested right connection, or None
+            mirrorX (bool): Feature is mirrored along x axis
+            mirrorY (bool): Feature is mirrored along y axis
+
+        Returns:
+            BankKey: Key of the feature
+        """
+        return (
+            self.bucket(leftConnection),
+            self.bucket(rightConnection),
+            mirrorX,
+            mirrorY)
+
+    def load(self) -> bool:
+        """
+        Memory-map the bank files and index the features.
+
+        Returns:
+            bool: True if a bank matching the settings was loaded
+        """
+        if not os.path.isfile(self.path("info.npy")):
+            return False
+        info = numpy.load(self.path("info.npy"))
+        if int(info[0]) != bankVersion:
+            print("Feature bank was written by another version, not used.")
+            return False
+        if int(info[1]) != self.buckets or \
+                bool(info[2]) != self.connectionOverride:
+            print("Feature bank was filled with other connectionBuckets or "
+                  "connectionOverridesMirror settings, not used.")
+            return False
+        self.points = numpy.load(self.path("points.npy"), mmap_mode="r")
+        self.runEnds = numpy.load(self.path("runEnds.npy"), mmap_mode="r")
+        self.features = numpy.load(self.path("features.npy"), mmap_mode="r")
+        self.index = {}
+        for i, (_, _, left, right, mirrorX, mirrorY) in \
+                enumerate(self.features.tolist()):
+            self.index.setdefault(
+                (left, right, bool(mirrorX), bool(mirrorY)), []).append(i)
+        return True
+
+    def size(self) -> int:
+        """
+        Get the number of saved features.
+
+        Returns:
+            int: Number of features
+        """
+        return 0 if self.features is None else len(self.features)
+
+    def draw(self, key: BankKey) -> Pattern:
+        """
+        Draw a random banked feature with the given key.
+
+        Args:
+            key (BankKey): Key of the feature
+
+        Returns:
+            Pattern: Pattern of the feature, or None if the bank has no
+            feature with the key
+        """
+        indices = self.index.get(key)
+        if not indices:
+            return None
+        firstRun, lastRun = self.features[
+            indices[random.randrange(len(indices))]][:2].tolist()
+        pattern = Pattern()
+        if firstRun == lastRun:
+            return pattern
+        start = 0 if firstRun == 0 else int(self.runEnds[firstRun - 1])
+        ends = self.runEnds[firstRun:lastRun].tolist()
+        coords = self.points[start:ends[-1]].tolist()
+        runStart = start
+        for end in ends:
+            pattern.runs.append([
+                Point(x, y) for x, y in coords[runStart - start:end - start]])
+            runStart = end
+        pattern.updateLimits()
+        return pattern
+
+    def add(self, key: BankKey, pattern: Pattern) -> None:
+        """
+        Add a generated feature to be saved.
+
+        Args:
+            key (BankKey): Key of the feature
+            pattern (Pattern): Pattern of the feature
+        """
+        self.pending.append((key, pattern))
+
+    def save(self) -> None:
+        """
+        Append the pending features to the bank files and load the bank
+        again.
+
+        Every file is first written into a temporary file and then renamed.
+        """
+        if not self.pending:
+            return
+        points = [p for _, pattern in self.pending
+                  for run in pattern.runs
+                  for p in run]
+        runLengths = [len(run) for _, pattern in self.pending
+                      for run in pattern.runs]
+        runCounts = [len(pattern.runs) for _, pattern in self.pending]
+        keys = [key for key, _ in self.pending]
+
+        newPoints = numpy.array(
+            [(p.x, p.y) for p in points], dtype=numpy.float32).reshape(-1, 2)
+        newRunEnds = numpy.cumsum(runLengths, dtype=numpy.int32)
+        lastRuns = numpy.cumsum(runCounts, dtype=numpy.int32)
+        newFeatures = numpy.zeros((len(keys), 6), dtype=numpy.int32)
+        newFeatures[:, 0] = lastRuns - runCounts
+        newFeatures[:, 1] = lastRuns
+        newFeatures[:, 2:] = keys
+
+        if self.features is not None:
+            newRunEnds += len(self.points)
+            newFeatures[:, :2] += len(self.runEnds)
+            newPoints = numpy.concatenate((self.points, newPoints))
+            newRunEnds = numpy.concatenate((self.runEnds, newRunEnds))
+            newFeatures = numpy.concatenate((self.features, newFeatures))
+        # memory-mapped files can not be replaced on every platform
+        self.points = None
+        self.runEnds = None
+        self.features = None
+
+        os.makedirs(self.folder, exist_ok=True)
+        info = numpy.array(
+            [bankVersion, self.buckets, int(self.connectionOverride)])
+        for name, array in [
+                ("points.npy", newPoints),
+                ("runEnds.npy", newRunEnds),
+                ("features.npy", newFeatures),
+                ("info.npy", info)]:
+            path = self.path(name)
+            with open(path + ".tmp", "wb") as f:
+                numpy.save(f, array)
+            os.replace(path + ".tmp", path)
+        self.pending = []
+        self.load()
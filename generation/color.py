@@ -1,6 +1,8 @@
 import colorsys
 import random
 from typing import Tuple
+from common.budget import Budget
+from common.cancellation import CancellationToken
 from common.settings import Settings
 from common.utility import Color, clamp, Logger
 from generation.utility import coinFlip
@@ -9,16 +11,30 @@ from generation.utility import coinFlip
 class ColorGenerator:
     """
     Generator for background and foreground color pairs.
+
+    Pairs are drawn until both foreground colors differ enough from their
+    backgrounds. If the color budget runs out first, the drawn colors with
+    the largest smallest difference are used.
     """
 
-    def __init__(self, settings: Settings, logger:Logger) -> None:
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
         """
         Initialize the Color generator object.
 
         Args:
             settings (Settings):  Settings object
+            token (CancellationToken, optional): Token that stops the generation. Defaults to one that is never cancelled.
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
         self.logger = logger
+        if token is None:
+            token = CancellationToken()
         self.centerValueRange = settings.getList(
             "Colors", "centerValueRange", float)
         self.bgHueRange = settings.getList("Colors", "bgHueRange", float)
@@ -36,7 +52,11 @@ class ColorGenerator:
         self.purityThreshold = settings.getItem(
             "Colors", "purityThreshold", float)
 
-        while True:
+        budget = Budget(settings, "color").start()
+        best = None
+        while not budget.exhausted():
+            token.check()
+            budget.use()
             self.bg1 = self.randomColor(
                 self.bgHueRange,
                 (0.6, 0.8),
@@ -57,15 +77,17 @@ class ColorGenerator:
             self.fg1 = self.fgFromBg(self.bg1)
             self.fg2 = self.fgFromBg(self.bg2)
 
-            if self.visualDistance(self.bg1,
-                                   self.fg1) < self.visualDiffThreshold:
-                self.logger.layerPrint("\tForeground too similar to background, discarded.")
-                continue
-            if self.visualDistance(self.bg2,
-                                   self.fg2) < self.visualDiffThreshold:
+            distance = min(self.visualDistance(self.bg1, self.fg1),
+                           self.visualDistance(self.bg2, self.fg2))
+            if distance < self.visualDiffThreshold:
                 self.logger.layerPrint("\tForeground too similar to background, discarded.")
+                if best is None or distance > best[0]:
+                    best = (distance, self.bg1, self.bg2, self.fg1, self.fg2)
                 continue
             break
+        else:
+            self.logger.layerPrint(f"\tOut of {budget}, using the most different colors.")
+            _, self.bg1, self.bg2, self.fg1, self.fg2 = best
 
     def visualDistance(self, c1: Color, c2: Color) -> float:
         """
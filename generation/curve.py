@@ -1,25 +1,42 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import random
+from common.budget import Budget
+from common.cancellation import CancellationToken
 from common.settings import Settings
 from common.utility import Logger
-from generation.utility import sampleFromDistribution, randomPoint
-from hierarchy.curve import Curve
-from geometry.point import Point
+from generation.adaptive import AdaptiveSampler
+from generation.utility import edgePadding, sampleFromDistribution, randomPoint
+from hierarchy.curve import Curve, GeometryException
+from geometry.point import Point, collisionThreshold
 from typing import List
 
+# Number of points between the ends of the straight fallback curve
+fallbackSubDivs = 16
+
 
 class CurveGenerator:
     """
     Generator for Curve objects
     """
 
-    def __init__(self, settings: Settings, logger: Logger) -> None:
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
         """
         Initialize the generator
 
         Args:
             settings (Settings): Settings object
+            token (CancellationToken, optional): Token that stops the generation. Defaults to one that is never cancelled.
         """
         self.logger = logger
+        self.token = token if token is not None else CancellationToken()
         self.pdNPoints = settings.getList(
             section="Curves",
             setting="PD_complexity",
@@ -45,6 +62,33 @@ class CurveGenerator:
             setting="maxArcAmplitude",
             constructor=float
         )
+        self.batchSize = settings.getItem(
+            section="Curves",
+            setting="batchSize",
+            constructor=int
+        )
+        self.adaptiveGrid = settings.getItem(
+            section="Curves",
+            setting="adaptiveGrid",
+            constructor=int
+        )
+        # proposes the grid cells of the random points, None if disabled
+        self.pointSampler: AdaptiveSampler = None
+        if settings.getBool("Curves", "adaptiveSampling"):
+            self.pointSampler = AdaptiveSampler(
+                [1] * self.adaptiveGrid**2,
+                strength=settings.getItem(
+                    "Curves", "adaptiveStrength", float),
+                maxRatio=settings.getItem(
+                    "Curves", "adaptiveMaxRatio", float))
+        # grid cells of the random points of the last curve
+        self.lastCells: List[int] = []
+        self.pointBudget = Budget(settings, "point")
+        self.rng = None
+        if numpy is not None:
+            self.rng = numpy.random.Generator(numpy.random.PCG64())
+            self.subDivLimits = cumulativeLimits(self.pdSubDivs)
+            self.extensionTypeLimits = cumulativeLimits(self.pdExtensionType)
 
     def getCurve(
             self,
@@ -54,7 +98,11 @@ class CurveGenerator:
         """
         Generate a random Curve
 
-        If start or end are not given, they are random.
+        If start or end are not given, they are random. Point sets with
+        adjacent points too close to each other are discarded and new ones
+        are drawn until the point budget runs out. With numpy and
+        batchSize > 1, the point sets and their connections are drawn in
+        batches, see getBatchCurve.
 
         Args:
             closed (bool, optional): Wether to close the curve. Defaults to False.
@@ -63,32 +111,199 @@ class CurveGenerator:
 
         Returns:
             Curve: A random Curve
-        """
 
-        points: List[Point] = []
+        Raises:
+            Cancelled: If the token is cancelled
+            GeometryException: If no valid point set was found
+        """
+        self.token.check()
 
         n = 2 + sampleFromDistribution(self.pdNPoints)
 
         if start:
-            points.append(start)
             n -= 1
         if end:
             n -= 1
 
-        points.extend(self.getPoints(n))
+        if numpy is not None and self.batchSize > 1:
+            return self.getBatchCurve(n, closed=closed, start=start, end=end)
 
-        if end:
-            points.append(end)
+        budget = self.pointBudget.start()
+        while not budget.exhausted():
+            self.token.check()
+            budget.use()
+            points: List[Point] = []
+            if start:
+                points.append(start)
+            if self.pointSampler is not None:
+                self.lastCells = [self.pointSampler.sample() for _ in range(n)]
+                points.extend(self.cellPoint(cell, random.random(), random.random())
+                              for cell in self.lastCells)
+            else:
+                points.extend(self.getPoints(n))
+            if end:
+                points.append(end)
 
-        curve = Curve(points[0], closed=closed)
-        for point in points[1:]:
-            self.extend(curve, point)
-        curve.removeDuplicates()
-        if (len(curve.points) < 2) or (len(curve.points) < 3 and closed):
+            curve = Curve(points[0], closed=closed)
+            for point in points[1:]:
+                self.extend(curve, point)
+            if self.isValid(curve):
+                return curve
             self.logger.layerPrint("\t\t\t\tPoint locations invalid, discarded.")
-            return self.getCurve(closed=closed, start=start, end=end)
+        self.logger.layerPrint(f"\t\t\t\tOut of {budget}.")
+        raise GeometryException("No valid point locations found.")
+
+    def getBatchCurve(
+            self,
+            n: int,
+            closed=False,
+            start: Point = None,
+            end: Point = None) -> Curve:
+        """
+        Generate a random Curve from batches of candidate point sets.
+
+        Every batch draws batchSize point sets together with the connection
+        types, amplitudes and subdivisions of their connections using a
+        numpy generator seeded from the random module. Point sets with
+        adjacent points too close to each other are rejected for the whole
+        batch at once, and curves are built only from the remaining ones,
+        in order, until one is valid.
+
+        Args:
+            n (int): Number of random points
+            closed (bool, optional): Wether to close the curve. Defaults to False.
+            start (Point): Start of the ribbon. Defaults to None.
+            end (Point): End of the ribbon. Defaults to None.
+
+        Returns:
+            Curve: A random Curve
+
+        Raises:
+            Cancelled: If the token is cancelled
+            GeometryException: If no valid point set was found
+        """
+        # setting the state directly is much faster than seeding
+        self.rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {
+                "state": random.getrandbits(128),
+                "inc": random.getrandbits(128) | 1},
+            "has_uint32": 0,
+            "uinteger": 0}
+        m = self.batchSize
+        nPoints = n + (1 if start else 0) + (1 if end else 0)
+        nConnections = nPoints - 1
+
+        budget = self.pointBudget.start()
+        while not budget.exhausted():
+            self.token.check()
+            budget.use()
+            nCells = n if self.pointSampler is not None else 0
+            uniform = self.rng.random((m, 2 * n + nCells + 3 * nConnections))
+            points = numpy.empty((m, nPoints, 2))
+            first = 1 if start else 0
+            coordinates = uniform[:, :2 * n].reshape(m, n, 2)
+            cells = None
+            if self.pointSampler is not None:
+                cells = numpy.searchsorted(
+                    self.pointSampler.limits,
+                    uniform[:, 2 * n:2 * n + nCells],
+                    side="right")
+                grid = self.adaptiveGrid
+                coordinates = (numpy.stack(
+                    (cells % grid, cells // grid), axis=2) + coordinates) / grid
+            points[:, first:first + n] = \
+                (coordinates * 2 - 1) * (1 - edgePadding)
+            if start:
+                points[:, 0] = (start.x, start.y)
+            if end:
+                points[:, -1] = (end.x, end.y)
+            connections = uniform[:, 2 * n + nCells:].reshape(
+                m, 3, nConnections)
+            subDivs = numpy.searchsorted(
+                self.subDivLimits, connections[:, 0], side="right") + 1
+            curveTypes = numpy.searchsorted(
+                self.extensionTypeLimits, connections[:, 1], side="right") + 1
+            amplitudes = connections[:, 2]
+
+            distances = numpy.hypot(
+                *(points[:, 1:] - points[:, :-1]).transpose(2, 0, 1))
+            valid = (distances >= collisionThreshold).all(axis=1)
+            if closed:
+                valid &= numpy.hypot(
+                    *(points[:, -1] - points[:, 0]).T) >= collisionThreshold
+
+            for i in numpy.flatnonzero(valid):
+                curvePoints = [Point(x, y) for x, y in points[i].tolist()]
+                curve = Curve(curvePoints[0], closed=closed)
+                for point, curveType, subDiv, amplitude in zip(
+                        curvePoints[1:],
+                        curveTypes[i].tolist(),
+                        subDivs[i].tolist(),
+                        amplitudes[i].tolist()):
+                    self.connect(curve, point, curveType, subDiv, amplitude)
+                if self.isValid(curve):
+                    if cells is not None:
+                        self.lastCells = cells[i].tolist()
+                    return curve
+            self.logger.layerPrint("\t\t\t\tPoint locations invalid, batch discarded.")
+        self.logger.layerPrint(f"\t\t\t\tOut of {budget}.")
+        raise GeometryException("No valid point locations found.")
+
+    def getFallbackCurve(
+            self,
+            start: Point = None,
+            end: Point = None) -> Curve:
+        """
+        Get a straight open curve, used when no random curve could be
+        generated within the budgets. It needs no rounding.
+
+        Args:
+            start (Point): Start of the ribbon. Defaults to None.
+            end (Point): End of the ribbon. Defaults to None.
+
+        Returns:
+            Curve: A line from start, or a point left of the center, to end,
+            or a point right of the center
+        """
+        curve = Curve(start if start else Point(-0.5, 0))
+        curve.extend(curve.line(end if end else Point(0.5, 0), fallbackSubDivs))
         return curve
 
+    def cellPoint(self, cell: int, u: float, v: float) -> Point:
+        """
+        Get a point inside a cell of the adaptive sampling grid.
+
+        Args:
+            cell (int): Index of the cell, row by row from the bottom left
+            u (float): Position inside the cell along x between 0 and 1
+            v (float): Position inside the cell along y between 0 and 1
+
+        Returns:
+            Point: Point inside the padded unit square
+        """
+        grid = self.adaptiveGrid
+        x = (cell % grid + u) / grid
+        y = (cell // grid + v) / grid
+        return Point((x * 2 - 1) * (1 - edgePadding),
+                     (y * 2 - 1) * (1 - edgePadding))
+
+    @staticmethod
+    def isValid(curve: Curve) -> bool:
+        """
+        Remove duplicate points from a curve and check if enough points
+        remain.
+
+        Args:
+            curve (Curve): Curve to check
+
+        Returns:
+            bool: True if the curve has enough points
+        """
+        curve.removeDuplicates()
+        return len(curve.points) >= 2 and \
+            (len(curve.points) >= 3 or not curve.closed)
+
     def extend(self, curve: Curve, point: Point) -> None:
         """
         Extend the given curve to the given point using a random
@@ -100,18 +315,39 @@ class CurveGenerator:
         """
         subDivs = sampleFromDistribution(self.pdSubDivs)
         curveType = sampleFromDistribution(self.pdExtensionType)
+        amplitude = random.random() if curveType in (2, 3) else 0
+        self.connect(curve, point, curveType, subDivs, amplitude)
+
+    def connect(
+            self,
+            curve: Curve,
+            point: Point,
+            curveType: int,
+            subDivs: int,
+            amplitude: float) -> None:
+        """
+        Extend the given curve to the given point using the given
+        curve function.
+
+        Args:
+            curve (Curve): Curve to extend
+            point (Point): New endpoint
+            curveType (int): 1 for a line, 2 for an arc and 3 for a sine wave
+            subDivs (int): Number of points between the ends
+            amplitude (float): Amplitude between 0 and 1, scaled by the maximum amplitude of the curve type
+        """
         if curveType == 3:
             curve.extend(
                 curve.sine(
                     point,
                     subDivs=subDivs,
-                    amplitude=random.random() * self.maxAmpSine))
+                    amplitude=amplitude * self.maxAmpSine))
         elif curveType == 2:
             curve.extend(
                 curve.arc(
                     point,
                     subDivs=subDivs,
-                    amplitude=random.random() * self.maxAmpArc))
+                    amplitude=amplitude * self.maxAmpArc))
         elif curveType == 1:
             curve.extend(curve.line(point))
         else:
@@ -134,3 +370,18 @@ class CurveGenerator:
             points.append(randomPoint())
 
         return points
+
+
+def cumulativeLimits(distribution: List[float]):
+    """
+    Get the upper limits of the results of a distribution on the unit
+    interval, for sampling the distribution with uniform random numbers.
+
+    Args:
+        distribution (List[float]): Discrete distribution weights
+
+    Returns:
+        numpy array: Upper limit of every result except the last one
+    """
+    limits = numpy.cumsum(distribution) / sum(distribution)
+    return limits[:-1]
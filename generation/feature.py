@@ -1,10 +1,16 @@
 import random
+from typing import Tuple
+from common.cancellation import CancellationToken
 from common.settings import Settings
 from common.utility import Logger
+from generation import bank
+from generation.bank import FeatureBank
 from generation.ribbon import RibbonGenerator
 from geometry.point import Point
 from hierarchy.feature import Feature
-from generation.utility import check, sampleFromDistribution
+from hierarchy.pattern import Pattern
+from generation.utility import check, sampleFromDistribution, \
+    scaledDistribution
 
 
 class FeatureGenerator:
@@ -12,15 +18,21 @@ class FeatureGenerator:
     Generator for Feature objects
     """
 
-    def __init__(self, settings: Settings, logger: Logger) -> None:
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
         """
         Initialize the generator
 
         Args:
             settings (Settings): Settings object
+            token (CancellationToken, optional): Token that stops the generation. Defaults to one that is never cancelled.
         """
         self.logger = logger
-        self.ribbonGenerator = RibbonGenerator(settings, logger)
+        self.token = token if token is not None else CancellationToken()
+        self.ribbonGenerator = RibbonGenerator(settings, logger, self.token)
         self.pMirrorX = settings.getItem(
             "SimpleFeatures", "P_mirrorX", float)
         self.pMirrorY = settings.getItem(
@@ -29,11 +41,25 @@ class FeatureGenerator:
             "SimpleFeatures", "connectionOverridesMirror", bool)
         self.pdNRibbons = settings.getList(
             "SimpleFeatures", "PD_complexity", float)
+        self.freshRatio = settings.getItem("Bank", "freshRatio", float)
+        self.bank: FeatureBank = None
+        if settings.getBool("Bank", "useBank"):
+            if bank.numpy is None:
+                print("The feature bank needs numpy, features are generated.")
+            else:
+                self.bank = FeatureBank(
+                    "../" + settings.getItem("Bank", "bankFolder", str),
+                    settings.getItem("Bank", "connectionBuckets", int),
+                    self.connectionOverride)
+                self.bank.load()
+        # add the generated features to the bank, used when filling it
+        self.recording = False
 
     def getFeature(self,
                    leftConnection: float = None,
                    rightConnection: float = None,
-                   forceXMirror: bool = False) -> Feature:
+                   forceXMirror: bool = False,
+                   complexityScale: float = 1) -> Feature:
         """
         Generate a random Feature
 
@@ -41,12 +67,58 @@ class FeatureGenerator:
             leftConnection (float): If given, y coordinate of left connection
             rightConnection (float): If given, y coordinate of right connection
             forceXMirror (bool): if true, X will always be mirrored
+            complexityScale (float): Scale of the distribution of the number of ribbons. Defaults to 1.
 
         Returns:
             Feature: A random Feature
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        mirrorX, mirrorY = self.getMirrors(forceXMirror)
+        return self.buildFeature(
+            leftConnection,
+            rightConnection,
+            mirrorX,
+            mirrorY,
+            complexityScale)
+
+    def getMirrors(self, forceXMirror: bool = False) -> Tuple[bool, bool]:
+        """
+        Decide the mirroring of a Feature
+
+        Args:
+            forceXMirror (bool): if true, X will always be mirrored
+
+        Returns:
+            Tuple[bool, bool]: Mirror along x axis and mirror along y axis
         """
         mirrorX = check(self.pMirrorX) or forceXMirror
         mirrorY = check(self.pMirrorY)
+        return mirrorX, mirrorY
+
+    def buildFeature(self,
+                     leftConnection: float,
+                     rightConnection: float,
+                     mirrorX: bool,
+                     mirrorY: bool,
+                     complexityScale: float = 1) -> Feature:
+        """
+        Generate the ribbons of a Feature with decided mirroring
+
+        Args:
+            leftConnection (float): If given, y coordinate of left connection
+            rightConnection (float): If given, y coordinate of right connection
+            mirrorX (bool): Mirror along x axis, unless the connections override it
+            mirrorY (bool): Mirror along y axis
+            complexityScale (float): Scale of the distribution of the number of ribbons. Defaults to 1.
+
+        Returns:
+            Feature: A random Feature
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
 
         if leftConnection and (not rightConnection) and mirrorX:
             rightConnection = leftConnection
@@ -67,10 +139,12 @@ class FeatureGenerator:
 
         feature = Feature(mirrorY=mirrorY, mirrorX=mirrorX)
 
-        n = sampleFromDistribution(self.pdNRibbons)
+        n = sampleFromDistribution(
+            scaledDistribution(self.pdNRibbons, complexityScale))
         connectedLeft = random.choice(range(n))
         connectedRight = random.choice(range(n))
         for i in range(n):
+            self.token.check()
             start = None
             end = None
             if i == connectedLeft and leftConnection:
@@ -82,3 +156,73 @@ class FeatureGenerator:
             self.logger.layerPrint(f"\t\tDone.")
 
         return feature
+
+    def getFeaturePattern(self,
+                          leftConnection: float = None,
+                          rightConnection: float = None,
+                          forceXMirror: bool = False,
+                          complexityScale: float = 1) -> Pattern:
+        """
+        Get the pattern of a random Feature, drawn from the feature bank
+        when possible.
+
+        With a bank, a share of freshRatio of the features is generated
+        anyway, as are the features the bank has no match for. The bank
+        features were generated at full complexity.
+
+        Args:
+            leftConnection (float): If given, y coordinate of left connection
+            rightConnection (float): If given, y coordinate of right connection
+            forceXMirror (bool): if true, X will always be mirrored
+            complexityScale (float): Scale of the distribution of the number of ribbons. Defaults to 1.
+
+        Returns:
+            Pattern: Pattern of the Feature
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        if self.bank is None:
+            return self.getFeature(
+                leftConnection,
+                rightConnection,
+                forceXMirror,
+                complexityScale).getPattern()
+        mirrorX, mirrorY = self.getMirrors(forceXMirror)
+        key = self.bank.key(leftConnection, rightConnection, mirrorX, mirrorY)
+        if not self.recording and not check(self.freshRatio):
+            pattern = self.bank.draw(key)
+            if pattern is not None:
+                self.logger.layerPrint("\t\tDrawn from the feature bank.")
+                return pattern
+            self.logger.layerPrint("\t\tNo matching feature in the bank.")
+        pattern = self.buildFeature(
+            leftConnection,
+            rightConnection,
+            mirrorX,
+            mirrorY,
+            complexityScale).getPattern()
+        if self.recording:
+            self.bank.add(key, pattern)
+        return pattern
+
+    def snapConnection(self, y: float) -> float:
+        """
+        Round a connection to the center of its bank bucket, so that
+        features from the bank connect to it exactly.
+
+        Args:
+            y (float): Y coordinate of the connection, or None
+
+        Returns:
+            float: Rounded connection, or the connection as is without a bank
+        """
+        if self.bank is None:
+            return y
+        return self.bank.snap(y)
+
+    def close(self) -> None:
+        """
+        Stop the worker processes of the generator if they are running.
+        """
+        self.ribbonGenerator.close()
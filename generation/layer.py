@@ -1,32 +1,60 @@
+import multiprocessing
+import random
 from copy import deepcopy
 from math import ceil, floor
-from common.utility import multiplePair, Logger
+from typing import List, Tuple
+from common.cancellation import CancellationToken, Cancelled
+from common.utility import multiplePair, Logger, redirectPrints
 from geometry.point import Point
 from generation.feature import FeatureGenerator
-from generation.utility import check, sampleFromDistribution, randomCoordinate
+from generation.plan import LayerPlan
+from generation.utility import check, sampleFromDistribution, \
+    randomCoordinate, scaledDistribution
 from generation.pattern import randomComplexPattern
 from common.settings import Settings
 from hierarchy.curve import Curve
-from hierarchy.layer import Layer
+from hierarchy.layer import Layer, defaultSubDivs
 from hierarchy.pattern import Pattern
 from hierarchy.ribbon import Ribbon
 
+# Seconds between cancellation checks while waiting for features
+pollInterval = 0.05
+
+# Smallest number of subdivisions of a layer with reduced detail
+minSubDivs = 16
+
+# Feature generator of a worker process, set by initWorker
+workerGenerator: FeatureGenerator = None
+workerLogger: Logger = None
+
 
 class LayerGenerator:
     """
     Generator for Layer objects
     """
 
-    def __init__(self, settings: Settings, logger: Logger) -> None:
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
         """
         Initialize the generator
 
         Args:
             settings (Settings): Settings object
+            token (CancellationToken, optional): Token that stops the generation. Defaults to one that is never cancelled.
         """
         self.logger = logger
+        self.settings = settings
+        self.token = token if token is not None else CancellationToken()
         self.lastRepeats = 2
-        self.featureGenerator = FeatureGenerator(settings, logger)
+        # level of detail of the planned layers, lowered to meet a deadline
+        self.detail = 1
+        self.featureWorkers = settings.getItem(
+            "Program", "featureWorkers", int)
+        self.featurePool = None
+        self.featureGenerator = FeatureGenerator(settings, logger, self.token)
         self.repeatCoeff = settings.getItem(
             "Layers", "featureWidthCoeff", float)
         self.pDivider = settings.getItem(
@@ -57,7 +85,7 @@ class LayerGenerator:
         """
         repeats = self.lastRepeats
         optimalRepeats = int(6.28 * (radius) / width / 4) * 2
-        optimalRepeats = optimalRepeats / self.repeatCoeff
+        optimalRepeats = optimalRepeats / self.repeatCoeff * self.detail
 
         deviation = (self.lastRepeats - optimalRepeats) / optimalRepeats
         if deviation < 0:
@@ -67,24 +95,31 @@ class LayerGenerator:
         repeats = max(4, repeats)
         return repeats
 
-    def getLayer(
+    def planLayer(
             self,
+            index: int,
             radius: float,
-            width: float) -> Layer:
+            width: float) -> LayerPlan:
         """
-        Generate a random Layer
+        Decide the complexity, divider, repeats and subdivisions of a
+        layer, and update lastRepeats.
 
-        If repeats are not given, an optimal amount is calculated.
+        Below full detail, the complexity distributions, the optimal
+        number of repeats and the subdivisions are scaled by detail. This
+        does not change the random numbers drawn, only their results.
 
         Args:
+            index (int): Index of the layer, starting from 1
             radius (float): Radius of the layer
             width (float): Width of the layer
 
         Returns:
-            Layer: A random Layer
+            LayerPlan: Plan of the layer
         """
+        lastRepeats = self.lastRepeats
 
-        complexity = 2 * sampleFromDistribution(self.pdComplexity)
+        complexity = 2 * sampleFromDistribution(
+            scaledDistribution(self.pdComplexity, self.detail))
 
         divider = check(self.pDivider)
 
@@ -97,11 +132,62 @@ class LayerGenerator:
         self.lastRepeats = repeats
         repeats = ceil(max(4, int(repeats / complexity)) / 2) * 2
 
+        subDivs = defaultSubDivs(radius)
+        if self.detail != 1:
+            subDivs = max(minSubDivs, int(subDivs * self.detail))
+
+        return LayerPlan(
+            index=index,
+            radius=radius,
+            width=width,
+            complexity=complexity,
+            divider=divider,
+            repeats=repeats,
+            lastRepeats=lastRepeats,
+            nextLastRepeats=self.lastRepeats,
+            subDivs=subDivs,
+            complexityScale=self.detail)
+
+    def getLayer(
+            self,
+            radius: float,
+            width: float,
+            plan: LayerPlan = None) -> Layer:
+        """
+        Generate a random Layer
+
+        If no plan is given, the layer is planned first and lastRepeats is
+        updated. A given plan is followed without changing lastRepeats.
+
+        Args:
+            radius (float): Radius of the layer
+            width (float): Width of the layer
+            plan (LayerPlan, optional): Plan of the layer. Defaults to None.
+
+        Returns:
+            Layer: A random Layer
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        if plan is None:
+            plan = self.planLayer(0, radius=radius, width=width)
+
+        sampler = self.featureGenerator.ribbonGenerator.curveGenerator.pointSampler
+        if sampler is not None:
+            sampler.resetStatistics()
+
+        complexity = plan.complexity
+        divider = plan.divider
+        repeats = plan.repeats
+
+        # with a feature bank, connections are rounded to its buckets
+        snap = self.featureGenerator.snapConnection
         yEdge = None
         if check(self.pInterCont):
-            yEdge = randomCoordinate()
+            yEdge = snap(randomCoordinate())
         yInside = [
-            randomCoordinate() if check(
+            snap(randomCoordinate()) if check(
                 self.pIntraCont) else None for _ in range(
                 complexity - 1)]
         connections = [yEdge]
@@ -111,11 +197,16 @@ class LayerGenerator:
         resultPattern = Pattern()
 
         centerIndex = floor((complexity - 1) / 2)
-        center = self.featureGenerator.getFeature(
-            connections[centerIndex],
-            connections[centerIndex],
-            forceXMirror=True
-        ).getPattern()
+        # center feature first, then the surrounding features outwards
+        featureConnections = [
+            (connections[centerIndex], connections[centerIndex], True)]
+        featureConnections.extend(
+            (connections[i], connections[i - 1], False)
+            for i in range(centerIndex, 0, -1))
+        features = self.getFeaturePatterns(
+            featureConnections, plan.complexityScale)
+
+        center = features[0]
 
         patternWidth = 0
         if complexity % 2 != 0:
@@ -126,19 +217,15 @@ class LayerGenerator:
 
         resultPattern.combine(center)
 
-        i = centerIndex
-        while i > 0:
-            self.logger.layerPrint(f"\tGenerating Feature {centerIndex-i+1}/{centerIndex}...")
-            feature = self.featureGenerator.getFeature(
-                leftConnection=connections[i],
-                rightConnection=connections[i - 1]
-            )
-            self.logger.layerPrint("\tDone.")
+        for feature in features[1:]:
             self.logger.layerPrint("\tCombining into complex feature...")
-            surround(resultPattern, patternWidth, feature.getPattern())
+            surround(resultPattern, patternWidth, feature)
             self.logger.layerPrint("\tDone.")
             patternWidth += 4
-            i -= 1
+
+        self.logger.layerPrint("\tRemoving redundant lines from complex feature...")
+        removed = resultPattern.removeRedundancy()
+        self.logger.layerPrint(f"\tDone, removed {removed} lines.")
 
         self.logger.layerPrint("\tNormailizing complex feature...")
         resultPattern.offsetX(-complexity)
@@ -146,6 +233,7 @@ class LayerGenerator:
         resultPattern.scaleYToLimits()
         self.logger.layerPrint("\tDone.")
 
+        self.token.check()
         if divider:
             self.logger.layerPrint("\tGenerating divider...")
             dividerSpace = self.dividerWidth + self.dividerPadding * 2
@@ -163,15 +251,121 @@ class LayerGenerator:
             resultPattern.offsetY(dividerSpace / 2)
             resultPattern.combine(dividerRibbon.getPattern())
             self.logger.layerPrint("\tDone.")
+        self.logger.layerPrint("\tRemoving redundant lines from layer...")
+        removed = resultPattern.removeRedundancy()
+        self.logger.layerPrint(f"\tDone, removed {removed} lines.")
+        if sampler is not None:
+            self.logger.layerPrint(f"\tAdaptive sampling: {sampler.report()}")
         self.logger.layerPrint("\tCreatig Layer object...")
         l = Layer(
             radius=radius,
             width=width,
             pattern=resultPattern,
-            repeats=repeats)
+            repeats=repeats,
+            subDivs=plan.subDivs)
         self.logger.layerPrint("\tDone.")
         return l
 
+    def getFeaturePatterns(
+            self,
+            featureConnections: List[Tuple[float, float, bool]],
+            complexityScale: float = 1) -> List[Pattern]:
+        """
+        Generate the patterns of the features of a complex feature.
+
+        Every feature is generated from its own random stream, seeded from
+        the stream of the layer, so the features are the same whether they
+        are generated one after another or in parallel by the feature
+        workers. The stream of the layer continues after the seeds as if
+        the features had not been generated.
+
+        Worker processes of a process pool cannot start processes of their
+        own, so there the features are always generated one after another.
+
+        Args:
+            featureConnections (List[Tuple[float, float, bool]]): Left connection, right connection and forced x mirroring of every feature
+            complexityScale (float, optional): Scale of the complexity distribution of the features. Defaults to 1.
+
+        Returns:
+            List[Pattern]: Pattern of every feature
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        tasks = [
+            (random.getrandbits(64), left, right, forceXMirror, complexityScale)
+            for left, right, forceXMirror in featureConnections]
+        layerState = random.getstate()
+
+        if self.featureWorkers > 0 and len(tasks) > 1 and \
+                not multiprocessing.current_process().daemon:
+            self.logger.layerPrint(
+                f"\tGenerating {len(tasks)} features in parallel...")
+            patterns = self.receiveFeaturePatterns(tasks)
+            self.logger.layerPrint("\tDone.")
+        else:
+            patterns = []
+            for i, task in enumerate(tasks):
+                self.token.check()
+                self.logger.layerPrint(
+                    f"\tGenerating Feature {i+1}/{len(tasks)}...")
+                patterns.append(
+                    generateFeaturePattern(self.featureGenerator, *task))
+                self.logger.layerPrint("\tDone.")
+
+        random.setstate(layerState)
+        return patterns
+
+    def receiveFeaturePatterns(
+            self,
+            tasks: List[Tuple[int, float, float, bool, float]]) -> List[Pattern]:
+        """
+        Generate feature patterns in the pool of feature workers.
+
+        The pool is started on first use and kept for the next layers. It
+        is stopped if the token is cancelled, so that the workers do not
+        keep generating features nobody waits for.
+
+        Args:
+            tasks (List[Tuple[int, float, float, bool, float]]): Seed, left connection, right connection, forced x mirroring and complexity scale of every feature
+
+        Returns:
+            List[Pattern]: Pattern of every feature
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        if self.featurePool is None:
+            # forking a process with running threads can deadlock the child
+            context = multiprocessing.get_context("spawn")
+            self.featurePool = context.Pool(
+                self.featureWorkers,
+                initializer=initWorker,
+                initargs=(self.settings, self.logger.maxLayer))
+        result = self.featurePool.starmap_async(
+            generateWorkerFeature,
+            [(self.logger.layer,) + task for task in tasks])
+        try:
+            while True:
+                self.token.check()
+                try:
+                    return result.get(pollInterval)
+                except multiprocessing.TimeoutError:
+                    pass
+        except Cancelled:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """
+        Stop the feature and candidate workers if they are running.
+        """
+        if self.featurePool is not None:
+            self.featurePool.terminate()
+            self.featurePool.join()
+            self.featurePool = None
+        self.featureGenerator.close()
+
 
 def mirror(pattern: Pattern) -> None:
     """
@@ -212,3 +406,74 @@ def surround(center: Pattern, centerWidth: float, edges: Pattern) -> None:
 
     center.combine(leftMirror)
     center.combine(rightMirror)
+
+
+def generateFeaturePattern(
+        generator: FeatureGenerator,
+        seed: int,
+        leftConnection: float,
+        rightConnection: float,
+        forceXMirror: bool,
+        complexityScale: float = 1) -> Pattern:
+    """
+    Generate the pattern of a feature from its own random stream.
+
+    Args:
+        generator (FeatureGenerator): Generator to use
+        seed (int): Seed of the stream of the feature
+        leftConnection (float): Y coordinate of left connection, or None
+        rightConnection (float): Y coordinate of right connection, or None
+        forceXMirror (bool): If true, X will always be mirrored
+        complexityScale (float, optional): Scale of the distribution of the number of ribbons. Defaults to 1.
+
+    Returns:
+        Pattern: Pattern of the feature
+    """
+    random.seed(seed)
+    return generator.getFeaturePattern(
+        leftConnection=leftConnection,
+        rightConnection=rightConnection,
+        forceXMirror=forceXMirror,
+        complexityScale=complexityScale)
+
+
+def initWorker(settings: Settings, maxLayer: int) -> None:
+    """
+    Create the feature generator of a worker process.
+
+    Args:
+        settings (Settings): Settings object
+        maxLayer (int): Number of layers, for the log messages
+    """
+    global workerGenerator, workerLogger
+    redirectPrints(settings)
+    workerLogger = Logger()
+    workerLogger.setMaxLayer(maxLayer)
+    workerGenerator = FeatureGenerator(settings, workerLogger)
+
+
+def generateWorkerFeature(
+        layer: int,
+        seed: int,
+        leftConnection: float,
+        rightConnection: float,
+        forceXMirror: bool,
+        complexityScale: float = 1) -> Pattern:
+    """
+    Generate the pattern of a feature in a worker process.
+
+    Args:
+        layer (int): Index of the layer, for the log messages
+        seed (int): Seed of the stream of the feature
+        leftConnection (float): Y coordinate of left connection, or None
+        rightConnection (float): Y coordinate of right connection, or None
+        forceXMirror (bool): If true, X will always be mirrored
+        complexityScale (float, optional): Scale of the distribution of the number of ribbons. Defaults to 1.
+
+    Returns:
+        Pattern: Pattern of the feature
+    """
+    workerLogger.setLayer(layer)
+    return generateFeaturePattern(
+        workerGenerator, seed, leftConnection, rightConnection, forceXMirror,
+        complexityScale)
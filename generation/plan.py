@@ -0,0 +1,128 @@
+import random
+from typing import List, Tuple
+
+# Radius and width of the innermost layer
+firstRadius = 0.02
+firstWidth = 0.02
+# Growth of the layer width from one layer to the next
+widthGrowRate = 1.05
+
+
+class LayerPlan:
+    """
+    LayerPlan is everything decided about a layer before its geometry is
+    generated.
+
+    The only state carried from one layer to the next is the number of
+    repeats, so the plans of all layers are computed up front and every
+    layer can then be generated independently from its own plan.
+    """
+
+    def __init__(
+            self,
+            index: int,
+            radius: float,
+            width: float,
+            complexity: int,
+            divider: bool,
+            repeats: int,
+            lastRepeats: int,
+            nextLastRepeats: int,
+            subDivs: int = None,
+            complexityScale: float = 1) -> None:
+        """
+        Initialize the plan
+
+        Args:
+            index (int): Index of the layer, starting from 1
+            radius (float): Radius of the layer
+            width (float): Width of the layer
+            complexity (int): Number of features in the complex feature
+            divider (bool): Add a divider to the layer
+            repeats (int): Number of repeated patterns in the layer
+            lastRepeats (int): LayerGenerator.lastRepeats before the layer
+            nextLastRepeats (int): LayerGenerator.lastRepeats after the layer
+            subDivs (int, optional): Number of subdivisions of the circle of the layer. Defaults to the full detail.
+            complexityScale (float, optional): Scale of the complexity distributions of the features. Defaults to 1.
+        """
+        self.index = index
+        self.radius = radius
+        self.width = width
+        self.complexity = complexity
+        self.divider = divider
+        self.repeats = repeats
+        self.lastRepeats = lastRepeats
+        self.nextLastRepeats = nextLastRepeats
+        self.subDivs = subDivs
+        self.complexityScale = complexityScale
+        # state of the random module to generate the layer from
+        self.randomState: object = None
+
+
+def layerSizes(maxRadius: float) -> List[Tuple[float, float]]:
+    """
+    Get the radius and width of every layer, from the center until the
+    layers reach maxRadius.
+
+    Args:
+        maxRadius (float): Radius the outermost layer reaches
+
+    Returns:
+        List[Tuple[float, float]]: Radius and width of every layer
+    """
+    sizes: List[Tuple[float, float]] = []
+    r0 = firstRadius
+    wp = 0
+    r = r0
+    n = 1
+    while r < maxRadius:
+        w = firstWidth * widthGrowRate**n
+        r = r0 + wp + w
+        sizes.append((r, w))
+        r0 = r
+        wp = w
+        n += 1
+    return sizes
+
+
+def seedStream(seed: int, name: str) -> None:
+    """
+    Seed the random module with an independent stream derived from the
+    seed of the mandala.
+
+    The generators draw their numbers from the random module, so every
+    layer gets its own stream by seeding the module before the layer is
+    planned. The stream does not depend on anything generated before it.
+
+    Args:
+        seed (int): Seed of the mandala
+        name (str): Name of the stream
+    """
+    random.seed(f"{seed}:{name}")
+
+
+def planLayers(
+        generator,
+        seed: int,
+        sizes: List[Tuple[float, float]]) -> List[LayerPlan]:
+    """
+    Plan every layer in order.
+
+    Each plan is made from the stream of its layer, and the state of the
+    stream after planning is stored in the plan for generating the layer.
+
+    Args:
+        generator (LayerGenerator): Generator that plans the layers, its lastRepeats is updated
+        seed (int): Seed of the mandala
+        sizes (List[Tuple[float, float]]): Radius and width of every layer
+
+    Returns:
+        List[LayerPlan]: Plan of every layer
+    """
+    plans = []
+    for index, (r, w) in enumerate(sizes, 1):
+        seedStream(seed, f"layer{index}")
+        plan = generator.planLayer(index, radius=r, width=w)
+        plan.randomState = random.getstate()
+        plans.append(plan)
+    return plans
@@ -1,27 +1,49 @@
+import multiprocessing
 import random
-from math import pi
-from typing import List
+from math import hypot, inf, pi, sqrt
+from typing import List, Tuple
+from common.budget import Budget
+from common.cancellation import CancellationToken, Cancelled
 from common.settings import Settings
-from common.utility import clamp, gradient, Logger
+from common.utility import clamp, gradient, Logger, redirectPrints
 from geometry.point import Point
 from geometry.utility import avgPoint
-from hierarchy.curve import GeometryException
+from hierarchy.curve import Curve, GeometryException
+from hierarchy.pattern import Pattern
 from hierarchy.ribbon import Ribbon
 from generation.curve import CurveGenerator
 from generation.pattern import centerLine, randomLinePattern
 from generation.utility import check
 
+# Seconds between cancellation checks while waiting for candidates
+pollInterval = 0.05
+
+# Seed of the ribbons generated for learning the adaptive point proposals
+learningSeed = "adaptive sampling"
+
+# Ribbon generator of a worker process, set by initWorker
+workerGenerator: "RibbonGenerator" = None
+
+
 class RibbonGenerator:
 
     """
     Generator for Ribbon objects
     """
 
-    def __init__(self, settings: Settings, logger: Logger) -> None:
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
 
         self.logger = logger
 
-        self.curveGenerator = CurveGenerator(settings, logger)
+        self.settings = settings
+
+        self.token = token if token is not None else CancellationToken()
+
+        self.curveGenerator = CurveGenerator(settings, logger, self.token)
 
         self.fillScoreAreaCoeff = settings.getItem(
             "Ribbons",
@@ -63,6 +85,23 @@ class RibbonGenerator:
             "P_closed",
             float)
 
+        self.candidateWorkers = settings.getItem(
+            "Ribbons",
+            "candidateWorkers",
+            int)
+
+        self.candidatePool = None
+
+        self.learningCandidates = settings.getItem(
+            "Curves",
+            "adaptiveLearningCandidates",
+            int)
+
+        self.learningProposals = False
+        self.ribbonBudget = Budget(settings, "ribbon")
+        self.curveBudget = Budget(settings, "curve")
+        self.roundingBudget = Budget(settings, "rounding")
+
     def fillScore(self, ribbon: Ribbon) -> float:
         """
         Return a score describing how well a ribbon fills area
@@ -77,13 +116,13 @@ class RibbonGenerator:
         pattern = ribbon.getPattern()
         midpointsWeighted: List[(Point, float)] = []
         endpoints: List[Point] = []
-        for line in pattern.lines:
+        for p0, p1 in pattern.segments():
             midpointsWeighted.append(
                 (gradient(
-                    line.p0, line.p1, 0.5), line.p0.distanceTo(
-                    line.p1)))
-            endpoints.append(line.p0)
-            endpoints.append(line.p1)
+                    p0, p1, 0.5), p0.distanceTo(
+                    p1)))
+            endpoints.append(p0)
+            endpoints.append(p1)
         midpointAvg = avgPoint([mid for mid, _ in midpointsWeighted])
         weightedRadiusSum = sum(
             [midpointAvg.distanceTo(p) * w for p, w in midpointsWeighted])
@@ -92,6 +131,46 @@ class RibbonGenerator:
         return (4 / pi * avgRadius**2) * self.fillScoreAreaCoeff - \
             abs(midpointAvg.y) * self.fillScoreCentricCoeff
 
+    def fillScoreLimit(
+            self,
+            curve: Curve,
+            pattern: Pattern,
+            width: float) -> float:
+        """
+        Return an upper limit of the fill score of a ribbon, computed from
+        its rounded curve, pattern and width without creating the ribbon.
+
+        A rounded curve has no corner sharper than 90 degrees, so the Y
+        axis of a riblet is tilted at most 45 degrees, and every point of
+        the ribbon is within sqrt(2) times the largest pattern offset from
+        the curve. All midpoints and their average are inside the bounding
+        box of the curve points grown by that distance, so the average
+        radius is at most the diagonal of the box, and the average is at
+        least as far from the x axis as the box is.
+
+        Args:
+            curve (Curve): Rounded curve of the ribbon
+            pattern (Pattern): Pattern of the ribbon
+            width (float): Width of the ribbon before unCollideWidth
+
+        Returns:
+            float: Upper limit of the fill score
+        """
+        patternBox = pattern.getBox()
+        if patternBox is None:
+            return inf
+        offset = sqrt(2) * width * \
+            max(abs(patternBox.yMin), abs(patternBox.yMax))
+        points = curve.getPoints()
+        xs = [p.x for p in points]
+        ys = [p.y for p in points]
+        yMin = min(ys) - offset
+        yMax = max(ys) + offset
+        diagonal = hypot(max(xs) - min(xs) + 2 * offset, yMax - yMin)
+        yDistance = max(0, yMin, -yMax)
+        return (4 / pi * diagonal**2) * self.fillScoreAreaCoeff - \
+            yDistance * self.fillScoreCentricCoeff
+
     def getRibbon(
             self,
             start: Point = None,
@@ -101,51 +180,286 @@ class RibbonGenerator:
 
         If start or end are not given, they are random
 
+        Candidates are generated from their own random streams, seeded one
+        after another from the stream of the ribbon, until one of them
+        fills enough area. With candidateWorkers > 1, that many candidates
+        are evaluated at once in a process pool and the first acceptable
+        one in candidate order is taken, so the ribbon and the stream
+        after it are the same with any number of workers.
+
+        If the ribbon budget runs out first, the candidate with the best
+        fill score is used, and the stream continues after the last
+        candidate counted against the budget.
+
+        Worker processes of a process pool cannot start processes of their
+        own, so there the candidates are always evaluated one at a time.
+
         Args:
             start (Point): Start of the ribbon
             end (Point): End of the ribbon
 
         Returns:
             Ribbon: A random Ribbon
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        sampler = self.curveGenerator.pointSampler
+        if sampler is not None and sampler.learning and \
+                not self.learningProposals:
+            self.learnProposals()
+        batchSize = 1
+        if self.candidateWorkers > 1 and \
+                not multiprocessing.current_process().daemon:
+            batchSize = self.candidateWorkers
+        budget = self.ribbonBudget.start()
+        # built, fill score or its upper limit, seed and stream after the
+        # best candidate, and the candidate if it was built. Built
+        # candidates are preferred, their scores are exact.
+        best = None
+        while not budget.exhausted():
+            self.token.check()
+            seeds = []
+            states = []
+            # with adaptive sampling, a batch never continues past an update
+            # of the proposals, so the proposals of every candidate are the
+            # same as when the candidates are evaluated one at a time
+            size = min(batchSize, budget.remaining())
+            if sampler is not None:
+                size = min(size, sampler.remaining())
+            for _ in range(size):
+                seeds.append(random.getrandbits(64))
+                states.append(random.getstate())
+            if size > 1:
+                candidates = self.receiveCandidates(seeds, start, end)
+            else:
+                candidates = [self.getCandidate(seeds[0], start, end)]
+            random.setstate(states[-1])
+            for seed, state, (r, s, cells) in zip(seeds, states, candidates):
+                budget.use()
+                accepted = s > self.fillScoreThreshold
+                if sampler is not None:
+                    sampler.record(cells, accepted)
+                if accepted:
+                    random.setstate(state)
+                    return r
+                if r is not None:
+                    self.logger.layerPrint(f"\t\t\tFill score {s} < {self.fillScoreThreshold}, discarded.")
+                if best is None or (r is not None, s) > best[:2]:
+                    best = (r is not None, s, seed, state, r)
+                # a time limit can run out in the middle of a batch
+                if budget.exhausted():
+                    random.setstate(state)
+                    break
+        self.logger.layerPrint(f"\t\t\tOut of {budget}, using the best candidate.")
+        _, _, seed, state, r = best
+        if r is None:
+            r, _, _ = self.getCandidate(seed, start, end, prefilter=False)
+        random.setstate(state)
+        return r
+
+    def learnProposals(self) -> None:
+        """
+        Learn the proposals of the adaptive point sampler and freeze them.
+
+        Ribbons are generated from a stream with a fixed seed until enough
+        candidates have been recorded. The proposals depend only on the
+        settings, so every process learns the same proposals, and the
+        ribbons are the same with any number of worker processes. The
+        random stream of the caller is not affected.
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        sampler = self.curveGenerator.pointSampler
+        state = random.getstate()
+        random.seed(learningSeed)
+        sampler.reset()
+        sampler.resetStatistics()
+        self.learningProposals = True
+        self.logger.layerPrint("\t\t\tLearning adaptive curve point proposals...")
+        try:
+            while sampler.candidates < self.learningCandidates:
+                self.getRibbon()
+        finally:
+            self.learningProposals = False
+            random.setstate(state)
+        sampler.freeze()
+        self.logger.layerPrint(f"\t\t\tDone, {sampler.report()}")
+        sampler.resetStatistics()
+
+    def getCandidate(
+            self,
+            seed: int,
+            start: Point = None,
+            end: Point = None,
+            prefilter: bool = True) -> Tuple[Ribbon, float, List[int]]:
+        """
+        Generate a candidate Ribbon from its own random stream and
+        evaluate it.
+
+        The candidate is discarded before the ribbon is created if the
+        upper limit of its fill score does not pass the threshold. If no
+        valid curve is found within the curve budget, the candidate is
+        built on a straight line instead.
+
+        Args:
+            seed (int): Seed of the stream of the candidate
+            start (Point): Start of the ribbon
+            end (Point): End of the ribbon
+            prefilter (bool, optional): Discard the candidate early by the upper limit of its fill score. Defaults to True.
+
+        Returns:
+            Tuple[Ribbon, float, List[int]]: The candidate and its fill
+            score, or None and the upper limit of the fill score if it was
+            discarded early, and the adaptive sampling grid cells of its
+            random curve points
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
-        r = None
-        while(True):
-            closed = check(self.pClosed) and not (start or end)
-            curve = None
-            width = random.random() * self.maxWidth
-            self.logger.layerPrint("\t\t\tGenerating curve...")
-            while(True):
+        random.seed(seed)
+        closed = check(self.pClosed) and not (start or end)
+        curve = None
+        width = random.random() * self.maxWidth
+        self.logger.layerPrint("\t\t\tGenerating curve...")
+        budget = self.curveBudget.start()
+        while not budget.exhausted():
+            self.token.check()
+            budget.use()
+            try:
                 curve = self.curveGenerator.getCurve(
                     closed=closed, start=start, end=end)
-                try:
-                    curve.round()
-                except GeometryException:
-                    self.logger.layerPrint("\t\t\t\tNot roundable, discarded.")
-                    continue
-                break
-            self.logger.layerPrint("\t\t\tDone.")
-            pattern = randomLinePattern()
-            n = 1
-            taperLength = clamp(random.uniform(self.minTaperLength, self.maxTaperLength), 0, 0.5)
+                curve.round(budget=self.roundingBudget)
+            except GeometryException:
+                self.logger.layerPrint("\t\t\t\tNo valid or roundable curve, discarded.")
+                continue
+            break
+        else:
+            self.logger.layerPrint(f"\t\t\t\tOut of {budget}, using a straight line.")
+            closed = False
+            curve = self.curveGenerator.getFallbackCurve(start, end)
+        self.logger.layerPrint("\t\t\tDone.")
+        pattern = randomLinePattern()
+        n = 1
+        taperLength = clamp(random.uniform(self.minTaperLength, self.maxTaperLength), 0, 0.5)
+        limit = self.fillScoreLimit(curve, pattern, width)
+        if prefilter and limit <= self.fillScoreThreshold:
+            self.logger.layerPrint(f"\t\t\tFill score at most {limit} < {self.fillScoreThreshold}, discarded.")
+            return None, limit, self.curveGenerator.lastCells
+        r = Ribbon(
+            curve=curve,
+            pattern=pattern,
+            closed=closed,
+            taperLength=taperLength,
+            width=width,
+            n=n)
+        r.unCollideWidth()
+        if r.width < self.collapseWidth:
+            self.logger.layerPrint("\t\t\tPattern collapsed to a line.")
             r = Ribbon(
                 curve=curve,
-                pattern=pattern,
+                pattern=centerLine(),
                 closed=closed,
                 taperLength=taperLength,
-                width=width,
+                width=0,
                 n=n)
-            r.unCollideWidth()
-            if r.width < self.collapseWidth:
-                self.logger.layerPrint("\t\t\tPattern collapsed to a line.")
-                r = Ribbon(
-                    curve=curve,
-                    pattern=centerLine(),
-                    closed=closed,
-                    taperLength=taperLength,
-                    width=0,
-                    n=n)
-            s = self.fillScore(r)
-            if s > self.fillScoreThreshold:
-                break
-            self.logger.layerPrint(f"\t\t\tFill score {s} < {self.fillScoreThreshold}, discarded.")
-        return r
+        return r, self.fillScore(r), self.curveGenerator.lastCells
+
+    def receiveCandidates(
+            self,
+            seeds: List[int],
+            start: Point = None,
+            end: Point = None) -> List[Tuple[Ribbon, float, List[int]]]:
+        """
+        Generate and evaluate candidates in the pool of candidate workers.
+
+        The pool is started on first use and kept for the next ribbons. It
+        is stopped if the token is cancelled, so that the workers do not
+        keep generating candidates nobody waits for.
+
+        Args:
+            seeds (List[int]): Seed of every candidate
+            start (Point): Start of the ribbon
+            end (Point): End of the ribbon
+
+        Returns:
+            List[Tuple[Ribbon, float, List[int]]]: Every candidate as returned by getCandidate
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        if self.candidatePool is None:
+            # forking a process with running threads can deadlock the child
+            context = multiprocessing.get_context("spawn")
+            self.candidatePool = context.Pool(
+                self.candidateWorkers,
+                initializer=initWorker,
+                initargs=(self.settings, self.logger.maxLayer))
+        probabilities = None
+        if self.curveGenerator.pointSampler is not None:
+            probabilities = self.curveGenerator.pointSampler.probabilities
+        result = self.candidatePool.starmap_async(
+            generateWorkerCandidate,
+            [(self.logger.layer, probabilities, seed, start, end)
+             for seed in seeds])
+        try:
+            while True:
+                self.token.check()
+                try:
+                    return result.get(pollInterval)
+                except multiprocessing.TimeoutError:
+                    pass
+        except Cancelled:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """
+        Stop the candidate workers if they are running.
+        """
+        if self.candidatePool is not None:
+            self.candidatePool.terminate()
+            self.candidatePool.join()
+            self.candidatePool = None
+
+
+def initWorker(settings: Settings, maxLayer: int) -> None:
+    """
+    Create the ribbon generator of a worker process.
+
+    Args:
+        settings (Settings): Settings object
+        maxLayer (int): Number of layers, for the log messages
+    """
+    global workerGenerator
+    redirectPrints(settings)
+    logger = Logger()
+    logger.setMaxLayer(maxLayer)
+    workerGenerator = RibbonGenerator(settings, logger)
+
+
+def generateWorkerCandidate(
+        layer: int,
+        probabilities: List[float],
+        seed: int,
+        start: Point = None,
+        end: Point = None) -> Tuple[Ribbon, float, List[int]]:
+    """
+    Generate and evaluate a candidate Ribbon in a worker process.
+
+    Args:
+        layer (int): Index of the layer, for the log messages
+        probabilities (List[float]): Proposal probabilities of the adaptive point sampler, or None
+        seed (int): Seed of the stream of the candidate
+        start (Point): Start of the ribbon
+        end (Point): End of the ribbon
+
+    Returns:
+        Tuple[Ribbon, float, List[int]]: The candidate as returned by getCandidate
+    """
+    workerGenerator.logger.setLayer(layer)
+    if probabilities is not None:
+        workerGenerator.curveGenerator.pointSampler.setProbabilities(
+            probabilities)
+    return workerGenerator.getCandidate(seed, start, end)
@@ -46,6 +46,42 @@ def sampleFromDistribution(distribution: List[float]) -> int:
     return random.choices(population=choices, weights=distribution, k=1)[0]
 
 
+def scaledDistribution(
+        distribution: List[float],
+        scale: float) -> List[float]:
+    """
+    Scale a discrete distribution towards its first results.
+
+    The weight of result k is multiplied by scale to the power of k - 1,
+    so a scale below 1 makes the larger results less likely and a scale of
+    1 returns the distribution unchanged.
+
+    Args:
+        distribution (List[float]): Discrete distribution weights
+        scale (float): Scale between 0 and 1
+
+    Returns:
+        List[float]: Scaled distribution weights
+    """
+    if scale == 1:
+        return distribution
+    return [w * scale**k for k, w in enumerate(distribution)]
+
+
+def distributionMean(distribution: List[float]) -> float:
+    """
+    Return the expected result of a distribution
+
+    Args:
+        distribution (List[float]): Discrete distribution weights
+
+    Returns:
+        float: Expected result
+    """
+    return sum(k * w for k, w in enumerate(distribution, 1)) / \
+        sum(distribution)
+
+
 def randomCoordinate() -> float:
     """
     Return a random coordinate between -1 and 1
@@ -0,0 +1,202 @@
+from __future__ import annotations
+from typing import List, Tuple
+from geometry.point import Point
+
+# Region codes used in Cohen-Sutherland clipping
+inside = 0
+left = 1
+right = 2
+bottom = 4
+top = 8
+
+
+class Box:
+    """
+    An axis aligned bounding box
+    """
+
+    def __init__(
+            self,
+            xMin: float,
+            yMin: float,
+            xMax: float,
+            yMax: float) -> None:
+        """
+        Initialize the box
+
+        Args:
+            xMin (float): Smallest x coordinate
+            yMin (float): Smallest y coordinate
+            xMax (float): Largest x coordinate
+            yMax (float): Largest y coordinate
+        """
+        self.xMin = xMin
+        self.yMin = yMin
+        self.xMax = xMax
+        self.yMax = yMax
+
+    def __repr__(self) -> str:
+        return f"[({self.xMin:.2f},{self.yMin:.2f}),({self.xMax:.2f},{self.yMax:.2f})]"
+
+    @staticmethod
+    def fromPoints(points: List[Point]) -> Box:
+        """
+        Create the smallest box containing all given points
+
+        Args:
+            points (List[Point]): Points, at least one
+
+        Returns:
+            Box: Bounding box of the points
+        """
+        xs = [p.x for p in points]
+        ys = [p.y for p in points]
+        return Box(min(xs), min(ys), max(xs), max(ys))
+
+    def corners(self) -> List[Point]:
+        """
+        Get the corners of this box
+
+        Returns:
+            List[Point]: The four corners
+        """
+        return [Point(self.xMin, self.yMin),
+                Point(self.xMax, self.yMin),
+                Point(self.xMax, self.yMax),
+                Point(self.xMin, self.yMax)]
+
+    def union(self, other: Box) -> Box:
+        """
+        Return the smallest box containing this box and the other box
+
+        Args:
+            other (Box): Other box
+
+        Returns:
+            Box: Union box
+        """
+        return Box(min(self.xMin, other.xMin),
+                   min(self.yMin, other.yMin),
+                   max(self.xMax, other.xMax),
+                   max(self.yMax, other.yMax))
+
+    def intersects(self, other: Box) -> bool:
+        """
+        Return true if this box overlaps the other box
+
+        Args:
+            other (Box): Other box
+
+        Returns:
+            bool: True if the boxes overlap
+        """
+        return (self.xMin <= other.xMax and other.xMin <= self.xMax and
+                self.yMin <= other.yMax and other.yMin <= self.yMax)
+
+    def expanded(self, margin: float) -> Box:
+        """
+        Return a copy of this box grown by a margin on every side
+
+        Args:
+            margin (float): Margin to add
+
+        Returns:
+            Box: Expanded box
+        """
+        return Box(self.xMin - margin,
+                   self.yMin - margin,
+                   self.xMax + margin,
+                   self.yMax + margin)
+
+    def regionCode(self, p: Point) -> int:
+        """
+        Get the Cohen-Sutherland region code of a point
+
+        Args:
+            p (Point): Point
+
+        Returns:
+            int: Bitwise combination of left, right, bottom and top
+        """
+        code = inside
+        if p.x < self.xMin:
+            code |= left
+        elif p.x > self.xMax:
+            code |= right
+        if p.y < self.yMin:
+            code |= bottom
+        elif p.y > self.yMax:
+            code |= top
+        return code
+
+    def clip(self, p0: Point, p1: Point) -> Tuple[Point, Point]:
+        """
+        Clip the line p0-p1 to this box using the Cohen-Sutherland algorithm.
+
+        The given points are not modified.
+
+        Args:
+            p0 (Point): Start of the line
+            p1 (Point): End of the line
+
+        Returns:
+            Tuple[Point, Point]: Clipped line, or None if the line is
+            entirely outside the box
+        """
+        x0, y0, x1, y1 = p0.x, p0.y, p1.x, p1.y
+        code0 = self.regionCode(p0)
+        code1 = self.regionCode(p1)
+        while True:
+            if not (code0 | code1):
+                return (Point(x0, y0), Point(x1, y1))
+            if code0 & code1:
+                return None
+            code = code0 if code0 else code1
+            if code & top:
+                x = x0 + (x1 - x0) * (self.yMax - y0) / (y1 - y0)
+                y = self.yMax
+            elif code & bottom:
+                x = x0 + (x1 - x0) * (self.yMin - y0) / (y1 - y0)
+                y = self.yMin
+            elif code & right:
+                y = y0 + (y1 - y0) * (self.xMax - x0) / (x1 - x0)
+                x = self.xMax
+            else:
+                y = y0 + (y1 - y0) * (self.xMin - x0) / (x1 - x0)
+                x = self.xMin
+            if code == code0:
+                x0, y0 = x, y
+                code0 = self.regionCode(Point(x0, y0))
+            else:
+                x1, y1 = x, y
+                code1 = self.regionCode(Point(x1, y1))
+
+    def clipRun(self, points: List[Point]) -> List[List[Point]]:
+        """
+        Clip a run of connected points to this box.
+
+        Every line of the run is clipped separately, and the run is split
+        wherever it leaves the box.
+
+        Args:
+            points (List[Point]): Connected points
+
+        Returns:
+            List[List[Point]]: Runs inside the box
+        """
+        runs: List[List[Point]] = []
+        current: List[Point] = []
+        for i in range(len(points) - 1):
+            clipped = self.clip(points[i], points[i + 1])
+            if clipped is None:
+                continue
+            p0, p1 = clipped
+            if current and current[-1].x == p0.x and current[-1].y == p0.y:
+                current.append(p1)
+            else:
+                if len(current) > 1:
+                    runs.append(current)
+                current = [p0, p1]
+        if len(current) > 1:
+            runs.append(current)
+        return runs
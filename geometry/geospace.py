@@ -3,6 +3,7 @@ from multipledispatch import dispatch
 from copy import deepcopy
 import math
 from common.utility import clamp, gradient
+from geometry.box import Box
 from geometry.point import Point
 from geometry.line import Line
 from geometry.utility import Angle, convexAngle
@@ -75,6 +76,47 @@ class GeoSpace:
         pos_.y += self.origin.y
         return pos_
 
+    def getExternalBox(self, box: Box) -> Box:
+        """
+        Return an external box that contains every point of the local box
+        after the transformations.
+
+        The perspective shift is bounded using the largest y scale and the
+        largest tangent of the Y axis angle inside the box, so the result is
+        conservative but never too small.
+
+        Args:
+            box (Box): Local box
+
+        Returns:
+            Box: External bounding box
+        """
+        xs = sorted([box.xMin * self.scale[0], box.xMax * self.scale[0]])
+        ys = sorted([box.yMin * self.scale[1], box.yMax * self.scale[1]])
+        s0 = (box.xMin + 1) / 2
+        s1 = (box.xMax + 1) / 2
+        yScales = [gradient(self.startScale, self.endScale, s0),
+                   gradient(self.startScale, self.endScale, s1)]
+        shift = 0
+        if self.startAngle != 0 or self.endAngle != 0:
+            a0 = self.angleGradient(self.startAngle, self.endAngle, s0)
+            a1 = self.angleGradient(self.startAngle, self.endAngle, s1)
+            if min(a0, a1) <= -math.pi / 2 or max(a0, a1) >= math.pi / 2:
+                shift = 100
+            else:
+                maxTan = max(abs(math.tan(a0)), abs(math.tan(a1)))
+                maxY = max(abs(ys[0]), abs(ys[1]))
+                maxYScale = max(abs(yScales[0]), abs(yScales[1]))
+                shift = min(100, maxYScale * maxY * maxTan)
+        yValues = [y * yScale for y in ys for yScale in yScales]
+        corners = Box(xs[0] - shift,
+                      min(yValues),
+                      xs[1] + shift,
+                      max(yValues)).corners()
+        corners = [c.rotated(Point(0, 0), self.angle) + self.origin
+                   for c in corners]
+        return Box.fromPoints(corners)
+
     def applyPerspective(self, point: Point) -> None:
         """
         Apply a linear approximation of perspective transform
@@ -116,11 +158,7 @@ class GeoSpace:
         Args:
             pattern (Pattern): Pattern to transform
         """
-        points = set()
-        for line in pattern.lines:
-            points.add(line.p0)
-            points.add(line.p1)
-        for point in points:
+        for point in pattern.points():
             self.transform(point)
 
     @dispatch(Line)
@@ -189,6 +227,21 @@ class GeoSpaceStack:
             newPos = geoSpace.getExternalPos(newPos)
         return newPos
 
+    def getGlobalBox(self, box: Box) -> Box:
+        """
+        Apply the whole stack of geospaces to get a global bounding box
+
+        Args:
+            box (Box): Local box in the top most geospace
+
+        Returns:
+            Box: Global box containing the local box
+        """
+        newBox = box
+        for geoSpace in reversed(self.stack):
+            newBox = geoSpace.getExternalBox(newBox)
+        return newBox
+
 
 def geoSpaceBetween(p0: Point, p1: Point) -> GeoSpace:
     """
@@ -1,6 +1,6 @@
 from typing import List
 from geometry.point import Point
-from math import pi
+from math import asin, hypot, pi
 
 """
 Generally useful functions used in geometry
@@ -91,3 +91,164 @@ def cornerAngle(p1: Point, corner: Point, p2: Point) -> Angle:
         Angle: Sharp angle at the corner
     """
     return convexAngle(corner.angleTo(p1), corner.angleTo(p2))
+
+
+def pointLineDistance(p: Point, l0: Point, l1: Point) -> float:
+    """
+    Return the distance from a point to the line segment l0-l1
+
+    Args:
+        p (Point): Point
+        l0 (Point): Start of the segment
+        l1 (Point): End of the segment
+
+    Returns:
+        float: Distance from the point to the closest point of the segment
+    """
+    dx = l1.x - l0.x
+    dy = l1.y - l0.y
+    lengthSquared = dx * dx + dy * dy
+    if lengthSquared == 0:
+        return p.distanceTo(l0)
+    t = ((p.x - l0.x) * dx + (p.y - l0.y) * dy) / lengthSquared
+    t = min(max(t, 0), 1)
+    return hypot(l0.x + t * dx - p.x, l0.y + t * dy - p.y)
+
+
+class Sleeve:
+    """
+    Sleeve bounds the lines from a start point that pass within tolerance
+    of every added point, so a line can be checked against any number of
+    points in constant time.
+
+    A point further than tolerance from the start narrows the directions
+    of the allowed lines, and the lines have to reach at least as far as
+    the point, so the line never ends before passing it. Points closer
+    than tolerance are always within tolerance of the start of the line.
+    The bound is conservative, it may reject a line that passes close
+    enough to every point.
+    """
+
+    def __init__(self, start: Point, tolerance: float) -> None:
+        """
+        Initialize a sleeve without points
+
+        Args:
+            start (Point): Start of the lines
+            tolerance (float): Largest allowed distance from the points
+        """
+        self.start = start
+        self.tolerance = tolerance
+        # allowed directions relative to the direction of the first
+        # point further than tolerance
+        self.reference: Angle = None
+        self.low: Angle = -pi
+        self.high: Angle = pi
+        # smallest allowed length of the lines
+        self.reach = 0
+
+    def added(self, p: Point) -> "Sleeve":
+        """
+        Get a copy of the sleeve with a point added.
+
+        Args:
+            p (Point): Point the lines have to pass
+
+        Returns:
+            Sleeve: New sleeve
+        """
+        sleeve = Sleeve(self.start, self.tolerance)
+        sleeve.reference = self.reference
+        sleeve.low = self.low
+        sleeve.high = self.high
+        sleeve.reach = self.reach
+        distance = self.start.distanceTo(p)
+        if distance <= self.tolerance:
+            return sleeve
+        sleeve.reach = max(sleeve.reach, distance)
+        angle = self.start.angleTo(p)
+        if sleeve.reference is None:
+            sleeve.reference = angle
+        offset = wrap(angle - sleeve.reference)
+        width = asin(self.tolerance / distance)
+        sleeve.low = max(sleeve.low, offset - width)
+        sleeve.high = min(sleeve.high, offset + width)
+        return sleeve
+
+    def allows(self, end: Point) -> bool:
+        """
+        Check if the line from the start to a point passes within tolerance
+        of every added point.
+
+        Args:
+            end (Point): End of the line
+
+        Returns:
+            bool: True if the line is allowed
+        """
+        if self.reference is None:
+            return True
+        if self.start.distanceTo(end) < self.reach:
+            return False
+        offset = wrap(self.start.angleTo(end) - self.reference)
+        return self.low <= offset <= self.high
+
+
+def simplifyRun(
+        points: List[Point],
+        tolerance: float,
+        tinyLength: float = 1) -> List[Point]:
+    """
+    Drop and merge lines of a run of connected points that are too small
+    to be seen.
+
+    A point between two lines shorter than tinyLength, or closer than
+    tolerance to the previous kept point, is removed as long as no removed
+    point is further than tolerance from the resulting line. The removed
+    points are bounded by a Sleeve, so every point is checked once. Zero
+    length runs and runs shorter than tolerance are dropped entirely.
+
+    Args:
+        points (List[Point]): Connected points in the order they are drawn
+        tolerance (float): Largest allowed deviation and smallest kept length
+        tinyLength (float, optional): Length below which lines are merged. Defaults to 1.
+
+    Returns:
+        List[Point]: Simplified run, or None if nothing is left to draw
+    """
+    kept = [points[0]]
+    # points removed after the last kept point, and before it
+    removed: List[Point] = []
+    anchorRemoved: List[Point] = []
+    sleeve = Sleeve(kept[0], tolerance)
+    last = len(points) - 1
+    for i in range(1, len(points)):
+        p = points[i]
+        anchor = kept[-1]
+        if i < last:
+            nextPoint = points[i + 1]
+            tiny = points[i - 1].distanceTo(p) < tinyLength and \
+                p.distanceTo(nextPoint) < tinyLength
+            if tiny or anchor.distanceTo(p) < tolerance:
+                candidate = sleeve.added(p)
+                if candidate.allows(nextPoint):
+                    sleeve = candidate
+                    removed.append(p)
+                    continue
+        elif len(kept) > 1 and anchor.distanceTo(p) < tolerance and \
+                all(pointLineDistance(q, kept[-2], p) <= tolerance
+                    for q in anchorRemoved + [anchor] + removed):
+            # the last point replaces the kept point before it
+            kept[-1] = p
+            continue
+        kept.append(p)
+        anchorRemoved = removed
+        removed = []
+        sleeve = Sleeve(p, tolerance)
+    if len(kept) < 2:
+        return None
+    if len(kept) == 2:
+        length = kept[0].distanceTo(kept[1])
+        if length == 0 or length < tolerance:
+            return None
+    return kept
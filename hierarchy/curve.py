@@ -1,8 +1,8 @@
 from copy import deepcopy
 from math import atan, pi, sin, tan
 from typing import List, Tuple
+from common.budget import Budget
 from common.utility import clamp, gradient
-from geometry.line import Line
 from geometry.point import Point
 from geometry.geospace import GeoSpace, geoSpaceBetween
 from geometry.utility import cornerAngle
@@ -71,12 +71,11 @@ class Curve():
             Pattern: Pattern from points of this curve
         """
         result = Pattern()
-        for i in range(len(self.points) - 1):
-            p1 = self.points[i]
-            p2 = self.points[i + 1]
-            result.add(Line(p1, p2))
+        points = list(self.points)
         if self.closed:
-            result.add(Line(self.points[-1], self.points[0]))
+            points.append(self.points[0])
+        if len(points) > 1:
+            result.addRun(points)
         return result
 
     def sharpCorners(self, minAngle: float) -> List[int]:
@@ -117,7 +116,7 @@ class Curve():
 
         return result
 
-    def round(self, minAngle: float = pi / 2) -> None:
+    def round(self, minAngle: float = pi / 2, budget: Budget = None) -> None:
         """
         Remove sharp corners.
 
@@ -125,9 +124,19 @@ class Curve():
 
         Args:
             minAngle (float, optional): Minimum inner angle between adjacent lines. Defaults to pi/2.
+            budget (Budget, optional): Budget of rounding passes. Defaults to no limit.
+
+        Raises:
+            GeometryException: If the curve collapses or the budget runs out
         """
+        if budget is not None:
+            budget.start()
         pointsToRound = self.sharpCorners(minAngle)
         while pointsToRound:
+            if budget is not None:
+                if budget.exhausted():
+                    raise GeometryException(f"Out of {budget}.")
+                budget.use()
             rounds: List[Tuple[int, Tuple[Point, Point]]] = []
             for point in pointsToRound:
                 rounds.append([point, self.roundPoint(point)])
@@ -1,5 +1,6 @@
 from typing import List
-from system.display import Display
+from common.cancellation import CancellationToken
+from system.backend import Backend
 from geometry.point import Point
 from geometry.geospace import GeoSpace
 from hierarchy.ribbon import Ribbon
@@ -63,15 +64,22 @@ class Feature:
         for geospace in self.geoSpaces:
             self.ribbons.append(ribbon.reshaped(geospace))
 
-    def render(self, display: Display) -> None:
+    def render(
+            self,
+            display: Backend,
+            token: CancellationToken = None) -> None:
         """
         Render the Feature
 
         Args:
-            display (Display): Display to draw on
+            display (Backend): Backend to draw on
+            token (CancellationToken, optional): Token that stops the rendering. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
         for ribbon in self.ribbons:
-            ribbon.render(display)
+            ribbon.render(display, token)
 
     def getPattern(self) -> Pattern:
         """
@@ -82,6 +90,5 @@ class Feature:
         """
         result = Pattern()
         for ribbon in self.ribbons:
-            for line in ribbon.getPattern().lines:
-                result.add(line)
+            result.combine(ribbon.getPattern())
         return result
@@ -1,11 +1,27 @@
 
 from math import floor
+from typing import Iterator, List
+from common.cancellation import CancellationToken
+from geometry.box import Box
 from geometry.point import Point
 from hierarchy.pattern import Pattern
 from hierarchy.curve import Curve
 from hierarchy.ribbon import Ribbon
 
 
+def defaultSubDivs(radius: float) -> int:
+    """
+    Get the number of subdivisions of the circle of a layer at full detail.
+
+    Args:
+        radius (float): Radius of the centerline of the layer
+
+    Returns:
+        int: Number of subdivisions
+    """
+    return max(64, int(radius * 16 + 48))
+
+
 class Layer:
     """
     Layer is a circular ribbon centered at the origin.
@@ -16,7 +32,8 @@ class Layer:
             radius: float,
             width: float,
             pattern: Pattern,
-            repeats: int = None) -> None:
+            repeats: int = None,
+            subDivs: int = None) -> None:
         """
         Initialize the layer
 
@@ -25,12 +42,13 @@ class Layer:
             width (float): Width of the layer
             pattern (Pattern): Pattern of the layer
             repeats (int, optional): Number of repeated patterns in the layer. Defaults to None.
+            subDivs (int, optional): Number of subdivisions of the circle. Defaults to defaultSubDivs.
         """
 
         if repeats is None:
             repeats = int(4 + 16 * radius)
 
-        n = max(64, int(radius * 16 + 48))
+        n = subDivs if subDivs is not None else defaultSubDivs(radius)
         curve = Curve(Point(radius, 0), closed=True)
         curve.extend(curve.arc(Point(-radius, 0),
                                amplitude=1,
@@ -45,11 +63,40 @@ class Layer:
             n=repeats,
             width=width)
 
-    def render(self, display) -> None:
+    def bounds(self) -> Box:
+        """
+        Get a bounding box of the Layer
+
+        Returns:
+            Box: Bounding box
+        """
+        return self.ribbon.bounds()
+
+    def iterChunks(
+            self,
+            display=None,
+            chunkSize: int = 1000) -> Iterator[List[List[Point]]]:
+        """
+        Iterate over the lines of the Layer in chunks of bounded size.
+
+        Args:
+            display (Backend, optional): Backend used for culling. Defaults to None.
+            chunkSize (int, optional): Number of lines after which a chunk is yielded. Defaults to 1000.
+
+        Yields:
+            List[List[Point]]: Runs of connected points
+        """
+        return self.ribbon.iterChunks(display, chunkSize)
+
+    def render(self, display, token: CancellationToken = None) -> None:
         """
         Render the Layer
 
         Args:
-            display (Display): Display to draw on
+            display (Backend): Backend to draw on
+            token (CancellationToken, optional): Token that stops the rendering. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
-        return self.ribbon.render(display)
+        return self.ribbon.render(display, token)
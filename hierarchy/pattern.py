@@ -1,35 +1,108 @@
 from __future__ import annotations
-from typing import List
+from math import atan2, cos, floor, hypot, pi, sin
+from typing import Dict, Iterator, List, Tuple
+from geometry.box import Box
 from geometry.point import Point
 from geometry.line import Line
-from copy import deepcopy
+
+# Largest distance from a common line at which lines are considered collinear
+collinearThreshold = 0.001
+# Cell sizes of the spatial hash used for finding collinear lines
+hashAngleCell = 0.01
+hashOffsetCell = 0.01
 
 
 class Pattern:
     """
-    Pattern is a collection of lines
+    Pattern is a collection of lines.
+
+    The lines are stored as runs of connected points. A run of n points
+    describes n - 1 lines, so every point shared by two connected lines is
+    stored, transformed and drawn only once.
     """
 
     def __init__(self) -> None:
         """
         Initialize the pattern
         """
-        self.lines: List[Line] = []
+        self.runs: List[List[Point]] = []
         self.xMin = 0
         self.xMax = 0
         self.yMin = 0
         self.yMax = 0
 
+    @property
+    def lines(self) -> List[Line]:
+        """
+        Lines of this pattern as separate copies.
+
+        Modifying the returned lines does not change the pattern.
+
+        Returns:
+            List[Line]: Lines of this pattern
+        """
+        return [Line(p0, p1) for p0, p1 in self.segments()]
+
+    def segments(self) -> Iterator[Tuple[Point, Point]]:
+        """
+        Iterate over the lines of this pattern without copying them.
+
+        Yields:
+            Tuple[Point, Point]: Start and end point of a line
+        """
+        for run in self.runs:
+            for i in range(len(run) - 1):
+                yield run[i], run[i + 1]
+
+    def points(self) -> Iterator[Point]:
+        """
+        Iterate over all stored points of this pattern.
+
+        Yields:
+            Point: A point of this pattern
+        """
+        for run in self.runs:
+            yield from run
+
+    def lineCount(self) -> int:
+        """
+        Return the number of lines in this pattern.
+
+        Returns:
+            int: Number of lines
+        """
+        return sum(len(run) - 1 for run in self.runs)
+
     def add(self, line: Line) -> None:
         """
         Add a Line into this pattern.
 
+        If the line starts where the previous line ended, it continues
+        the last run.
+
         Args:
             line (Line): Line to add
         """
-        self.lines.append(deepcopy(line))
-        self.updateLimits(line.p0)
-        self.updateLimits(line.p1)
+        self.addRun([line.p0, line.p1])
+
+    def addRun(self, points: List[Point]) -> None:
+        """
+        Add a run of connected points into this pattern.
+
+        If the run starts where the previous run ended, the runs are joined.
+
+        Args:
+            points (List[Point]): At least two points
+        """
+        copies = [Point(p.x, p.y) for p in points]
+        for p in copies:
+            self.updateLimits(p)
+        if self.runs:
+            end = self.runs[-1][-1]
+            if end.x == copies[0].x and end.y == copies[0].y:
+                self.runs[-1].extend(copies[1:])
+                return
+        self.runs.append(copies)
 
     def combine(self, other: Pattern) -> None:
         """
@@ -38,8 +111,8 @@ class Pattern:
         Args:
             other (Pattern): Other pattern to combine into this
         """
-        for line in other.lines:
-            self.add(deepcopy(line))
+        for run in other.runs:
+            self.addRun(run)
 
     def updateLimits(self, point: Point = None) -> None:
         """
@@ -55,15 +128,28 @@ class Pattern:
             self.xMin = 0
             self.yMax = 0
             self.yMin = 0
-            for line in self.lines:
-                self.updateLimits(line.p0)
-                self.updateLimits(line.p1)
+            for p in self.points():
+                self.updateLimits(p)
         else:
             self.xMax = max(self.xMax, point.x)
             self.xMin = min(self.xMin, point.x)
             self.yMax = max(self.yMax, point.y)
             self.yMin = min(self.yMin, point.y)
 
+    def getBox(self) -> Box:
+        """
+        Return the bounding box of the lines in this pattern.
+
+        Unlike the x and y limits, the box does not necessarily contain
+        the origin.
+
+        Returns:
+            Box: Bounding box, or None if the pattern is empty
+        """
+        if not self.runs:
+            return None
+        return Box.fromPoints(list(self.points()))
+
     def getWidth(self) -> float:
         """
         Return the width of the pattern along the x axis.
@@ -103,9 +189,8 @@ class Pattern:
         Args:
             deltaX (float): Amount to offset
         """
-        for l in self.lines:
-            l.p0.x += deltaX
-            l.p1.x += deltaX
+        for p in self.points():
+            p.x += deltaX
 
     def offsetY(self, deltaY: float) -> None:
         """
@@ -114,9 +199,8 @@ class Pattern:
         Args:
             deltaX (float): Amount to offset
         """
-        for l in self.lines:
-            l.p0.y += deltaY
-            l.p1.y += deltaY
+        for p in self.points():
+            p.y += deltaY
 
     def scaleX(self, scaleX: float) -> None:
         """
@@ -125,9 +209,8 @@ class Pattern:
         Args:
             scaleX (float): Amount to scale
         """
-        for l in self.lines:
-            l.p0.x *= scaleX
-            l.p1.x *= scaleX
+        for p in self.points():
+            p.x *= scaleX
 
     def scaleY(self, scaleY: float) -> None:
         """
@@ -136,9 +219,8 @@ class Pattern:
         Args:
             scaleX (float): Amount to scale
         """
-        for l in self.lines:
-            l.p0.y *= scaleY
-            l.p1.y *= scaleY
+        for p in self.points():
+            p.y *= scaleY
 
     def repeat(self, n: int) -> None:
         """
@@ -150,16 +232,120 @@ class Pattern:
             n (int): Number of copies
         """
         width = 2
-        newSet = Pattern()
-        for i in range(n - 1):
-            offset = width * (i + 1)
-            for line in self.lines:
-                newLine = deepcopy(line)
-                newLine.p0.x += offset
-                newLine.p1.x += offset
-                newSet.add(newLine)
-        for newLine in newSet.lines:
-            self.add(newLine)
+        runs = self.runs
+        self.runs = []
+        for i in range(n):
+            offset = width * i
+            for run in runs:
+                self.addRun([Point(p.x + offset, p.y) for p in run])
+
+    def removeRedundancy(self, tolerance: float = collinearThreshold) -> int:
+        """
+        Remove duplicate and overlapping lines and fuse collinear neighbours.
+
+        Lines are grouped by the infinite line they lie on using a spatial
+        hash of the line angle and offset from the origin. Overlapping or
+        touching lines of a group are fused into one line. Lines that are
+        not fused keep their direction, and the order of the lines is kept
+        as far as possible. Lines of zero length are removed, and lines no
+        longer than tolerance are kept as they are, since their direction
+        is not reliable.
+
+        Args:
+            tolerance (float, optional): Largest distance of an endpoint from the common line. Defaults to collinearThreshold.
+
+        Returns:
+            int: Number of removed lines
+        """
+        angleCells = floor(pi / hashAngleCell) + 1
+        # group: angle, offset, members as (tMin, tMax, pMin, pMax, index)
+        groups: List[Tuple[float, float, List]] = []
+        grid: Dict[Tuple[int, int], List[int]] = {}
+
+        lines = [Line(p0, p1) for p0, p1 in self.segments()]
+        result: List[Tuple[int, Line]] = []
+        for index, line in enumerate(lines):
+            dx = line.p1.x - line.p0.x
+            dy = line.p1.y - line.p0.y
+            length = hypot(dx, dy)
+            if length == 0:
+                continue
+            if length <= tolerance:
+                # too short for a reliable direction, kept as it is so the
+                # run stays connected
+                result.append((index, line))
+                continue
+            angle = atan2(dy, dx) % pi
+            offset = -sin(angle) * line.p0.x + cos(angle) * line.p0.y
+            angleCell = floor(angle / hashAngleCell)
+
+            match = None
+            for deltaA in (-1, 0, 1):
+                cell = angleCell + deltaA
+                sign = 1
+                if cell < 0 or cell >= angleCells:
+                    # angles wrap around at pi, which flips the offset
+                    cell %= angleCells
+                    sign = -1
+                offsetCell = floor(sign * offset / hashOffsetCell)
+                for deltaO in (-1, 0, 1):
+                    for groupIndex in grid.get((cell, offsetCell + deltaO), []):
+                        gAngle, gOffset, _ = groups[groupIndex]
+                        s = sin(gAngle)
+                        c = cos(gAngle)
+                        if abs(-s * line.p0.x + c * line.p0.y - gOffset) <= tolerance and \
+                                abs(-s * line.p1.x + c * line.p1.y - gOffset) <= tolerance:
+                            match = groupIndex
+                            break
+                    if match is not None:
+                        break
+                if match is not None:
+                    break
+
+            if match is None:
+                match = len(groups)
+                groups.append((angle, offset, []))
+                key = (angleCell, floor(offset / hashOffsetCell))
+                grid.setdefault(key, []).append(match)
+
+            gAngle, _, members = groups[match]
+            t0 = cos(gAngle) * line.p0.x + sin(gAngle) * line.p0.y
+            t1 = cos(gAngle) * line.p1.x + sin(gAngle) * line.p1.y
+            if t0 <= t1:
+                members.append((t0, t1, line.p0, line.p1, index))
+            else:
+                members.append((t1, t0, line.p1, line.p0, index))
+
+        for _, _, members in groups:
+            members.sort(key=lambda m: m[0])
+            tMin, tMax, pMin, pMax, index = members[0]
+            fused = 1
+            for m in members[1:]:
+                if m[0] <= tMax + tolerance:
+                    if m[1] > tMax:
+                        tMax = m[1]
+                        pMax = m[3]
+                    index = min(index, m[4])
+                    fused += 1
+                    continue
+                if fused == 1:
+                    result.append((index, lines[index]))
+                else:
+                    result.append((index, Line(pMin, pMax)))
+                tMin, tMax, pMin, pMax, index = m
+                fused = 1
+            if fused == 1:
+                result.append((index, lines[index]))
+            else:
+                result.append((index, Line(pMin, pMax)))
+
+        removed = len(lines) - len(result)
+        result.sort(key=lambda r: r[0])
+        self.runs = []
+        for _, line in result:
+            self.add(line)
+        self.updateLimits()
+        return removed
 
     def __repr__(self) -> str:
-        return self.lines.__repr__()
+        return self.runs.__repr__()
@@ -1,16 +1,18 @@
 from __future__ import annotations
 from copy import deepcopy
-from math import floor
-from typing import List
+from math import ceil, floor
+from typing import Iterable, Iterator, List, Tuple
+from common.cancellation import CancellationToken
 from common.utility import clamp, gradient
 from geometry.utility import convexAngle
+from geometry.box import Box
 from geometry.point import Point
 from geometry.line import Line
 from geometry.geospace import GeoSpace
 from hierarchy.pattern import Pattern
 from hierarchy.curve import Curve
 from hierarchy.riblet import Riblet
-from system.display import Display
+from system.backend import Backend
 
 
 class Ribbon():
@@ -45,7 +47,9 @@ class Ribbon():
         self.taperLength = taperLength
         self.n = n
 
-        self.riblets: List[Riblet] = []
+        self.geoSpaces: List[GeoSpace] = []
+        self.sliceLimits: List[Tuple[float, float, bool]] = []
+        self.box: Box = None
 
         points = curve.getPoints()
         self.taperLengthIndex = floor(taperLength * (len(points) - 1))
@@ -56,13 +60,17 @@ class Ribbon():
 
         self.length = self.curve.length()
 
-        widthPerPattern = self.length / n
-        patternScale = widthPerPattern / 2
+        self.widthPerPattern = self.length / n
+        self.patternScale = self.widthPerPattern / 2
 
-        tempPattern = deepcopy(self.pattern)
-        tempPattern.repeat(n + 2)
-        tempPattern.offsetX(-1)
-        tempPattern.scaleX(patternScale)
+        # every riblet slice is normalized to stretch from x=-1 to x=1
+        patternBox = pattern.getBox()
+        self.patternBox = patternBox
+        self.runLimits = [(min(p.x for p in run), max(p.x for p in run))
+                          for run in pattern.runs]
+        self.sliceBox: Box = None
+        if patternBox is not None:
+            self.sliceBox = Box(-1, patternBox.yMin, 1, patternBox.yMax)
 
         x0 = 0
         x1 = 0
@@ -87,20 +95,87 @@ class Ribbon():
 
             x1 += p2.distanceTo(p3)
 
-            self.riblets.append(
-                Riblet(
-                    self.createGeoSpace(
-                        p1=p1,
-                        p2=p2,
-                        p3=p3,
-                        p4=p4,
-                        startTaper=startTaper,
-                        endTaper=endTaper,
-                        yScale=width),
-                    self.slicePattern(x0, x1, tempPattern)))
+            self.geoSpaces.append(
+                self.createGeoSpace(
+                    p1=p1,
+                    p2=p2,
+                    p3=p3,
+                    p4=p4,
+                    startTaper=startTaper,
+                    endTaper=endTaper,
+                    yScale=width))
+            self.sliceLimits.append(
+                (x0, x1, not closed and i == len(points) - 2))
 
             x0 = x1
 
+    def riblet(self, index: int) -> Riblet:
+        """
+        Create the Riblet at the given index.
+
+        Riblets are not stored, their patterns are sliced when needed.
+
+        Args:
+            index (int): Index of the riblet
+
+        Returns:
+            Riblet: Riblet at the index
+        """
+        x0, x1, includeEnd = self.sliceLimits[index]
+        return Riblet(
+            self.geoSpaces[index],
+            self.slicePattern(
+                x0,
+                x1,
+                self.repeatedSegments(x0, x1),
+                includeEnd=includeEnd))
+
+    def iterRiblets(self) -> Iterator[Riblet]:
+        """
+        Iterate over the riblets of this Ribbon, creating one at a time.
+
+        Yields:
+            Riblet: Next riblet
+        """
+        for index in range(len(self.geoSpaces)):
+            yield self.riblet(index)
+
+    def repeatedSegments(
+            self,
+            x0: float,
+            x1: float) -> Iterator[Tuple[Point, Point]]:
+        """
+        Iterate over the lines of the repeated pattern that can reach the
+        range from x0 to x1 along the ribbon.
+
+        Copy k of the pattern is offset by 2k-1 and scaled to the ribbon, so
+        the copies 0...n+1 cover the ribbon and one pattern width past
+        both of its ends. Only the runs of the copies overlapping the range
+        are used.
+
+        Args:
+            x0 (float): Lower x limit
+            x1 (float): Higher x limit
+
+        Yields:
+            Tuple[Point, Point]: Start and end point of a line in the
+            coordinates of the ribbon
+        """
+        if self.patternBox is None:
+            return
+        first = floor((x0 / self.patternScale - self.patternBox.xMax + 1) / 2)
+        last = ceil((x1 / self.patternScale - self.patternBox.xMin + 1) / 2)
+        for k in range(max(0, first), min(self.n + 1, last) + 1):
+            offset = 2 * k
+            for run, (runMin, runMax) in zip(self.pattern.runs, self.runLimits):
+                if (runMin + offset - 1) * self.patternScale > x1 or \
+                        (runMax + offset - 1) * self.patternScale < x0:
+                    continue
+                points = [Point((p.x + offset - 1) * self.patternScale, p.y)
+                          for p in run]
+                for i in range(len(points) - 1):
+                    yield points[i], points[i + 1]
+
     def taperScale(self, index: int) -> float:
         """
         Get taper scale for a Point at the given index.
@@ -154,24 +229,30 @@ class Ribbon():
             self,
             x0: float,
             x1: float,
-            pattern: Pattern) -> Pattern:
+            segments: Iterable[Tuple[Point, Point]],
+            includeEnd: bool = True) -> Pattern:
         """
-        Return a slice of a given pattern. The slice will be normalized to stretch from
+        Return a slice of the given lines. The slice will be normalized to stretch from
         x=-1 to x=1.
 
+        Vertical lines exactly at x1 also belong to the next slice, so they
+        are left out unless includeEnd is True. This way adjacent slices
+        never draw the same line twice.
+
         Args:
             x0 (float): Lower x limit
             x1 (float): Higher x limit
-            pattern (Pattern): Pattern to slice
+            segments (Iterable[Tuple[Point, Point]]): Lines to slice
+            includeEnd (bool, optional): Include vertical lines at x1. Defaults to True.
 
         Returns:
             Pattern: Normalized pattern slice from x0 to x1
         """
         result = Pattern()
-        for line in pattern.lines:
+        for p0, p1 in segments:
 
-            lx0 = line.p0.x
-            lx1 = line.p1.x
+            lx0 = p0.x
+            lx1 = p1.x
 
             left = min(lx0, lx1)
             right = max(lx0, lx1)
@@ -179,26 +260,29 @@ class Ribbon():
             if (right == x0 and left < right) or (left == x1 and left < right):
                 # only one point at the limit
                 continue
+            if left == x1 and right == x1 and not includeEnd:
+                # vertical line at the limit, belongs to the next slice
+                continue
             if (lx0 < x0 and lx1 < x0) or (lx0 > x1 and lx1 > x1):
                 # entire line outside limits
                 continue
             if ((lx0 >= x0 and lx1 >= x0) and (lx0 <= x1 and lx1 <= x1)):
                 # entire line inside limits
-                result.add(deepcopy(line))
+                result.addRun([p0, p1])
                 continue
 
             leftP = Point(0, 0)
             rightP = Point(0, 0)
             if left == lx0:
-                leftP.x = line.p0.x
-                leftP.y = line.p0.y
-                rightP.x = line.p1.x
-                rightP.y = line.p1.y
+                leftP.x = p0.x
+                leftP.y = p0.y
+                rightP.x = p1.x
+                rightP.y = p1.y
             else:
-                leftP.x = line.p1.x
-                leftP.y = line.p1.y
-                rightP.x = line.p0.x
-                rightP.y = line.p0.y
+                leftP.x = p1.x
+                leftP.y = p1.y
+                rightP.x = p0.x
+                rightP.y = p0.y
 
             if (lx0 <= x0 and lx1 >= x1) or (lx1 <= x0 and lx0 >= x1):
                 # both points outside limits but line crosses the area
@@ -298,24 +382,109 @@ class Ribbon():
         ovelap in tight corners.
         """
         collisionWidth = self.width
-        for riblet in self.riblets:
-            collision = riblet.collisionHeight()
+        for geoSpace in self.geoSpaces:
+            collision = Riblet.geoSpaceCollisionHeight(geoSpace)
             if collision != 0:
                 collisionWidth = min(collisionWidth, abs(collision))
         if collisionWidth != self.width:
-            for riblet in self.riblets:
-                riblet.geoSpace.scale[1] = collisionWidth
+            for geoSpace in self.geoSpaces:
+                geoSpace.scale[1] = collisionWidth
             self.width = collisionWidth
+            self.box = None
 
-    def render(self, display: Display) -> None:
+    def sliceBounds(self, index: int) -> Box:
+        """
+        Get a bounding box of the riblet at the given index without
+        slicing its pattern.
+
+        Args:
+            index (int): Index of the riblet
+
+        Returns:
+            Box: Bounding box in the coordinate space of the parent, or None
+            if the pattern is empty
+        """
+        if self.sliceBox is None:
+            return None
+        return self.geoSpaces[index].getExternalBox(self.sliceBox)
+
+    def bounds(self) -> Box:
+        """
+        Get a bounding box of this Ribbon
+
+        Returns:
+            Box: Union of the bounding boxes of the riblets, or None if
+            there is nothing to draw
+        """
+        if self.box is None:
+            for index in range(len(self.geoSpaces)):
+                ribletBox = self.sliceBounds(index)
+                if ribletBox is None:
+                    continue
+                if self.box is None:
+                    self.box = ribletBox
+                else:
+                    self.box = self.box.union(ribletBox)
+        return self.box
+
+    def iterChunks(
+            self,
+            display: Backend = None,
+            chunkSize: int = 1000) -> Iterator[List[List[Point]]]:
+        """
+        Iterate over the lines of this Ribbon in chunks.
+
+        Riblets are created one at a time and released after their runs
+        are yielded, so only one riblet and one chunk are kept in memory.
+        If a display is given, riblets it can not show are skipped before
+        their patterns are sliced.
+
+        Args:
+            display (Backend, optional): Backend used for culling. Defaults to None.
+            chunkSize (int, optional): Number of lines after which a chunk is yielded. Defaults to 1000.
+
+        Yields:
+            List[List[Point]]: Runs of connected points in the coordinate
+            space of the parent
+        """
+        if display is not None and not display.isVisible(self.bounds()):
+            return
+        chunk: List[List[Point]] = []
+        lines = 0
+        for index in range(len(self.geoSpaces)):
+            if display is not None and \
+                    not display.isVisible(self.sliceBounds(index)):
+                continue
+            for run in self.riblet(index).iterRuns(display):
+                chunk.append(run)
+                lines += len(run) - 1
+                if lines >= chunkSize:
+                    yield chunk
+                    chunk = []
+                    lines = 0
+        if chunk:
+            yield chunk
+
+    def render(
+            self,
+            display: Backend,
+            token: CancellationToken = None) -> None:
         """
         Render the Ribbon
 
+        The token is checked before every chunk is drawn.
+
         Args:
-            display (Display): Display to draw on
+            display (Backend): Backend to draw on
+            token (CancellationToken, optional): Token that stops the rendering. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
-        for riblet in self.riblets:
-            riblet.render(display)
+        for chunk in self.iterChunks(display, display.chunkSize):
+            if token is not None:
+                token.check()
+            display.drawChunk(chunk)
 
     def getPattern(self) -> Pattern:
         """
@@ -325,7 +494,7 @@ class Ribbon():
             Pattern: Pattern from this Ribbon
         """
         result = Pattern()
-        for riblet in self.riblets:
-            for line in riblet.getPattern().lines:
-                result.add(line)
+        for chunk in self.iterChunks():
+            for run in chunk:
+                result.addRun(run)
         return result
@@ -1,6 +1,8 @@
-from system.display import Display
+from typing import Iterator, List
+from common.cancellation import CancellationToken
+from system.backend import Backend
+from geometry.box import Box
 from geometry.point import Point
-from geometry.line import Line
 from geometry.geospace import GeoSpace
 from hierarchy.pattern import Pattern
 
@@ -20,36 +22,94 @@ class Riblet():
         """
         self.geoSpace = geoSpace
         self.pattern = pattern
+        self.box = pattern.getBox()
 
-    def render(self, display: Display) -> None:
+    def bounds(self) -> Box:
+        """
+        Get a bounding box of this riblet in the coordinate space of
+        the parent.
+
+        Returns:
+            Box: Bounding box, or None if the pattern is empty
+        """
+        if self.box is None:
+            return None
+        return self.geoSpace.getExternalBox(self.box)
+
+    def render(
+            self,
+            display: Backend,
+            token: CancellationToken = None) -> None:
         """
         Render the pattern inside this riblet
 
+        Riblets outside the viewport of the display are skipped before
+        any line is transformed.
+
         Args:
-            display (Display): Display to draw on
+            display (Backend): Backend to draw on
+            token (CancellationToken, optional): Token that stops the rendering. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
         """
+        if token is not None:
+            token.check()
+
+        if not display.isVisible(self.bounds()):
+            return
 
         display.pushGeoSpace(self.geoSpace)
 
-        for line in self.pattern.lines:
-            display.drawLine(line)
+        for run in self.pattern.runs:
+            display.drawRun(run)
 
         display.popGeoSpace()
 
+    def iterRuns(self, display: Backend = None) -> Iterator[List[Point]]:
+        """
+        Iterate over the runs of this riblet transformed into the coordinate
+        space of the parent.
+
+        Args:
+            display (Backend, optional): If given, nothing is yielded when the riblet can not be seen. Defaults to None.
+
+        Yields:
+            List[Point]: Transformed run of connected points
+        """
+        if display is not None and not display.isVisible(self.bounds()):
+            return
+        for run in self.pattern.runs:
+            yield [self.geoSpace.getExternalPos(p) for p in run]
+
     def collisionHeight(self) -> float:
         """
         Calculate the y coordinate at which the start and end angles
         cause a collision of points at x=1 and x=-1. If collision is
         very far away, return 0.
 
+        Returns:
+            float: y coordinate
+        """
+        return Riblet.geoSpaceCollisionHeight(self.geoSpace)
+
+    @staticmethod
+    def geoSpaceCollisionHeight(geoSpace: GeoSpace) -> float:
+        """
+        Calculate the collision height of a riblet in the given geospace
+        without creating the riblet.
+
+        Args:
+            geoSpace (GeoSpace): Geospace of the riblet
+
         Returns:
             float: y coordinate
         """
         deltaY = 0.01
         deltaThreshold = 0.001
         tempGS = GeoSpace(
-            startAngle=self.geoSpace.startAngle,
-            endAngle=self.geoSpace.endAngle)
+            startAngle=geoSpace.startAngle,
+            endAngle=geoSpace.endAngle)
         p1 = tempGS.getExternalPos(Point(-1, 0))
         p2 = tempGS.getExternalPos(Point(1, 0))
         d0 = p1.distanceTo(p2)
@@ -59,7 +119,7 @@ class Riblet():
         dd = d1 - d0
         if abs(dd) < deltaThreshold:
             return 0
-        return d0 / dd * deltaY * self.geoSpace.scale[0]
+        return d0 / dd * deltaY * geoSpace.scale[0]
 
     def getPattern(self) -> Pattern:
         """
@@ -69,8 +129,6 @@ class Riblet():
             Pattern: Pattern from this Riblet
         """
         result = Pattern()
-        for line in self.pattern.lines:
-            p0 = self.geoSpace.getExternalPos(line.p0)
-            p1 = self.geoSpace.getExternalPos(line.p1)
-            result.add(Line(p0, p1))
+        for run in self.iterRuns():
+            result.addRun(run)
         return result
@@ -0,0 +1,271 @@
+import os
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
+import pygame                                       # nopep8
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import multiprocessing
+import random
+from math import ceil, cos, hypot, pi, sin
+from typing import Any, BinaryIO, Callable, Dict, List
+from common.cancellation import CancellationToken
+from common.settings import Settings
+from common.utility import Logger
+from hierarchy.layer import Layer
+from system.display import Display
+
+# Frame data of a worker process, set by initWorker
+workerData: Dict[str, Any] = None
+
+
+class AnimatedLayer:
+    """
+    AnimatedLayer is the cached coverage of a layer and its rotation
+    during one loop of the animation.
+    """
+
+    def __init__(self, rect, coverage, loopAngle: float) -> None:
+        """
+        Initialize the layer
+
+        Args:
+            rect (Tuple[int, int, int, int]): Area of the coverage on the canvas as x0, y0, x1, y1
+            coverage (numpy array): Coverage inside rect
+            loopAngle (float): Rotation during one loop in radians
+        """
+        self.rect = rect
+        self.coverage = coverage
+        self.loopAngle = loopAngle
+
+
+class Animator:
+    """
+    Animator renders looping animations where every layer rotates at its
+    own speed.
+
+    Every layer is rendered once into a square coverage canvas that covers
+    the screen in any rotation. Frames are produced by rotating and
+    compositing the cached coverages and shading the result, so the
+    geometry is never rendered again. A layer with n repeated patterns
+    rotates a whole number of pattern widths, 2 pi k / n, during one loop,
+    so the last frame continues seamlessly to the first one.
+
+    Frames are computed by a pool of worker processes and written in order
+    as raw rgb24 data.
+    """
+
+    def __init__(
+            self,
+            display: Display,
+            settings: Settings,
+            logger: Logger) -> None:
+        """
+        Initialize the animator
+
+        Args:
+            display (Display): Display of the screen, used for the size, scale and colors
+            settings (Settings): Settings object
+            logger (Logger): Logger object
+        """
+        self.display = display
+        self.logger = logger
+        self.frames = settings.getItem("Animation", "frames", int)
+        self.maxTurns = settings.getItem("Animation", "maxTurns", int)
+        self.workers = settings.getItem("Animation", "workers", int)
+        if self.workers < 1:
+            self.workers = os.cpu_count()
+        # speeds do not consume the random numbers used for generation
+        self.random = random.Random()
+        size = 2 * ceil(hypot(display.width, display.height) / 2) + 4
+        self.canvas = Display(
+            pygame.Surface((size, size)), settings, logger, deferred=True)
+        self.canvas.setScale(display.scale)
+        self.layers: List[AnimatedLayer] = []
+
+    def clear(self) -> None:
+        """
+        Remove all layers.
+        """
+        self.layers = []
+
+    def addLayer(self, layer: Layer, token: CancellationToken = None) -> None:
+        """
+        Render a layer into the canvas and cache its coverage with a
+        random speed.
+
+        Args:
+            layer (Layer): Layer to add
+            token (CancellationToken, optional): Token that stops the rendering. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        self.canvas.beginLayer()
+        layer.render(self.canvas, token)
+        rect, coverage = self.canvas.endLayer(layer.bounds(), blend=False)
+        self.canvas.takeRemovedLines()
+        turns = 0
+        while turns == 0 and self.maxTurns > 0:
+            turns = self.random.randint(-self.maxTurns, self.maxTurns)
+        loopAngle = 2 * pi * turns / layer.ribbon.n
+        self.layers.append(AnimatedLayer(rect, coverage, loopAngle))
+
+    def frameData(self) -> Dict[str, Any]:
+        """
+        Collect everything the worker processes need for computing frames.
+
+        A layer can only cover screen pixels at the same distance from the
+        center as its own pixels, so only those pixels are stored for
+        each layer.
+
+        Returns:
+            Dict[str, Any]: Frame data
+        """
+        width = self.display.width
+        height = self.display.height
+        x = numpy.arange(width, dtype=numpy.float32)[:, numpy.newaxis]
+        y = numpy.arange(height, dtype=numpy.float32)[numpy.newaxis, :]
+        dx = numpy.broadcast_to(x - width / 2, (width, height)).ravel()
+        dy = numpy.broadcast_to(y - height / 2, (width, height)).ravel()
+        distance = numpy.hypot(dx, dy)
+        center = self.canvas.width / 2
+
+        layers = []
+        for animated in self.layers:
+            x0, y0, x1, y1 = animated.rect
+            cx, cy = numpy.nonzero(animated.coverage)
+            if len(cx) == 0:
+                continue
+            d = numpy.hypot(cx + x0 - center, cy + y0 - center)
+            # bilinear sampling reaches one pixel further
+            pixels = numpy.flatnonzero(
+                (distance >= d.min() - 1.5) & (distance <= d.max() + 1.5))
+            layers.append({
+                "pixels": pixels,
+                "dx": dx[pixels],
+                "dy": dy[pixels],
+                "originX": center - x0,
+                "originY": center - y0,
+                "coverage": animated.coverage.astype(numpy.float32) / 255,
+                "loopAngle": animated.loopAngle
+            })
+
+        bg, fg = self.display.shadingGradients()
+        return {
+            "width": width,
+            "height": height,
+            "frames": self.frames,
+            "layers": layers,
+            "bg": bg,
+            "fg": fg
+        }
+
+    def write(
+            self,
+            stream: BinaryIO,
+            cancelled: Callable[[], bool] = lambda: False) -> int:
+        """
+        Compute all frames in parallel and write them into a stream in
+        order.
+
+        Args:
+            stream (BinaryIO): Stream for the raw rgb24 frames
+            cancelled (Callable[[], bool], optional): Stop writing when this returns True. Defaults to never.
+
+        Returns:
+            int: Number of written frames
+        """
+        data = self.frameData()
+        written = 0
+        # forking a process with running threads can deadlock the child
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+                self.workers,
+                initializer=initWorker,
+                initargs=(data,)) as pool:
+            for frame in pool.imap(renderFrame, range(self.frames)):
+                if cancelled():
+                    break
+                stream.write(frame)
+                written += 1
+                self.logger.layerPrint(
+                    f"\tFrame {written}/{self.frames} written.")
+        stream.flush()
+        return written
+
+
+def initWorker(data: Dict[str, Any]) -> None:
+    """
+    Store the frame data in a worker process.
+
+    Args:
+        data (Dict[str, Any]): Frame data from Animator.frameData
+    """
+    global workerData
+    workerData = data
+
+
+def renderFrame(index: int) -> bytes:
+    """
+    Compute a frame in a worker process.
+
+    Args:
+        index (int): Index of the frame
+
+    Returns:
+        bytes: Frame as rgb24 rows
+    """
+    return computeFrame(workerData, index)
+
+
+def computeFrame(data: Dict[str, Any], index: int) -> bytes:
+    """
+    Compute a frame by rotating, compositing and shading the layers.
+
+    Args:
+        data (Dict[str, Any]): Frame data from Animator.frameData
+        index (int): Index of the frame
+
+    Returns:
+        bytes: Frame as rgb24 rows
+    """
+    width = data["width"]
+    height = data["height"]
+    total = numpy.zeros(width * height, dtype=numpy.float32)
+    for layer in data["layers"]:
+        angle = layer["loopAngle"] * index / data["frames"]
+        c = cos(angle)
+        s = sin(angle)
+        dx = layer["dx"]
+        dy = layer["dy"]
+        # pixel of the canvas rotated into each screen pixel
+        sx = c * dx + s * dy + layer["originX"]
+        sy = c * dy - s * dx + layer["originY"]
+        coverage = layer["coverage"]
+        w, h = coverage.shape
+        ix = numpy.floor(sx).astype(numpy.int64)
+        iy = numpy.floor(sy).astype(numpy.int64)
+        fx = sx - ix
+        fy = sy - iy
+        sample = numpy.zeros(len(sx), dtype=numpy.float32)
+        for ox, oy, weight in (
+                (0, 0, (1 - fx) * (1 - fy)),
+                (1, 0, fx * (1 - fy)),
+                (0, 1, (1 - fx) * fy),
+                (1, 1, fx * fy)):
+            px = ix + ox
+            py = iy + oy
+            inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+            sample[inside] += weight[inside] * \
+                coverage[px[inside], py[inside]]
+        pixels = layer["pixels"]
+        current = total[pixels]
+        total[pixels] = current + (1 - current) * sample
+
+    bg = data["bg"]
+    fg = data["fg"]
+    alpha = total.reshape(width, height)[:, :, numpy.newaxis]
+    image = numpy.rint(bg + (fg - bg) * alpha).astype(numpy.uint8)
+    return numpy.ascontiguousarray(image.transpose(1, 0, 2)).tobytes()
@@ -0,0 +1,369 @@
+from abc import ABC, abstractmethod
+from math import hypot
+from typing import List, Tuple
+from common.cancellation import CancellationToken
+from generation.color import ColorGenerator
+from geometry.box import Box
+from geometry.geospace import GeoSpace, GeoSpaceStack
+from geometry.line import Line
+from geometry.point import Point
+from geometry.utility import simplifyRun
+from common.utility import Color, gradient, Logger
+from common.settings import Settings
+
+# Number of foreground colors between the center and the corners
+paletteSize = 1024
+
+
+class Backend(ABC):
+    """
+    Backend is the interface the hierarchy renders into.
+
+    It keeps the geospace stack, the colors and the screen space processing
+    of runs shared by all backends: transforming, level of detail and
+    viewport clipping. Subclasses decide what is done with the resulting
+    screen space runs by implementing emitRun, and how the background is
+    drawn by implementing clear and gradient.
+    """
+
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            settings: Settings,
+            logger: Logger) -> None:
+        """
+        Initialize the backend.
+
+        Args:
+            width (int): Width of the image in pixels
+            height (int): Height of the image in pixels
+            settings (Settings): Settings object
+            logger (Logger): Logger object
+        """
+        self.logger = logger
+        self.width = width
+        self.height = height
+        self.settings = settings
+        self.culling = settings.getBool("Graphics", "viewportCulling")
+        self.levelOfDetail = settings.getBool("Graphics", "levelOfDetail")
+        self.lodTolerance = settings.getItem(
+            "Graphics", "lodTolerance", float)
+        self.removedLines = 0
+        self.chunkSize = settings.getItem("Graphics", "chunkSize", int)
+        self.autoColor = True
+        self.scale = min(self.width, self.height) / 2
+        self.palette: List[Tuple[int, int, int]] = None
+        # Lines are clipped slightly outside the image so that the
+        # antialiased edges are not affected
+        self.viewport = Box(0, 0, self.width - 1, self.height - 1).expanded(2)
+        self.renderDisabled = False
+        self.geoSpace = GeoSpace(
+            origin=Point(self.width / 2,
+                         self.height / 2),
+            yScale=-self.scale,
+            xScale=self.scale)
+        self.geoSpaceStack = GeoSpaceStack()
+        self.geoSpaceStack.push(self.geoSpace)
+        self.bgC0 = None
+        self.bgC1 = None
+        self.fgC0 = None
+        self.fgC1 = None
+        self.lineColor = Color(255, 255, 255)
+
+    def setScale(self, scale: float) -> None:
+        """
+        Set the number of pixels per unit of the geospace of the screen.
+
+        Args:
+            scale (float): Pixels per unit
+        """
+        self.scale = scale
+        self.geoSpace.scale = [scale, -scale]
+        self.geoSpaceStack = GeoSpaceStack()
+        self.geoSpaceStack.push(self.geoSpace)
+
+    def drawLine(self, line: Line) -> None:
+        """
+        Draw a line.
+
+        Args:
+            line (Line):  Line to draw
+        """
+        self.drawRun([line.p0, line.p1])
+
+    def drawRun(self, points: List[Point]) -> None:
+        """
+        Draw lines connecting a run of points.
+
+        Every point is transformed only once. If level of detail is
+        enabled, lines too small to be seen are dropped or merged first.
+        If viewport culling is enabled, the run is clipped to the image.
+        The resulting screen space runs are passed to emitRun.
+
+        Args:
+            points (List[Point]): Connected points
+        """
+        if self.renderDisabled:
+            return
+
+        run = [self.geoSpaceStack.getGlobalPos(p) for p in points]
+
+        if self.levelOfDetail:
+            lineCount = len(run) - 1
+            run = simplifyRun(run, self.lodTolerance)
+            if run is None:
+                self.removedLines += lineCount
+                return
+            self.removedLines += lineCount - (len(run) - 1)
+
+        middle = len(run) // 2
+        color = self.colorIndex(gradient(run[middle - 1], run[middle], 0.5))
+
+        if self.culling:
+            for clipped in self.viewport.clipRun(run):
+                self.emitRun(clipped, color)
+        else:
+            self.emitRun(run, color)
+
+    def drawChunk(self, runs: List[List[Point]]) -> None:
+        """
+        Draw a chunk of runs.
+
+        Args:
+            runs (List[List[Point]]): Runs of connected points
+        """
+        for run in runs:
+            self.drawRun(run)
+
+    @abstractmethod
+    def emitRun(self, points: List[Point], color: int) -> None:
+        """
+        Output a run of connected screen space points.
+
+        Args:
+            points (List[Point]): Screen space points, at least two
+            color (int): Palette index of the color of the run
+        """
+
+    def flushBuffer(self) -> None:
+        """
+        Output everything buffered so far. Does nothing by default.
+        """
+
+    def beginLayer(self) -> None:
+        """
+        Start drawing a layer. Does nothing by default.
+        """
+
+    def endLayer(self, box: Box, blend: bool = True):
+        """
+        Finish drawing a layer started with beginLayer. By default the
+        buffer is flushed and nothing is returned.
+
+        Args:
+            box (Box): Bounding box of the layer in the current geospace
+            blend (bool, optional): Add the layer into the image. Defaults to True.
+
+        Returns:
+            Backend specific raster of the layer, or None
+        """
+        self.flushBuffer()
+        return None
+
+    def close(self) -> None:
+        """
+        Finish the output. Does nothing by default.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Fill the image with black color.
+        """
+
+    @abstractmethod
+    def gradient(self) -> None:
+        """
+        Draw a radial gradient background.
+        """
+
+    def maxRadius(self) -> float:
+        """
+        Return the distance from center of screen
+        to the corner in the geospace of the screen.
+
+        Returns:
+            float: Distance from center to corner in the geospace of the screen
+        """
+        diagonal = hypot(self.width, self.height)
+        return diagonal / self.scale / 2
+
+    def isVisible(self, box: Box) -> bool:
+        """
+        Check if a box in the current geospace can be seen on the screen.
+
+        If viewport culling is disabled, all non-empty boxes are visible.
+
+        Args:
+            box (Box): Bounding box in the current geospace
+
+        Returns:
+            bool: False if nothing inside the box can be seen
+        """
+        if box is None or self.renderDisabled:
+            return False
+        if not self.culling:
+            return True
+        return self.geoSpaceStack.getGlobalBox(box).intersects(self.viewport)
+
+    def disableRender(self) -> None:
+        """
+        Disable rendering.
+        """
+        self.renderDisabled = True
+
+    def enableRender(self) -> None:
+        """
+        Enable rendering.
+        """
+        self.renderDisabled = False
+
+    def takeRemovedLines(self) -> int:
+        """
+        Get the number of lines removed by level of detail since the
+        last call.
+
+        Returns:
+            int: Number of removed lines
+        """
+        removed = self.removedLines
+        self.removedLines = 0
+        return removed
+
+    def colorIndex(self, p: Point) -> int:
+        """
+        Get the palette index of the foreground color at point p.
+
+        Args:
+            p (Point): Foreground point
+
+        Returns:
+            int: Index of the foreground color in the palette
+        """
+        if self.autoColor:
+            center = Point(self.width / 2, self.height / 2)
+            d = center.distanceTo(p)
+            maxD = hypot(self.width, self.height) / 2
+            return min(paletteSize - 1, round(d / maxD * (paletteSize - 1)))
+        else:
+            return paletteSize
+
+    def getPalette(self) -> List[Tuple[int, int, int]]:
+        """
+        Get the foreground colors by palette index.
+
+        The first paletteSize colors are the foreground gradient from the
+        center to the corners and the last one is the color set with
+        setColor.
+
+        Returns:
+            List[Tuple[int, int, int]]: Colors as rgb tuples
+        """
+        if self.palette is None:
+            self.palette = []
+            if self.fgC0 is not None:
+                self.palette = [
+                    gradient(self.fgC0, self.fgC1, i / (paletteSize - 1)).rgb()
+                    for i in range(paletteSize)]
+            else:
+                self.palette = [self.lineColor.rgb()] * paletteSize
+            self.palette.append(self.lineColor.rgb())
+        return self.palette
+
+    def generateColors(self, token: CancellationToken = None) -> None:
+        """
+        Generate and update background and foreground color pairs.
+
+        Args:
+            token (CancellationToken, optional): Token that stops the generation. Defaults to None.
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        self.logger.layerPrint("Generating colors...")
+        colorGen = ColorGenerator(self.settings, self.logger, token)
+        self.logger.layerPrint("Done.")
+        self.bgC0, self.bgC1 = colorGen.getBackgroundColors()
+        self.fgC0, self.fgC1 = colorGen.getLineColors()
+        self.palette = None
+
+    def getColors(self) -> Tuple[Color, Color, Color, Color]:
+        """
+        Get the current background and foreground color pairs.
+
+        Returns:
+            Tuple[Color, Color, Color, Color]: bgC0, bgC1, fgC0, fgC1
+        """
+        return (self.bgC0, self.bgC1, self.fgC0, self.fgC1)
+
+    def setColors(self, colors: Tuple[Color, Color, Color, Color]) -> None:
+        """
+        Set the background and foreground color pairs.
+
+        Args:
+            colors (Tuple[Color, Color, Color, Color]): bgC0, bgC1, fgC0, fgC1
+        """
+        self.bgC0, self.bgC1, self.fgC0, self.fgC1 = colors
+        self.palette = None
+
+    def setColor(self, r: int, g: int, b: int) -> None:
+        """
+        Set foreground color.
+
+        Args:
+            r (int): Red
+            g (int): Green
+            b (int): Blue
+        """
+        self.autoColor = False
+        self.lineColor.r = r
+        self.lineColor.g = g
+        self.lineColor.b = b
+        self.palette = None
+
+    def setAutoColor(self) -> None:
+        """
+        Set autocoloring to true of false.
+
+        If autocoloring is on, colors are randomly generated.
+        """
+        self.autoColor = True
+
+    def drawDebugGrid(self) -> None:
+        """
+        Draw a red unit square with x and y axes.
+        """
+        # unit square
+        self.drawLine(Line(Point(1, 1), Point(-1, 1)))
+        self.drawLine(Line(Point(-1, 1), Point(-1, -1)))
+        self.drawLine(Line(Point(-1, -1), Point(1, -1)))
+        self.drawLine(Line(Point(1, -1), Point(1, 1)))
+        # x and y axis
+        self.drawLine(Line(Point(0, 1), Point(0, -1)))
+        self.drawLine(Line(Point(1, 0), Point(-1, 0)))
+
+    def pushGeoSpace(self, geoSpace: GeoSpace) -> None:
+        """
+        Push a geospace to the stack.
+
+        Args:
+            geoSpace (GeoSpace): GeoSpace to push
+        """
+        self.geoSpaceStack.push(geoSpace)
+
+    def popGeoSpace(self) -> None:
+        """
+        Pop the last GeoSpace
+        """
+        self.geoSpaceStack.pop()
@@ -0,0 +1,55 @@
+import random
+from common.settings import Settings
+from common.utility import Logger
+from generation.layer import LayerGenerator
+from generation.plan import layerSizes, planLayers
+
+# Radius the layers generated for the bank reach, the layers of a
+# widescreen image reach a bit further than 1
+fillRadius = 1.2
+
+
+def fillBank(settings: Settings, count: int) -> None:
+    """
+    Generate features into the feature bank.
+
+    Whole layers of random seeds are generated, so the connections and
+    mirroring of the banked features follow the same distribution as in
+    the rendered layers. The features are generated one at a time and the
+    bank is saved after every layer, so an interrupted fill keeps the
+    features of the finished layers.
+
+    Args:
+        settings (Settings): Settings object
+        count (int): Number of features to add
+    """
+    logger = Logger()
+    generator = LayerGenerator(settings, logger)
+    featureGenerator = generator.featureGenerator
+    bank = featureGenerator.bank
+    if bank is None:
+        print("Set useBank to true in the settings to fill the feature bank.")
+        return
+    generator.featureWorkers = 0
+    featureGenerator.recording = True
+
+    sizes = layerSizes(fillRadius)
+    logger.setMaxLayer(len(sizes))
+    added = 0
+    try:
+        while added < count:
+            seed = random.SystemRandom().randrange(2**32)
+            print(f"Filling the feature bank from seed {seed}...")
+            generator.lastRepeats = 2
+            for plan in planLayers(generator, seed, sizes):
+                random.setstate(plan.randomState)
+                logger.setLayer(plan.index)
+                generator.getLayer(plan.radius, plan.width, plan)
+                added += len(bank.pending)
+                bank.save()
+                print(f"{added}/{count} features added, "
+                      f"{bank.size()} in the bank.")
+                if added >= count:
+                    break
+    finally:
+        generator.close()
@@ -0,0 +1,189 @@
+import os
+from typing import Any, Dict, List, Tuple                                        # nopep8
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
+import pygame                                       # nopep8
+import pickle
+
+from common.utility import Color
+from hierarchy.layer import Layer
+
+
+class Checkpoint:
+    """
+    Checkpoint stores the progress of a render on disk after every layer,
+    so that an interrupted render can be continued later.
+
+    The checkpoint folder contains:
+        state.pickle:    Number of completed layers, seed of the mandala,
+                         level of detail and the generated colors.
+        layerNN.pickle:  Geometry of each completed layer.
+        framebuffer.png: Rendered image, or coverage mask with deferred
+                         shading, after the last completed layer.
+
+    Every file is first written into a temporary file and then renamed, so a
+    crash in the middle of writing never leaves a broken checkpoint behind.
+    """
+
+    stateName = "state.pickle"
+    framebufferName = "framebuffer.png"
+
+    def __init__(self, folder: str) -> None:
+        """
+        Initialize the checkpoint.
+
+        Args:
+            folder (str): Path to the checkpoint folder
+        """
+        self.folder = folder
+
+    def path(self, name: str) -> str:
+        """
+        Get the path of a file inside the checkpoint folder.
+
+        Args:
+            name (str): File name
+
+        Returns:
+            str: Path to the file
+        """
+        return os.path.join(self.folder, name)
+
+    def layerName(self, index: int) -> str:
+        """
+        Get the file name of a layer.
+
+        Args:
+            index (int): Index of the layer, starting from 1
+
+        Returns:
+            str: File name of the layer
+        """
+        return "layer" + str(index).zfill(2) + ".pickle"
+
+    def dump(self, name: str, obj: Any) -> None:
+        """
+        Pickle an object into the checkpoint folder.
+
+        Args:
+            name (str): File name
+            obj (Any): Object to pickle
+        """
+        path = self.path(name)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(path + ".tmp", path)
+
+    def clear(self) -> None:
+        """
+        Remove all checkpoint files.
+        """
+        if not os.path.isdir(self.folder):
+            return
+        for name in os.listdir(self.folder):
+            if name == self.stateName or name == self.framebufferName or \
+                    (name.startswith("layer") and name.endswith(".pickle")):
+                os.remove(self.path(name))
+
+    def save(self,
+             index: int,
+             layer: Layer,
+             seed: int,
+             colors: Tuple[Color, Color, Color, Color],
+             surf,
+             deferred: bool = False,
+             detail: float = 1) -> None:
+        """
+        Write a checkpoint of a completed layer.
+
+        The state file is written last, so it always refers to a layer
+        whose geometry and framebuffer are already on the disk.
+
+        Args:
+            index (int): Index of the completed layer, starting from 1
+            layer (Layer): Completed layer
+            seed (int): Seed of the mandala
+            colors (Tuple[Color, Color, Color, Color]): Display colors
+            surf (pygame Surface): Rendered image or coverage mask
+            deferred (bool, optional): True if surf is a coverage mask. Defaults to False.
+            detail (float, optional): Level of detail of the layers. Defaults to 1.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        self.dump(self.layerName(index), layer)
+        path = self.path(self.framebufferName)
+        tempPath = self.path("framebuffer.tmp.png")
+        pygame.image.save(surf, tempPath)
+        os.replace(tempPath, path)
+        self.dump(self.stateName, {
+            "layer": index,
+            "seed": seed,
+            "colors": colors,
+            "resolution": surf.get_size(),
+            "deferred": deferred,
+            "detail": detail
+        })
+
+    def replaceLayer(self, index: int, layer: Layer, surf) -> None:
+        """
+        Replace the geometry of a completed layer and the framebuffer,
+        after the layer was generated again.
+
+        Args:
+            index (int): Index of the layer, starting from 1
+            layer (Layer): New layer
+            surf (pygame Surface): Rendered image or coverage mask
+        """
+        if not os.path.isfile(self.path(self.layerName(index))):
+            return
+        self.dump(self.layerName(index), layer)
+        tempPath = self.path("framebuffer.tmp.png")
+        pygame.image.save(surf, tempPath)
+        os.replace(tempPath, self.path(self.framebufferName))
+
+    def load(
+            self,
+            resolution: List[int],
+            deferred: bool = False) -> Dict[str, Any]:
+        """
+        Load the latest checkpoint.
+
+        Args:
+            resolution (List[int]): Resolution of the current display
+            deferred (bool, optional): True if the display uses deferred shading. Defaults to False.
+
+        Returns:
+            Dict[str, Any]: Checkpoint state with the framebuffer image
+            in "framebuffer", or None if there is no usable checkpoint
+        """
+        statePath = self.path(self.stateName)
+        if not os.path.isfile(statePath):
+            return None
+        with open(statePath, "rb") as f:
+            state = pickle.load(f)
+        if "seed" not in state:
+            print("Checkpoint was written by an older version, not resumed.")
+            return None
+        if list(state["resolution"]) != list(resolution):
+            print("Checkpoint resolution " + str(state["resolution"]) +
+                  " does not match " + str(resolution) + ", not resumed.")
+            return None
+        if state.get("deferred", False) != deferred:
+            print("Checkpoint was rendered with deferredShading = " +
+                  str(state.get("deferred", False)).lower() +
+                  ", not resumed.")
+            return None
+        state["framebuffer"] = pygame.image.load(
+            self.path(self.framebufferName))
+        return state
+
+    def loadLayer(self, index: int) -> Layer:
+        """
+        Load the geometry of a completed layer.
+
+        Args:
+            index (int): Index of the layer, starting from 1
+
+        Returns:
+            Layer: The layer
+        """
+        with open(self.path(self.layerName(index)), "rb") as f:
+            return pickle.load(f)
@@ -0,0 +1,289 @@
+import os
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
+import pygame                                       # nopep8
+import random
+import time
+from math import cos, floor, pi, sin
+from typing import List, Tuple
+from common.cancellation import CancellationToken
+from common.settings import Settings
+from common.utility import Logger
+from generation.layer import LayerGenerator
+from generation.plan import LayerPlan, planLayers
+from generation.utility import distributionMean, scaledDistribution
+from system.backend import Backend
+from system.display import Display
+
+# Seed of the layers generated by the benchmark
+benchmarkSeed = "cost benchmark"
+# Radius and width of the benchmark layers, fully visible on any screen
+benchmarkRadius = 0.5
+benchmarkWidth = 0.06
+# Number of points on the circle of a layer checked for visibility
+visibilitySamples = 360
+
+
+class LayerCost:
+    """
+    LayerCost is the predicted cost of generating and rendering a layer.
+    """
+
+    def __init__(
+            self,
+            segments: float,
+            generationSeconds: float,
+            renderSeconds: float) -> None:
+        """
+        Initialize the cost
+
+        Args:
+            segments (float): Number of rendered line segments
+            generationSeconds (float): Seconds spent generating the layer
+            renderSeconds (float): Seconds spent rendering the layer
+        """
+        self.segments = segments
+        self.generationSeconds = generationSeconds
+        self.renderSeconds = renderSeconds
+
+    def seconds(self, workers: int = 0) -> float:
+        """
+        Get the wall clock time the layer adds to the rendering.
+
+        With generation workers, the layer is generated while the previous
+        layers are rendered, so only the slower of the two counts.
+
+        Args:
+            workers (int, optional): Number of generation workers. Defaults to 0.
+
+        Returns:
+            float: Seconds
+        """
+        if workers > 0:
+            return max(self.generationSeconds / workers, self.renderSeconds)
+        return self.generationSeconds + self.renderSeconds
+
+
+class CostModel:
+    """
+    CostModel predicts the number of line segments and the generation and
+    render time of layers from their plans.
+
+    A layer of complexity c has c simple features of n ribbons on average
+    side by side in its pattern, of which c / 2 are generated and the rest
+    mirrored. The pattern is repeated around the circle and sliced at the
+    subdivisions of the circle, each of which splits the lines crossing it:
+
+        segments = visible * (repeats * c * n * linesPerRibbon
+                              + subDivs * n * crossingsPerRibbon)
+        generation = c / 2 * n * ribbonSeconds
+        render = segments * segmentSeconds
+
+    where visible is the share of the circle on the screen when viewport
+    culling is enabled. The coefficients are calibrated by generating and
+    rendering a few layers of a fixed seed on a display of the size of the
+    image, so they include the speed of the computer, the resolution and
+    the generation and graphics settings.
+    """
+
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            token: CancellationToken = None) -> None:
+        """
+        Initialize an uncalibrated model
+
+        Args:
+            settings (Settings): Settings object
+            logger (Logger): Logger object
+            token (CancellationToken, optional): Token that stops the benchmark. Defaults to one that is never cancelled.
+
+        Raises:
+            ValueError: If benchmarkLayers is less than 1
+        """
+        self.settings = settings
+        self.logger = logger
+        self.token = token if token is not None else CancellationToken()
+        self.benchmarkLayers = settings.getItem(
+            "Deadline", "benchmarkLayers", int)
+        if self.benchmarkLayers < 1:
+            raise ValueError(
+                "Invalid benchmarkLayers: " + str(self.benchmarkLayers))
+        self.pdNRibbons = settings.getList(
+            "SimpleFeatures", "PD_complexity", float)
+        self.culling = settings.getBool("Graphics", "viewportCulling")
+        self.ribbonSeconds = 0
+        self.linesPerRibbon = 0
+        self.crossingsPerRibbon = 0
+        self.segmentSeconds = 0
+        # half of the width and height of the screen in layer units
+        self.halfWidth = 1
+        self.halfHeight = 1
+
+    def calibrate(self, display: Backend) -> None:
+        """
+        Calibrate the coefficients by generating and rendering benchmark
+        layers.
+
+        The layers are rendered into a separate surface of the size of the
+        display, with the colors of the display. The random stream of the
+        caller is not affected.
+
+        Args:
+            display (Backend): Display the layers will be rendered on
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        self.halfWidth = display.width / 2 / display.scale
+        self.halfHeight = display.height / 2 / display.scale
+        deferred = isinstance(display, Display) and display.deferred
+        scratch = Display(
+            pygame.Surface((display.width, display.height)),
+            self.settings,
+            Logger(),
+            deferred=deferred)
+        scratch.setColors(display.getColors())
+
+        n = distributionMean(self.pdNRibbons)
+        generatedRibbons = 0
+        patternRibbons = 0
+        cuts = 0
+        generationSeconds = 0
+        renderSeconds = 0
+        lines = 0
+        segments = 0
+        crossings = 0
+
+        self.logger.layerPrint("Calibrating cost model...")
+        state = random.getstate()
+        generator = LayerGenerator(self.settings, Logger(), self.token)
+        try:
+            for index in range(1, self.benchmarkLayers + 1):
+                random.seed(f"{benchmarkSeed}:{index}")
+                plan = generator.planLayer(
+                    index, radius=benchmarkRadius, width=benchmarkWidth)
+                start = time.perf_counter()
+                layer = generator.getLayer(
+                    plan.radius, plan.width, plan)
+                generationSeconds += time.perf_counter() - start
+
+                self.token.check()
+                start = time.perf_counter()
+                scratch.beginLayer()
+                layer.render(scratch, self.token)
+                scratch.endLayer(layer.bounds())
+                renderSeconds += time.perf_counter() - start
+
+                layerLines = sum(
+                    len(run) - 1 for run in layer.ribbon.pattern.runs)
+                layerSegments = sum(
+                    len(run) - 1
+                    for chunk in layer.iterChunks(scratch)
+                    for run in chunk)
+                generatedRibbons += (floor((plan.complexity - 1) / 2) + 1) * n
+                patternRibbons += plan.complexity * n
+                cuts += plan.subDivs * n
+                lines += layerLines
+                segments += layerSegments
+                crossings += max(0, layerSegments - plan.repeats * layerLines)
+        finally:
+            generator.close()
+            random.setstate(state)
+
+        self.ribbonSeconds = generationSeconds / max(1, generatedRibbons)
+        self.linesPerRibbon = lines / max(1, patternRibbons)
+        self.crossingsPerRibbon = crossings / max(1, cuts)
+        self.segmentSeconds = renderSeconds / max(1, segments)
+        self.logger.layerPrint(
+            f"Done, {self.ribbonSeconds * 1000:.1f} ms per ribbon, "
+            f"{self.linesPerRibbon:.1f} lines per ribbon, "
+            f"{self.segmentSeconds * 1e6:.1f} us per segment.")
+
+    def visibleShare(self, radius: float) -> float:
+        """
+        Get the share of the circle of a layer that is on the screen.
+
+        Args:
+            radius (float): Radius of the layer
+
+        Returns:
+            float: Share between 0 and 1, always 1 without viewport culling
+        """
+        if not self.culling:
+            return 1
+        visible = 0
+        for i in range(visibilitySamples):
+            angle = 2 * pi * i / visibilitySamples
+            if abs(radius * cos(angle)) <= self.halfWidth and \
+                    abs(radius * sin(angle)) <= self.halfHeight:
+                visible += 1
+        return visible / visibilitySamples
+
+    def predict(self, plan: LayerPlan) -> LayerCost:
+        """
+        Predict the cost of a planned layer.
+
+        Args:
+            plan (LayerPlan): Plan of the layer
+
+        Returns:
+            LayerCost: Predicted cost
+        """
+        n = distributionMean(
+            scaledDistribution(self.pdNRibbons, plan.complexityScale))
+        segments = self.visibleShare(plan.radius) * (
+            plan.repeats * plan.complexity * n * self.linesPerRibbon +
+            plan.subDivs * n * self.crossingsPerRibbon)
+        generated = (floor((plan.complexity - 1) / 2) + 1) * n
+        return LayerCost(
+            segments=segments,
+            generationSeconds=generated * self.ribbonSeconds,
+            renderSeconds=segments * self.segmentSeconds)
+
+    def fitDeadline(
+            self,
+            generator: LayerGenerator,
+            seed: int,
+            sizes: List[Tuple[float, float]],
+            seconds: float,
+            workers: int,
+            levels: List[float]) -> Tuple[float, List[LayerPlan]]:
+        """
+        Plan the layers at the highest level of detail whose predicted
+        time fits in the given time.
+
+        The level of detail scales the complexity distributions, the
+        number of repeats and the subdivisions of the layers, see
+        LayerGenerator.planLayer. If no level fits, the lowest one is used.
+
+        Args:
+            generator (LayerGenerator): Generator that plans the layers, its level of detail is set
+            seed (int): Seed of the mandala
+            sizes (List[Tuple[float, float]]): Radius and width of every layer
+            seconds (float): Time left for the layers
+            workers (int): Number of generation workers
+            levels (List[float]): Levels of detail to try, from the highest
+
+        Returns:
+            Tuple[float, List[LayerPlan]]: Level of detail and the plan of
+            every layer
+        """
+        lastRepeats = generator.lastRepeats
+        for detail in levels:
+            generator.lastRepeats = lastRepeats
+            generator.detail = detail
+            plans = planLayers(generator, seed, sizes)
+            costs = [self.predict(plan) for plan in plans]
+            predicted = sum(cost.seconds(workers) for cost in costs)
+            segments = sum(cost.segments for cost in costs)
+            self.logger.layerPrint(
+                f"Detail {detail}: {segments:.0f} segments in "
+                f"{predicted:.1f} s predicted.")
+            if predicted <= seconds:
+                break
+        else:
+            self.logger.layerPrint(
+                f"No level of detail fits in {seconds:.1f} s, "
+                f"using the lowest.")
+        return detail, plans
@@ -1,248 +1,489 @@
 import os
-
-from generation.color import ColorGenerator                                           # nopep8
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
 import pygame                                       # nopep8
 import pygame.gfxdraw                               # nopep8
-
-from math import hypot
-from typing import List
-from geometry.geospace import GeoSpace, GeoSpaceStack
-from geometry.line import Line
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import threading
+from math import ceil, floor, hypot
+from typing import List, Tuple
+from geometry.box import Box
 from geometry.point import Point
 from common.utility import Color, gradient, Logger
 from common.settings import Settings
+from system.backend import Backend, paletteSize
+from system.linebuffer import LineBuffer, fixedPointScale
 
+# Size in pixels of the tiles the changed parts of the screen are tracked in
+dirtyTileSize = 64
 
-class Display:
+
+class Display(Backend):
     """
-    Display provides functions for rendering lines.
+    Display is the pygame backend, which rasterizes lines into a surface.
+
+    In deferred shading mode, lines are rasterized in white into a
+    coverage mask instead. The image is then shaded in one vectorized pass
+    that blends a radial foreground gradient over the background gradient
+    by the coverage, so new colors only cost a new shading pass.
+
+    Drawing never presents the surface on the screen, it only marks the
+    changed tiles of the surface dirty. The main thread presents them with
+    present, and the lock keeps the surface from being presented while it
+    is drawn into.
     """
 
-    def __init__(self, surf, settings: Settings, logger:Logger) -> None:
+    def __init__(
+            self,
+            surf,
+            settings: Settings,
+            logger:Logger,
+            deferred: bool = None) -> None:
         """
         Initialize the Display object.
 
         Args:
             surf (pygame Surface): Surface to render into.
             settings (Settings):  Settings object
+            deferred (bool, optional): Use deferred shading. Defaults to the deferredShading setting.
         """
-        self.logger = logger
+        super().__init__(surf.get_width(), surf.get_height(), settings, logger)
         self.surf = surf
-        self.width = surf.get_width()
-        self.height = surf.get_height()
-        self.settings = settings
         self.antialiasing = settings.getBool("Graphics", "antialiasing")
         self.autoFlush = settings.getBool("Graphics", "autoFlush")
-        self.autoColor = True
-        self.scale = min(self.width, self.height) / 2
-        self.lineBuffer: List[Line] = []
-        self.renderDisabled = False
-        self.geoSpace = GeoSpace(
-            origin=Point(self.width / 2,
-                         self.height / 2),
-            yScale=-self.scale,
-            xScale=self.scale)
-        self.geoSpaceStack = GeoSpaceStack()
-        self.geoSpaceStack.push(self.geoSpace)
-        self.bgC0 = None
-        self.bgC1 = None
-        self.fgC0 = None
-        self.fgC1 = None
-        #self.generateColors()
-        self.lineColor = Color(255, 255, 255)
-
-    def drawLine(self, line: Line) -> None:
-        """
-        Draw a line.
+        self.bufferSize = settings.getItem("Graphics", "bufferSize", int)
+        self.lineBuffer = LineBuffer()
+        self.deferred = deferred
+        if deferred is None:
+            self.deferred = settings.getBool("Graphics", "deferredShading")
+        if self.deferred and numpy is None:
+            print("Deferred shading needs numpy, colors are drawn directly.")
+            self.deferred = False
+        self.mask = None
+        self.layerMask = None
+        self.layerActive = False
+        self.fgPosition = None
+        self.bgPosition = None
+        self.lock = threading.RLock()
+        self.dirtyTiles = set()
+        if self.deferred:
+            self.mask = pygame.Surface((self.width, self.height))
+            self.layerMask = pygame.Surface((self.width, self.height))
+
+    def emitRun(self, points: List[Point], color: int) -> None:
+        """
+        Store a screen space run in the line buffer, which is flushed
+        when it is full.
 
         Args:
-            line (Line):  Line to draw
+            points (List[Point]): Screen space points, at least two
+            color (int): Palette index of the color of the run
         """
-        if self.renderDisabled:
-            return
+        self.lineBuffer.append(points, color)
+        if self.autoFlush or self.lineBuffer.lineCount() >= self.bufferSize:
+            # in deferred mode the image is shaded only when the caller
+            # flushes, usually once per layer
+            self.flushBuffer(shade=False)
 
-        pos0 = self.geoSpaceStack.getGlobalPos(line.p0)
-        pos1 = self.geoSpaceStack.getGlobalPos(line.p1)
-
-        self.lineBuffer.append(Line(pos0, pos1))
+    def setAutoFlush(self, value: bool) -> None:
+        """
+        Set the auto flushing feature to True or False.
 
-        if self.autoFlush:
-            self.flushBuffer()
+        Args:
+            value (bool): Value
+        """
+        self.autoFlush = value
 
-    def maxRadius(self) -> float:
+    def flushBuffer(self, shade: bool = True) -> None:
         """
-        Return the distance from center of screen
-        to the corner in the geospace of the screen.
+        Draw buffered runs and clear the buffer.
+
+        Each run is drawn with a single draw call in the color taken from
+        the middle of the run. In deferred mode the runs are drawn into the
+        coverage mask, and the image is shaded if shade is True.
+
+        Args:
+            shade (bool, optional): Shade the image in deferred mode. Defaults to True.
+        """
+        with self.lock:
+            target = self.surf
+            palette = self.getPalette()
+            if self.deferred:
+                target = self.layerMask if self.layerActive else self.mask
+                palette = [(255, 255, 255)] * (paletteSize + 1)
+            step = 1 / fixedPointScale
+            for coords, color in self.lineBuffer.runs():
+                with coords:
+                    values = iter(coords)
+                    points = [(x * step, y * step)
+                              for x, y in zip(values, values)]
+                if self.antialiasing:
+                    rect = pygame.draw.aalines(
+                        target, palette[color], False, points)
+                else:
+                    rect = pygame.draw.lines(
+                        target,
+                        palette[color],
+                        False,
+                        [(round(x), round(y)) for x, y in points])
+                if not self.deferred:
+                    self.markDirty(rect)
+            self.lineBuffer.clear()
+            if self.deferred and shade:
+                self.shade()
+
+    def initShading(self) -> None:
+        """
+        Precompute the gradient positions of every pixel used in shading.
+
+        The positions match the colors drawn directly: the foreground
+        position is quantized like the palette index, and the background
+        position like the circles drawn by gradient.
+        """
+        x = numpy.arange(self.width, dtype=numpy.float32)[:, numpy.newaxis]
+        y = numpy.arange(self.height, dtype=numpy.float32)[numpy.newaxis, :]
+        d = numpy.hypot(x - self.width / 2, y - self.height / 2)
+        maxD = hypot(self.width, self.height) / 2
+        self.fgPosition = numpy.minimum(
+            paletteSize - 1,
+            numpy.rint(d / maxD * (paletteSize - 1))) / (paletteSize - 1)
+        maxR = int(hypot(self.width, self.height) / 2)
+        d = numpy.hypot(x - int(self.width / 2), y - int(self.height / 2))
+        self.bgPosition = numpy.minimum(maxR, numpy.ceil(d)) / maxR
+
+    def shadeGradient(self, c0: Color, c1: Color, position):
+        """
+        Get the colors of a gradient at the given positions.
+
+        Channels are interpolated the same way as gradient of two Colors.
+
+        Args:
+            c0 (Color): Color at position 0
+            c1 (Color): Color at position 1
+            position (numpy array): Gradient position of every pixel
 
         Returns:
-            float: Distance from center to corner in the geospace of the screen
+            numpy array: Color of every pixel
         """
-        diagonal = hypot(self.width, self.height)
-        return diagonal / self.scale / 2
+        start = numpy.array(c0.rgb(), dtype=numpy.float32)
+        delta = numpy.array(c1.rgb(), dtype=numpy.float32) - start
+        return start + numpy.trunc(delta * position[:, :, numpy.newaxis])
 
-    def setAutoFlush(self, value: bool) -> None:
+    def shadingGradients(self, rect: Tuple[int, int, int, int] = None):
         """
-        Set the auto flushing feature to True or False.
+        Get the background and foreground colors of every pixel.
 
         Args:
-            value (bool): Value
+            rect (Tuple[int, int, int, int], optional): Only the pixels inside x0, y0, x1, y1. Defaults to the whole screen.
+
+        Returns:
+            Tuple[numpy array, numpy array]: Background and foreground
+            colors indexed by x, y and channel
+        """
+        if self.fgPosition is None:
+            self.initShading()
+        if rect is None:
+            rect = (0, 0, self.width, self.height)
+        x0, y0, x1, y1 = rect
+        bgC0, bgC1, fgC0, fgC1 = self.getColors()
+        if bgC0 is None:
+            bgC0 = bgC1 = Color(0, 0, 0)
+        if fgC0 is None:
+            fgC0 = fgC1 = self.lineColor
+        bg = self.shadeGradient(bgC0, bgC1, self.bgPosition[x0:x1, y0:y1])
+        fg = self.shadeGradient(fgC0, fgC1, self.fgPosition[x0:x1, y0:y1])
+        return bg, fg
+
+    def shade(self, rect: Tuple[int, int, int, int] = None) -> None:
+        """
+        Shade the image from the coverage mask and the current colors.
+
+        Args:
+            rect (Tuple[int, int, int, int], optional): Only shade the pixels inside x0, y0, x1, y1. Defaults to the whole screen.
         """
-        self.autoFlush = value
+        if rect is None:
+            rect = (0, 0, self.width, self.height)
+        x0, y0, x1, y1 = rect
+        if x0 >= x1 or y0 >= y1:
+            return
+        bg, fg = self.shadingGradients(rect)
+        coverage = pygame.surfarray.pixels_red(self.mask)[x0:x1, y0:y1]
+        alpha = coverage[:, :, numpy.newaxis] / numpy.float32(255)
+        del coverage
+        image = numpy.rint(bg + (fg - bg) * alpha).astype(numpy.uint8)
+        with self.lock:
+            pixels = pygame.surfarray.pixels3d(self.surf)
+            pixels[x0:x1, y0:y1] = image
+            del pixels
+            self.markDirty(pygame.Rect(x0, y0, x1 - x0, y1 - y0))
+
+    def beginLayer(self) -> None:
+        """
+        Start drawing a layer into its own coverage mask. Does nothing
+        without deferred shading.
+        """
+        if not self.deferred:
+            return
+        self.flushBuffer(shade=False)
+        self.layerMask.fill((0, 0, 0))
+        self.layerActive = True
 
-    def disableRender(self) -> None:
+    def endLayer(self, box: Box, blend: bool = True):
         """
-        Disable rendering.
+        Finish drawing a layer started with beginLayer.
+
+        The coverage of the layer is cropped to its bounding box on the
+        screen. Without deferred shading, the buffer is only flushed.
+
+        Args:
+            box (Box): Bounding box of the layer in the current geospace
+            blend (bool, optional): Blend the layer into the image and shade it. Defaults to True.
+
+        Returns:
+            Tuple[Tuple[int, int, int, int], numpy array]: Screen area as
+            x0, y0, x1, y1 and the coverage inside it, or None without
+            deferred shading
+        """
+        if not self.deferred:
+            return super().endLayer(box, blend)
+        self.flushBuffer(shade=False)
+        self.layerActive = False
+        rect = self.screenRect(box)
+        x0, y0, x1, y1 = rect
+        coverage = pygame.surfarray.pixels_red(self.layerMask)[x0:x1, y0:y1].copy()
+        if blend:
+            self.blendCoverage(rect, coverage)
+            self.shade(rect)
+        return rect, coverage
+
+    def screenRect(self, box: Box) -> Tuple[int, int, int, int]:
+        """
+        Get the pixels covered by a box in the current geospace, including
+        the antialiased edges.
+
+        Args:
+            box (Box): Box in the current geospace
+
+        Returns:
+            Tuple[int, int, int, int]: x0, y0, x1, y1 with exclusive x1 and y1
         """
-        self.renderDisabled = True
+        if box is None:
+            return (0, 0, 0, 0)
+        screenBox = self.geoSpaceStack.getGlobalBox(box).expanded(2)
+        x0 = min(self.width, max(0, floor(screenBox.xMin)))
+        y0 = min(self.height, max(0, floor(screenBox.yMin)))
+        x1 = max(x0, min(self.width, ceil(screenBox.xMax) + 1))
+        y1 = max(y0, min(self.height, ceil(screenBox.yMax) + 1))
+        return (x0, y0, x1, y1)
 
-    def enableRender(self) -> None:
+    def blendCoverage(self, rect: Tuple[int, int, int, int], coverage) -> None:
         """
-        Enable rendering.
+        Blend the coverage of a layer over the coverage mask.
+
+        Coverages are combined like antialiased lines drawn on top of each
+        other: a + b - a * b.
+
+        Args:
+            rect (Tuple[int, int, int, int]): Screen area as x0, y0, x1, y1
+            coverage (numpy array): Coverage inside rect
         """
-        self.renderDisabled = False
+        x0, y0, x1, y1 = rect
+        pixels = pygame.surfarray.pixels3d(self.mask)
+        current = pixels[x0:x1, y0:y1, 0].astype(numpy.float32)
+        blended = current + (255 - current) * (coverage / numpy.float32(255))
+        pixels[x0:x1, y0:y1] = numpy.rint(blended).astype(
+            numpy.uint8)[:, :, numpy.newaxis]
+        del pixels
 
-    def flushBuffer(self) -> None:
+    def getCoverage(self):
         """
-        Draw buffered lines and clear the buffer.
+        Get a copy of the coverage mask.
+
+        Returns:
+            numpy array: Coverage of every pixel
         """
-        for line in self.lineBuffer:
-            pos0 = line.p0
-            pos1 = line.p1
-            if self.antialiasing:
-                self.drawAALine(pos0, pos1)
-            else:
-                pygame.draw.line(
-                    self.surf,
-                    self.getFgColor(gradient(pos0, pos1, 0.5)).rgb(),
-                    (round(pos0.x),
-                     round(pos0.y)),
-                    (round(pos1.x),
-                     round(pos1.y)))
-        self.lineBuffer = []
-        pygame.display.update()
+        return pygame.surfarray.pixels_red(self.mask).copy()
 
-    def drawAALine(self, p1: Point, p2: Point) -> None:
+    def composite(
+            self,
+            base,
+            layers: List[Tuple[Tuple[int, int, int, int], object]]) -> None:
         """
-        Draw antialiased line from p1 to p2.
+        Rebuild the coverage mask from layer coverages and shade the image.
 
         Args:
-            p1 (Point): Point 1
-            p2 (Point): Point 2
+            base (numpy array): Coverage under the layers, or None
+            layers (List[Tuple[Tuple[int, int, int, int], object]]): Screen area and coverage of each layer
         """
-        mid = gradient(p1, p2, 0.5)
-        c = self.getFgColor(mid)
-        pygame.gfxdraw.aatrigon(
-            self.surf,
-            round(p1.x),
-            round(p1.y),
-            round(mid.x),
-            round(mid.y),
-            round(p2.x),
-            round(p2.y),
-            c.rgb())
+        self.lineBuffer.clear()
+        self.mask.fill((0, 0, 0))
+        if base is not None:
+            pixels = pygame.surfarray.pixels3d(self.mask)
+            pixels[:] = base[:, :, numpy.newaxis]
+            del pixels
+        for rect, coverage in layers:
+            self.blendCoverage(rect, coverage)
+        self.shade()
 
-    def getFgColor(self, p: Point) -> Color:
+    def recolor(self) -> bool:
         """
-        Get the foreground color at point p.
+        Generate new colors and shade the image with them.
 
-        Args:
-            p (Point): Foreground point
+        Returns:
+            bool: False if deferred shading is not enabled
+        """
+        if not self.deferred:
+            return False
+        self.generateColors()
+        self.shade()
+        return True
+
+    def getFramebuffer(self):
+        """
+        Get the image needed to continue rendering: the coverage mask in
+        deferred mode, otherwise the screen.
 
         Returns:
-            Color: Foreground color
+            pygame Surface: Framebuffer
         """
-        if self.autoColor:
-            center = Point(self.width / 2, self.height / 2)
-            d = center.distanceTo(p)
-            maxD = hypot(self.width, self.height) / 2
-            return gradient(self.fgC0, self.fgC1, d / maxD)
-        else:
-            return self.lineColor
+        if self.deferred:
+            return self.mask
+        return self.surf
 
     def clear(self) -> None:
         """
         Fill the screen with black color.
         """
-        self.lineBuffer = []
+        self.lineBuffer.clear()
         c1 = Color(0, 0, 0)
-        self.surf.fill(c1.rgb())
-        pygame.display.update()
+        with self.lock:
+            self.surf.fill(c1.rgb())
+            self.markDirty()
+        if self.deferred:
+            self.mask.fill(c1.rgb())
 
     def gradient(self) -> None:
         """
         Draw a radial gradient background.
         """
-        self.lineBuffer = []
+        self.lineBuffer.clear()
+        if self.deferred:
+            self.mask.fill((0, 0, 0))
+            self.shade()
+            return
         diag = hypot(self.width, self.height)
         maxR = int(diag / 2)
         c0 = self.bgC0
         c1 = self.bgC1
-        self.surf.fill(c1.rgb())
-        for i in reversed(range(maxR)):
-            c = gradient(c0, c1, i / maxR)
-            x = int(self.width / 2)
-            y = int(self.height / 2)
-            pygame.gfxdraw.aacircle(self.surf, x, y, i, c.rgb())
-            pygame.gfxdraw.filled_circle(self.surf, x, y, i, c.rgb())
-        pygame.display.update()
-
-    def generateColors(self) -> None:
-        """
-        Generate and update background and foreground color pairs.
-        """
-        self.logger.layerPrint("Generating colors...")
-        colorGen = ColorGenerator(self.settings, self.logger)
-        self.logger.layerPrint("Done.")
-        self.bgC0, self.bgC1 = colorGen.getBackgroundColors()
-        self.fgC0, self.fgC1 = colorGen.getLineColors()
+        with self.lock:
+            self.surf.fill(c1.rgb())
+            for i in reversed(range(maxR)):
+                c = gradient(c0, c1, i / maxR)
+                x = int(self.width / 2)
+                y = int(self.height / 2)
+                pygame.gfxdraw.aacircle(self.surf, x, y, i, c.rgb())
+                pygame.gfxdraw.filled_circle(self.surf, x, y, i, c.rgb())
+            self.markDirty()
 
-    def setColor(self, r: int, g: int, b: int) -> None:
+    def drawImage(self, image) -> None:
         """
-        Set foreground color.
+        Replace the screen contents with an image from getFramebuffer.
 
         Args:
-            r (int): Red
-            g (int): Green
-            b (int): Blue
+            image (pygame Surface): Image of the same size as the screen
         """
-        self.autoColor = False
-        self.lineColor.r = r
-        self.lineColor.g = g
-        self.lineColor.b = b
+        self.lineBuffer.clear()
+        if self.deferred:
+            self.mask.blit(image, (0, 0))
+            self.shade()
+        else:
+            with self.lock:
+                self.surf.blit(image, (0, 0))
+                self.markDirty()
 
-    def setAutoColor(self) -> None:
+    def markDirty(self, rect=None) -> None:
         """
-        Set autocoloring to true of false.
+        Mark a changed area of the surface to be presented.
 
-        If autocoloring is on, colors are randomly generated.
+        Args:
+            rect (pygame Rect, optional): Changed area. Defaults to the whole surface.
         """
-        self.autoColor = True
+        bounds = self.surf.get_rect()
+        rect = bounds if rect is None else rect.clip(bounds)
+        if rect.width == 0 or rect.height == 0:
+            return
+        tx0 = rect.left // dirtyTileSize
+        ty0 = rect.top // dirtyTileSize
+        tx1 = (rect.right - 1) // dirtyTileSize
+        ty1 = (rect.bottom - 1) // dirtyTileSize
+        with self.lock:
+            for tx in range(tx0, tx1 + 1):
+                for ty in range(ty0, ty1 + 1):
+                    self.dirtyTiles.add((tx, ty))
 
-    def drawDebugGrid(self) -> None:
+    def dirtyRects(self) -> List[pygame.Rect]:
         """
-        Draw a red unit square with x and y axes.
-        """
-        # unit square
-        self.drawLine(Line(Point(1, 1), Point(-1, 1)))
-        self.drawLine(Line(Point(-1, 1), Point(-1, -1)))
-        self.drawLine(Line(Point(-1, -1), Point(1, -1)))
-        self.drawLine(Line(Point(1, -1), Point(1, 1)))
-        # x and y axis
-        self.drawLine(Line(Point(0, 1), Point(0, -1)))
-        self.drawLine(Line(Point(1, 0), Point(-1, 0)))
+        Coalesce the dirty tiles into rectangles.
 
-    def pushGeoSpace(self, geoSpace: GeoSpace) -> None:
-        """
-        Push a geospace to the stack.
+        Consecutive tiles on a row of tiles are merged into one span, and
+        equal spans on consecutive rows into one rectangle. An annulus
+        then becomes a few rectangles around its edge, and the whole
+        screen a single rectangle.
 
-        Args:
-            geoSpace (GeoSpace): GeoSpace to push
-        """
-        self.geoSpaceStack.push(geoSpace)
+        Returns:
+            List[pygame Rect]: Dirty areas of the surface
+        """
+        rows = {}
+        for tx, ty in self.dirtyTiles:
+            rows.setdefault(ty, []).append(tx)
+        # first and last row of each growing rectangle by its x span
+        growing = {}
+        spans = []
+        for ty in sorted(rows):
+            columns = sorted(rows[ty])
+            start = columns[0]
+            rowSpans = []
+            for previous, tx in zip(columns, columns[1:]):
+                if tx != previous + 1:
+                    rowSpans.append((start, previous + 1))
+                    start = tx
+            rowSpans.append((start, columns[-1] + 1))
+            current = {}
+            for span in rowSpans:
+                top, bottom = growing.pop(span, (ty, ty))
+                if bottom != ty:
+                    spans.append((span, top, bottom))
+                    top = ty
+                current[span] = (top, ty + 1)
+            spans.extend((span, top, bottom)
+                         for span, (top, bottom) in growing.items())
+            growing = current
+        spans.extend((span, top, bottom)
+                     for span, (top, bottom) in growing.items())
+        bounds = self.surf.get_rect()
+        return [
+            pygame.Rect(
+                x0 * dirtyTileSize,
+                top * dirtyTileSize,
+                (x1 - x0) * dirtyTileSize,
+                (bottom - top) * dirtyTileSize).clip(bounds)
+            for (x0, x1), top, bottom in spans]
+
+    def present(self) -> bool:
+        """
+        Update the dirty areas of the window from the surface. Must be
+        called from the main thread.
 
-    def popGeoSpace(self) -> None:
-        """
-        Pop the last GeoSpace
-        """
-        self.geoSpaceStack.pop()
+        Returns:
+            bool: True if the window was updated
+        """
+        if not self.dirtyTiles:
+            return False
+        with self.lock:
+            rects = self.dirtyRects()
+            self.dirtyTiles = set()
+            pygame.display.update(rects)
+        return True
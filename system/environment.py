@@ -1,24 +1,37 @@
 import os
-from typing import Callable, List, Tuple                                           # nopep8
+from typing import Callable, Tuple                                                 # nopep8
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
 import pygame                                       # nopep8
+import sys
+import time
 import uuid
 import random
 import threading
 
+from common.cancellation import CancellationToken, Cancelled
 from common.settings import Settings
-from common.utility import Logger
+from common.utility import Logger, redirectPrints
 from geometry.point import Point
 from hierarchy.curve import Curve
 from hierarchy.ribbon import Ribbon
 from generation.layer import LayerGenerator
+from generation.plan import layerSizes, planLayers, seedStream
+from system.checkpoint import Checkpoint
+from system.costmodel import CostModel
+from system import animation
+from system.animation import Animator
 from system.display import Display
+from system.layercache import LayerCache, LayerRecord
+from system.pipeline import LayerProducer
+from system.vector import PDFBackend, SVGBackend
 
 
-class Event():
-    def __init__(self) -> None:
-        self.queued = False
-        self.active = False
+# Posted by the rendering thread when it has finished
+renderFinishedEvent = pygame.event.custom_type()
+# Posted to export the screen once the rendering has finished
+saveEvent = pygame.event.custom_type()
+# Posted to clear the screen and start rendering a new set of layers
+restartEvent = pygame.event.custom_type()
 
 
 class Environment():
@@ -26,12 +39,13 @@ class Environment():
     Environment controls the user input and rendering control
     """
 
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, resume: bool = False) -> None:
         """
         Initialize the environment
 
         Args:
             settings (Settings):  Settings object
+            resume (bool, optional): Continue from the last checkpoint. Defaults to False.
         """
         self.logger = Logger()
         self.settings = settings
@@ -47,33 +61,118 @@ class Environment():
         self.exportRandomName = settings.getBool("Program", "randomExportName")
         self.exportName = settings.getItem("Program", "exportName", str)
         self.exportFolder = settings.getItem("Program", "exportFolder", str)
+        self.maxFps = settings.getItem("Graphics", "maxFps", int)
+        self.generationWorkers = settings.getItem(
+            "Program", "generationWorkers", int)
+        self.generationQueueSize = settings.getItem(
+            "Program", "generationQueueSize", int)
+
+        self.deadline = settings.getItem("Deadline", "seconds", float)
+        self.detailLevels = settings.getList("Deadline", "detailLevels", float)
+        self.showEta = settings.getBool("Deadline", "showEta")
+        # level of detail of the current render, lowered to meet the deadline
+        self.detail = 1
+        self.renderStartTime = 0
+
+        self.backend = settings.getItem("Program", "backend", str)
+        self.vectorMode = self.backend != "raster"
+
+        self.animate = settings.getBool("Animation", "animate")
+        self.animationOutput = settings.getItem("Animation", "output", str)
+        self.animator: Animator = None
+        self.animationStream = None
+        if self.animate and self.animationOutput == "-":
+            self.animationStream = sys.stdout.buffer
+        # frames are written into stdout, so messages go to stderr
+        redirectPrints(settings)
+
+        self.checkpointActive = settings.getBool("Program", "checkpoint")
+        self.checkpoint = Checkpoint(
+            "../" + settings.getItem("Program", "checkpointFolder", str))
+        self.resumeState = None
+
+        # seed of the mandala, None for a new random seed on every render
+        self.fixedSeed: int = None
+        seed = settings.getItem("Program", "seed", str).strip()
+        if seed:
+            self.fixedSeed = int(seed)
+        self.seed: int = None
+        # number of rerolls in this session, each gets its own stream
+        self.rerolls = 0
 
         self.exited = False
 
         self.renderThread = None
 
-        self.renderingEvent = Event()
-        self.restartEvent = Event()
-        self.saveEvent = Event()
+        self.layerGenerator: LayerGenerator = None
+        self.layerCache = LayerCache()
+        self.selectedLayer: int = None
+
+        # set while the rendering thread is running
+        self.rendering = threading.Event()
+        # cancelled when the rendering thread should stop as soon as possible
+        self.token = CancellationToken()
+        # set from a restart until the new rendering thread is started
+        self.restarting = threading.Event()
+        # set when the screen is exported once the rendering has finished
+        self.saveQueued = threading.Event()
 
         if self.exportMode:
-            self.saveEvent.queued = True
+            self.saveQueued.set()
 
-        pygame.init()
-        pygame.display.set_caption("Gendala")
-        self.surf = pygame.display.set_mode(
-            size=settings.getList("Program", "resolution", int),
-            flags=displayFlags
-        )
+        resolution = settings.getList("Program", "resolution", int)
 
-        self.display = Display(
-            self.surf,
-            settings,
-            self.logger
-        )
+        if self.vectorMode:
+            if self.backend == "svg":
+                backendClass = SVGBackend
+            elif self.backend == "pdf":
+                backendClass = PDFBackend
+            else:
+                raise ValueError("Invalid backend: " + self.backend)
+            self.surf = None
+            self.display = backendClass(
+                self.exportPath("." + self.backend),
+                resolution[0],
+                resolution[1],
+                settings,
+                self.logger)
+            if self.checkpointActive or resume:
+                print("Checkpoints are not supported with vector backends.")
+            self.checkpointActive = False
+            resume = False
+        else:
+            pygame.init()
+            pygame.display.set_caption("Gendala")
+            self.surf = pygame.display.set_mode(
+                size=resolution,
+                flags=displayFlags
+            )
+            # mouse movement would only wake up the event loop
+            pygame.event.set_blocked(pygame.MOUSEMOTION)
+
+            self.display = Display(
+                self.surf,
+                settings,
+                self.logger
+            )
+
+        if self.animate:
+            if self.vectorMode:
+                print("Animation is not supported with vector backends.")
+            elif animation.numpy is None:
+                print("Animation needs numpy.")
+            else:
+                self.animator = Animator(self.display, settings, self.logger)
 
         print(settings)
 
+        if resume:
+            self.resumeState = self.checkpoint.load(
+                [self.surf.get_width(), self.surf.get_height()],
+                self.display.deferred)
+            if self.resumeState is None:
+                print("No checkpoint to resume, starting a new render.")
+
     def debugRender(self) -> None:
         """
         Drawign function for debugging
@@ -110,52 +209,223 @@ class Environment():
         """
         Generate and render a set of layers
         """
-        layers: List[Tuple[float, float]] = []
-        r0 = 0.02
-        w0 = 0.02
-        wp = 0
-        r = r0
-        n = 1
-        widthGrowRate = 1.05
-        while r < self.display.maxRadius():
-            w = w0 * widthGrowRate**n
-            r = r0 + wp + w
-            layers.append((r, w))
-            r0 = r
-            wp = w
-            n += 1
-
-        self.logger.setMaxLayer(len(layers))
-
-        g = LayerGenerator(self.settings, self.logger)
-
-        n = 1
-
-        for r, w in layers:
-
-            self.logger.setLayer(n)
-
-            if self.restartEvent.active:
-                break
-
-            self.logger.layerPrint(f"Generating Layer {n}...")
-
-            l = g.getLayer(radius=r, width=w)
-
-            self.logger.layerPrint("Done.")
-
-            if self.restartEvent.active:
-                break
+        sizes = layerSizes(self.display.maxRadius())
+
+        self.logger.setMaxLayer(len(sizes))
+
+        if self.layerGenerator is not None:
+            self.layerGenerator.close()
+        g = LayerGenerator(self.settings, self.logger, self.token)
+        self.layerGenerator = g
+        self.layerCache.clear()
+        self.selectedLayer = None
+
+        firstLayer = 1
+        resumeState = self.resumeState
+        self.resumeState = None
+
+        model = None
+        if self.deadline > 0 or self.showEta:
+            model = CostModel(self.settings, self.logger, self.token)
+            model.calibrate(self.display)
+        if resumeState is not None:
+            # the remaining layers are planned as in the interrupted render
+            self.detail = resumeState.get("detail", 1)
+            g.detail = self.detail
+            plans = planLayers(g, self.seed, sizes)
+        elif self.deadline > 0:
+            left = self.deadline - (time.monotonic() - self.renderStartTime)
+            self.detail, plans = model.fitDeadline(
+                g,
+                self.seed,
+                sizes,
+                left,
+                self.generationWorkers,
+                self.detailLevels)
+            print(f"Level of detail {self.detail} for {left:.1f} s left.")
+        else:
+            self.detail = 1
+            plans = planLayers(g, self.seed, sizes)
+
+        if resumeState is not None:
+            firstLayer = resumeState["layer"] + 1
+            if self.display.deferred:
+                self.layerCache.base = self.display.getCoverage()
+            print(f"Resuming after layer {resumeState['layer']}.")
+        elif self.checkpointActive:
+            self.checkpoint.clear()
+
+        if self.animator is not None:
+            self.animator.clear()
+            self.animator.random.seed(f"{self.seed}:animation")
+            for index in range(1, firstLayer):
+                self.animator.addLayer(
+                    self.checkpoint.loadLayer(index), self.token)
+
+        if model is not None:
+            self.logger.setEstimates({
+                plan.index: model.predict(plan).seconds(self.generationWorkers)
+                for plan in plans[firstLayer - 1:]})
+        else:
+            self.logger.setEstimates(None)
+
+        producer = LayerProducer(
+            self.settings,
+            self.logger,
+            g,
+            plans[firstLayer - 1:],
+            token=self.token,
+            workers=self.generationWorkers,
+            queueSize=self.generationQueueSize)
+
+        with producer:
+            for generated in producer:
+
+                plan = generated.plan
+                n = plan.index
+                l = generated.layer
+                self.logger.setLayer(n)
+
+                if self.token.isCancelled():
+                    break
 
-            self.logger.layerPrint("Rendering Layer...")
+                self.logger.layerPrint("Rendering Layer...")
+
+                self.display.beginLayer()
+                l.render(self.display, self.token)
+                raster = self.display.endLayer(l.bounds())
+
+                self.logger.layerPrint("Done.")
+                self.logger.progressPrint()
+
+                if self.animator is not None:
+                    self.animator.addLayer(l, self.token)
+
+                if raster is not None:
+                    rect, coverage = raster
+                    self.layerCache.add(LayerRecord(
+                        index=n,
+                        radius=plan.radius,
+                        width=plan.width,
+                        repeats=l.ribbon.n,
+                        randomState=plan.randomState,
+                        plan=plan,
+                        rect=rect,
+                        coverage=coverage))
+
+                removed = self.display.takeRemovedLines()
+                if removed:
+                    self.logger.layerPrint(
+                        f"Level of detail removed {removed} lines.")
+
+                if self.checkpointActive and not self.token.isCancelled():
+                    self.checkpoint.save(
+                        index=n,
+                        layer=l,
+                        seed=self.seed,
+                        colors=self.display.getColors(),
+                        surf=self.display.getFramebuffer(),
+                        deferred=self.display.deferred,
+                        detail=self.detail)
+
+        if self.animator is not None and not self.token.isCancelled():
+            self.writeAnimation()
+
+    def writeAnimation(self) -> None:
+        """
+        Write the frames of the animation of the rendered layers.
+        """
+        self.logger.layerPrint("Writing animation...")
+        stream = self.animationStream
+        path = "standard output"
+        if stream is None:
+            path = "../" + self.exportFolder + "/" + self.animationOutput
+            stream = open(path, "wb")
+        frames = self.animator.write(
+            stream, cancelled=self.token.isCancelled)
+        if self.animationStream is None:
+            stream.close()
+        self.logger.layerPrint(
+            f"Done, wrote {frames} frames of {self.display.width}x"
+            f"{self.display.height} rgb24 into {path}.")
+
+    def rerollLayer(self, index: int) -> None:
+        """
+        Generate a new version of a rendered layer and composite the cached
+        layers again, without rendering the other layers.
 
-            l.render(self.display)
+        The layer follows its original plan with a new random stream, so its
+        complexity, repeats and divider still fit the neighbouring layers.
 
+        Args:
+            index (int): Index of the layer
+        """
+        record = self.layerCache.get(index)
+        g = self.layerGenerator
+        self.logger.setLayer(index)
+        self.logger.layerPrint(f"Rerolling Layer {index}...")
+
+        self.rerolls += 1
+        seedStream(self.seed, f"layer{index}:reroll{self.rerolls}")
+        randomState = random.getstate()
+        plan = record.plan
+        l = g.getLayer(plan.radius, plan.width, plan)
+
+        self.display.beginLayer()
+        try:
+            l.render(self.display, self.token)
+        finally:
+            # a cancelled layer is ended too, without blending it
+            raster = self.display.endLayer(l.bounds(), blend=False)
+            self.display.takeRemovedLines()
+
+        if not self.token.isCancelled():
+            rect, coverage = raster
+            self.layerCache.add(LayerRecord(
+                index=index,
+                radius=record.radius,
+                width=record.width,
+                repeats=l.ribbon.n,
+                randomState=randomState,
+                plan=plan,
+                rect=rect,
+                coverage=coverage))
+            self.display.composite(
+                self.layerCache.base, self.layerCache.layers())
+            if self.checkpointActive:
+                self.checkpoint.replaceLayer(
+                    index, l, self.display.getFramebuffer())
             self.logger.layerPrint("Done.")
 
-            self.display.flushBuffer()
+    def startReroll(self) -> None:
+        """
+        Start rerolling the selected layer in the rendering thread
+        """
+        if self.rendering.is_set() or self.restarting.is_set():
+            print("Rerolling is possible once the rendering is finished.")
+            return
+        if not self.display.deferred:
+            print("Rerolling layers requires deferredShading.")
+            return
+        if self.layerCache.get(self.selectedLayer) is None:
+            print("Select a layer rendered in this session first.")
+            return
+        self.startThread(self.rerollLayer, self.selectedLayer)
+
+    def selectLayer(self, pos: Tuple[int, int]) -> None:
+        """
+        Select the cached layer under a screen position.
 
-            n += 1
+        Args:
+            pos (Tuple[int, int]): Screen position
+        """
+        distance = Point(pos[0], pos[1]).distanceTo(
+            Point(self.display.width / 2, self.display.height / 2))
+        record = self.layerCache.layerAt(distance / self.display.scale)
+        if record is None:
+            return
+        self.selectedLayer = record.index
+        print(f"Selected layer {record.index}, press L to reroll it.")
 
     def generateRenderFunction(
             self,
@@ -170,38 +440,82 @@ class Environment():
             Callable[[], None]: a function to be given for the rendering thread
         """
         def rend():
-            self.renderingEvent.active = True
+            self.renderStartTime = time.monotonic()
+            self.rerolls = 0
+            if self.resumeState is not None:
+                self.seed = self.resumeState["seed"]
+            elif self.fixedSeed is not None:
+                self.seed = self.fixedSeed
+            else:
+                self.seed = random.SystemRandom().randrange(2**32)
+            print(f"Seed: {self.seed}")
             if self.debugActive:
                 self.display.clear()
+            elif self.resumeState is not None:
+                self.display.setColors(self.resumeState["colors"])
+                self.display.drawImage(self.resumeState["framebuffer"])
             else:
-                self.display.generateColors()
+                seedStream(self.seed, "colors")
+                self.display.generateColors(self.token)
                 self.display.gradient()
             renderFunction()
-            self.renderingEvent.active = False
 
         return rend
 
+    def startThread(self, function: Callable, *args) -> None:
+        """
+        Run a function in the rendering thread. renderFinishedEvent is
+        posted when it returns, also when it is stopped by the token.
+
+        Args:
+            function (Callable): Function to run
+            args: Arguments of the function
+        """
+        def run():
+            try:
+                function(*args)
+            except Cancelled:
+                pass
+            finally:
+                self.rendering.clear()
+                pygame.event.post(pygame.event.Event(renderFinishedEvent))
+
+        self.rendering.set()
+        self.renderThread = threading.Thread(target=run)
+        self.renderThread.start()
+
     def startRender(self):
         """
         Start the rendering thread
         """
         if self.debugActive:
-            self.renderThread = threading.Thread(
-                target=self.generateRenderFunction(
-                    self.debugRender))
+            self.startThread(self.generateRenderFunction(self.debugRender))
         else:
-            self.renderThread = threading.Thread(
-                target=self.generateRenderFunction(self.layers))
-
-        self.renderThread.start()
+            self.startThread(self.generateRenderFunction(self.layers))
 
     def run(self):
         """
-        Start the event loop
+        Start the event loop, or in vector mode, render straight into
+        the vector file without opening a window.
         """
+        if self.vectorMode:
+            self.renderVector()
+            return
         self.startRender()
         self.eventLoop()
 
+    def renderVector(self):
+        """
+        Render everything into the vector file and close it.
+        """
+        if self.debugActive:
+            self.generateRenderFunction(self.debugRender)()
+        else:
+            self.generateRenderFunction(self.layers)()
+            self.layerGenerator.close()
+        self.display.close()
+        print("Exported into: " + self.display.path)
+
     def debug(self):
         """
         Start the event loop with debug rendering
@@ -211,57 +525,124 @@ class Environment():
 
     def restartRender(self):
         """
-        Clear the screen and start rendering a new set of layers
+        Stop the rendering thread. Rendering a new set of layers is started
+        by finishRestart once the thread has finished.
         """
-        self.restartEvent.queued = True
-        self.restartEvent.active = True
+        if self.restarting.is_set():
+            return
+        self.restarting.set()
+        self.saveQueued.clear()
+        self.token.cancel()
         self.display.disableRender()
+        if not self.rendering.is_set():
+            self.finishRestart()
+
+    def finishRestart(self):
+        """
+        Clear the screen and start rendering a new set of layers
+        """
         self.renderThread.join()
-        if not self.exited:
-            self.restartEvent.active = False
-            self.display.enableRender()
-            self.saveEvent.queued = False
-            self.startRender()
-            self.restartEvent.queued = False
+        self.token.reset()
+        self.display.enableRender()
+        self.startRender()
+        self.restarting.clear()
+
+    def exportPath(self, extension: str) -> str:
+        """
+        Get the path of an exported file with the export name and the
+        given extension.
+
+        Args:
+            extension (str): File extension, including the dot
+
+        Returns:
+            str: Path to the file in the export folder
+        """
+        if self.exportRandomName:
+            name = str(uuid.uuid4())
+        else:
+            name = os.path.splitext(self.exportName)[0]
+        return "../" + self.exportFolder + "/" + name + extension
 
     def exportScreen(self):
         name = str(uuid.uuid4()) + \
             ".png" if self.exportRandomName else self.exportName
         path = "../" + self.exportFolder + "/" + name
-        pygame.image.save(self.surf, path)
+        with self.display.lock:
+            pygame.image.save(self.surf, path)
         print("Exported into: " + path)
 
     def eventLoop(self):
         """
-        Blocking event loop
+        Blocking event loop.
+
+        The loop sleeps until an event arrives or the window is due to be
+        updated. The window is updated at most maxFps times per second, and
+        never in export mode.
         """
+        frameTime = 1000 // self.maxFps if self.maxFps > 0 else 1
+        nextPresent = 0
         while not self.exited:
+            if self.exportMode:
+                event = pygame.event.wait()
+            else:
+                timeout = max(1, nextPresent - pygame.time.get_ticks())
+                event = pygame.event.wait(timeout)
+                if pygame.time.get_ticks() >= nextPresent:
+                    self.display.present()
+                    nextPresent = pygame.time.get_ticks() + frameTime
+            self.handleEvent(event)
+        if self.renderThread is not None:
+            self.renderThread.join()
+        if self.layerGenerator is not None:
+            self.layerGenerator.close()
+
+    def handleEvent(self, event: pygame.event.Event) -> None:
+        """
+        Handle an event of the event loop.
 
-            if self.saveEvent.queued and not self.saveEvent.active and not self.renderingEvent.active:
-                self.saveEvent.active = True
-                self.exportScreen()
-                if self.exportMode:
-                    self.exited = True
-                self.saveEvent.active = False
-                self.saveEvent.queued = False
-
-            for event in pygame.event.get():
-
-                if event.type == pygame.QUIT:
-
-                    self.exited = True
-                    self.restartEvent.active = True
-                    self.display.disableRender()
-                    break
-
-                if event.type == pygame.KEYDOWN:
-
-                    if event.key == pygame.K_r:
-                        if not self.restartEvent.queued:
-                            thread = threading.Thread(
-                                target=self.restartRender)
-                            thread.start()
-
-                    elif event.key == pygame.K_s:
-                        if not self.saveEvent.queued:
-                            self.saveEvent.queued = True
+        Args:
+            event (pygame.event.Event): Event to handle
+        """
+        if event.type == pygame.QUIT:
+            self.exited = True
+            self.token.cancel()
+            self.display.disableRender()
+
+        elif event.type == renderFinishedEvent:
+            if self.restarting.is_set():
+                self.finishRestart()
+            elif self.saveQueued.is_set():
+                pygame.event.post(pygame.event.Event(saveEvent))
+
+        elif event.type == saveEvent:
+            if self.rendering.is_set() or self.restarting.is_set():
+                self.saveQueued.set()
+                return
+            self.saveQueued.clear()
+            self.exportScreen()
+            if self.exportMode:
+                self.exited = True
+
+        elif event.type == restartEvent:
+            self.restartRender()
+
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self.selectLayer(event.pos)
+
+        elif event.type == pygame.KEYDOWN:
+
+            if event.key == pygame.K_r:
+                pygame.event.post(pygame.event.Event(restartEvent))
+
+            elif event.key == pygame.K_s:
+                pygame.event.post(pygame.event.Event(saveEvent))
+
+            elif event.key == pygame.K_l:
+                self.startReroll()
+
+            elif event.key == pygame.K_c:
+                if self.rendering.is_set():
+                    print("Recoloring is possible once the rendering is finished.")
+                elif not self.display.recolor():
+                    print("Recoloring requires deferredShading.")
@@ -0,0 +1,118 @@
+from typing import List, Tuple
+from generation.plan import LayerPlan
+
+
+class LayerRecord:
+    """
+    LayerRecord stores the rendered coverage of a layer together with the
+    inputs it was generated from.
+    """
+
+    def __init__(
+            self,
+            index: int,
+            radius: float,
+            width: float,
+            repeats: int,
+            randomState: object,
+            plan: LayerPlan,
+            rect: Tuple[int, int, int, int],
+            coverage) -> None:
+        """
+        Initialize the record
+
+        Args:
+            index (int): Index of the layer, starting from 1
+            radius (float): Radius of the layer
+            width (float): Width of the layer
+            repeats (int): Number of repeated patterns in the layer
+            randomState (object): State of the random module before the layer was generated
+            plan (LayerPlan): Plan the layer was generated from
+            rect (Tuple[int, int, int, int]): Screen area of the coverage as x0, y0, x1, y1
+            coverage (numpy array): Coverage of the layer inside rect
+        """
+        self.index = index
+        self.radius = radius
+        self.width = width
+        self.repeats = repeats
+        self.randomState = randomState
+        self.plan = plan
+        self.rect = rect
+        self.coverage = coverage
+
+
+class LayerCache:
+    """
+    LayerCache keeps the coverage of every layer rendered in this session,
+    so that a single layer can be replaced and the image composited again
+    without rendering the other layers.
+
+    Layers that were not rendered in this session, for example layers
+    restored from a checkpoint, are kept merged in a single base coverage.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty cache
+        """
+        self.records: List[LayerRecord] = []
+        self.base = None
+
+    def clear(self) -> None:
+        """
+        Remove all layers and the base coverage.
+        """
+        self.records = []
+        self.base = None
+
+    def add(self, record: LayerRecord) -> None:
+        """
+        Add a layer, replacing a cached layer with the same index.
+
+        Args:
+            record (LayerRecord): Layer to add
+        """
+        for i, cached in enumerate(self.records):
+            if cached.index == record.index:
+                self.records[i] = record
+                return
+        self.records.append(record)
+
+    def get(self, index: int) -> LayerRecord:
+        """
+        Get a cached layer.
+
+        Args:
+            index (int): Index of the layer
+
+        Returns:
+            LayerRecord: The layer, or None if it is not cached
+        """
+        for record in self.records:
+            if record.index == index:
+                return record
+        return None
+
+    def layerAt(self, distance: float) -> LayerRecord:
+        """
+        Get the cached layer at a distance from the center.
+
+        Args:
+            distance (float): Distance from the center in the geospace of the screen
+
+        Returns:
+            LayerRecord: The layer, or None if no cached layer is there
+        """
+        for record in self.records:
+            if abs(distance - record.radius) <= record.width / 2:
+                return record
+        return None
+
+    def layers(self) -> List[Tuple[Tuple[int, int, int, int], object]]:
+        """
+        Get the coverage of all cached layers in rendering order.
+
+        Returns:
+            List[Tuple[Tuple[int, int, int, int], object]]: Screen area and coverage of each layer
+        """
+        return [(r.rect, r.coverage) for r in self.records]
@@ -0,0 +1,104 @@
+from array import array
+from typing import Iterator, List, Tuple
+from geometry.point import Point
+
+# Number of fixed point steps per pixel
+fixedPointScale = 16
+# Limits of the stored coordinates
+coordinateLimit = 2**31 - 1
+# Array typecodes of 32-bit signed and unsigned integers, the size of int
+# and long depends on the platform
+int32Code = 'i' if array('i').itemsize == 4 else 'l'
+uint32Code = 'I' if array('I').itemsize == 4 else 'L'
+assert array(int32Code).itemsize == 4 and array(uint32Code).itemsize == 4
+
+
+class LineBuffer:
+    """
+    Compact buffer of screen space runs of connected points.
+
+    Coordinates are stored as int32 fixed point numbers with a precision of
+    1/fixedPointScale pixels, and every run has a uint16 color index and the
+    index of its last point. Memory use per line:
+
+        List of Line objects (two Points each):    ~670 bytes
+        List of two point runs (Points):           ~350 bytes
+        LineBuffer, separate lines:                  22 bytes
+        LineBuffer, lines inside long runs:          ~8 bytes
+
+    All arrays grow with amortized constant time appends, and runs() hands
+    out memoryviews of the stored coordinates without copying them.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty buffer
+        """
+        self.coords = array(int32Code)
+        self.runEnds = array(uint32Code)
+        self.colors = array('H')
+
+    def append(self, points: List[Point], color: int) -> None:
+        """
+        Add a run of connected points.
+
+        Args:
+            points (List[Point]): Screen space points, at least two
+            color (int): Color index of the run
+        """
+        for p in points:
+            self.coords.append(
+                max(-coordinateLimit,
+                    min(coordinateLimit, round(p.x * fixedPointScale))))
+            self.coords.append(
+                max(-coordinateLimit,
+                    min(coordinateLimit, round(p.y * fixedPointScale))))
+        self.runEnds.append(len(self.coords) // 2)
+        self.colors.append(color)
+
+    def runs(self) -> Iterator[Tuple[memoryview, int]]:
+        """
+        Iterate over the stored runs.
+
+        The buffer can not be modified before the iteration has finished.
+
+        Yields:
+            Tuple[memoryview, int]: Fixed point coordinates x0, y0, x1, y1...
+            and the color index of a run
+        """
+        with memoryview(self.coords) as coords:
+            start = 0
+            for end, color in zip(self.runEnds, self.colors):
+                yield coords[start * 2:end * 2], color
+                start = end
+
+    def clear(self) -> None:
+        """
+        Remove all runs.
+        """
+        del self.coords[:]
+        del self.runEnds[:]
+        del self.colors[:]
+
+    def lineCount(self) -> int:
+        """
+        Return the number of buffered lines.
+
+        Returns:
+            int: Number of lines
+        """
+        return len(self.coords) // 2 - len(self.runEnds)
+
+    def nbytes(self) -> int:
+        """
+        Return the number of bytes used by the buffered data.
+
+        Returns:
+            int: Number of bytes
+        """
+        return (len(self.coords) * self.coords.itemsize +
+                len(self.runEnds) * self.runEnds.itemsize +
+                len(self.colors) * self.colors.itemsize)
+
+    def __len__(self) -> int:
+        return len(self.runEnds)
@@ -0,0 +1,237 @@
+import multiprocessing
+import random
+from array import array
+from collections import deque
+from typing import Iterator, List
+from common.cancellation import CancellationToken
+from common.settings import Settings
+from common.utility import Logger, redirectPrints
+from generation.layer import LayerGenerator
+from generation.plan import LayerPlan
+from geometry.point import Point
+from hierarchy.layer import Layer
+from hierarchy.pattern import Pattern
+
+# Seconds between cancellation checks while waiting for a layer
+pollInterval = 0.05
+
+# Generator and logger of a worker process, set by initWorker
+workerGenerator: LayerGenerator = None
+workerLogger: Logger = None
+
+
+class GeneratedLayer:
+    """
+    GeneratedLayer is a generated layer together with its plan.
+
+    When pickled, the pattern of the layer is packed into flat arrays of
+    coordinates and run ends, and the layer is built again from them on
+    the receiving side. This is much smaller and faster to send between
+    processes than the Point objects, and gives the same geometry.
+    """
+
+    def __init__(self, plan: LayerPlan, layer: Layer) -> None:
+        """
+        Initialize the generated layer
+
+        Args:
+            plan (LayerPlan): Plan the layer was generated from
+            layer (Layer): The layer
+        """
+        self.plan = plan
+        self.layer = layer
+
+    def __getstate__(self):
+        coords = array('d')
+        runEnds = array('I')
+        for run in self.layer.ribbon.pattern.runs:
+            for p in run:
+                coords.append(p.x)
+                coords.append(p.y)
+            runEnds.append(len(coords) // 2)
+        return (self.plan, coords, runEnds)
+
+    def __setstate__(self, state) -> None:
+        self.plan, coords, runEnds = state
+        pattern = Pattern()
+        start = 0
+        for end in runEnds:
+            pattern.runs.append([
+                Point(coords[2 * i], coords[2 * i + 1])
+                for i in range(start, end)])
+            start = end
+        pattern.updateLimits()
+        self.layer = Layer(
+            radius=self.plan.radius,
+            width=self.plan.width,
+            pattern=pattern,
+            repeats=self.plan.repeats,
+            subDivs=self.plan.subDivs)
+
+
+class LayerProducer:
+    """
+    LayerProducer generates planned layers and hands them out in order.
+
+    Every layer is generated from its own plan and random stream, so the
+    layers can be generated in any order and in any process. With worker
+    processes, the layers are generated ahead in a process pool while the
+    previous ones are rendered, and at most queueSize layers wait to be
+    rendered. The layers are the same with any number of workers.
+
+    Use as a context manager, so that the worker processes are stopped
+    when the layers are not iterated to the end.
+    """
+
+    def __init__(
+            self,
+            settings: Settings,
+            logger: Logger,
+            generator: LayerGenerator,
+            plans: List[LayerPlan],
+            token: CancellationToken = None,
+            workers: int = 0,
+            queueSize: int = 2) -> None:
+        """
+        Initialize the producer
+
+        Args:
+            settings (Settings): Settings object
+            logger (Logger): Logger object
+            generator (LayerGenerator): Generator used without worker processes
+            plans (List[LayerPlan]): Plans of the layers to generate
+            token (CancellationToken, optional): Token that stops the generation. Defaults to one that is never cancelled.
+            workers (int, optional): Number of worker processes, 0 generates the layers in this thread. Defaults to 0.
+            queueSize (int, optional): Largest number of generated layers waiting to be rendered. Defaults to 2.
+        """
+        self.settings = settings
+        self.logger = logger
+        self.generator = generator
+        self.plans = plans
+        self.token = token if token is not None else CancellationToken()
+        self.workers = workers
+        self.queueSize = queueSize
+        self.iterator: Iterator[GeneratedLayer] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[GeneratedLayer]:
+        if self.workers > 0:
+            self.iterator = self.receiveLayers()
+        else:
+            self.iterator = self.generateLayers()
+        return self.iterator
+
+    def generateLayers(self) -> Iterator[GeneratedLayer]:
+        """
+        Generate the layers in this thread.
+
+        Yields:
+            GeneratedLayer: Next layer
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        for plan in self.plans:
+            self.token.check()
+            yield generateLayer(self.generator, self.logger, plan)
+
+    def receiveLayers(self) -> Iterator[GeneratedLayer]:
+        """
+        Generate the layers in a pool of worker processes.
+
+        Yields:
+            GeneratedLayer: Next layer
+
+        Raises:
+            Cancelled: If the token is cancelled
+        """
+        # forking a process with running threads can deadlock the child
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+                self.workers,
+                initializer=initWorker,
+                initargs=(self.settings, self.logger.maxLayer)) as pool:
+            plans = iter(self.plans)
+            pending = deque()
+            while True:
+                while len(pending) < self.workers + self.queueSize:
+                    plan = next(plans, None)
+                    if plan is None:
+                        break
+                    pending.append(
+                        pool.apply_async(generateWorkerLayer, (plan,)))
+                if not pending:
+                    break
+                while True:
+                    self.token.check()
+                    try:
+                        generated = pending[0].get(pollInterval)
+                    except multiprocessing.TimeoutError:
+                        continue
+                    break
+                pending.popleft()
+                yield generated
+
+    def close(self) -> None:
+        """
+        Stop generating, and stop the worker processes if they are running.
+        """
+        if self.iterator is not None:
+            self.iterator.close()
+            self.iterator = None
+
+
+def generateLayer(
+        generator: LayerGenerator,
+        logger: Logger,
+        plan: LayerPlan) -> GeneratedLayer:
+    """
+    Generate a layer from its plan.
+
+    Args:
+        generator (LayerGenerator): Generator to use
+        logger (Logger): Logger object
+        plan (LayerPlan): Plan of the layer
+
+    Returns:
+        GeneratedLayer: The layer
+    """
+    random.setstate(plan.randomState)
+    logger.setLayer(plan.index)
+    logger.layerPrint(f"Generating Layer {plan.index}...")
+    layer = generator.getLayer(plan.radius, plan.width, plan)
+    logger.layerPrint("Done.")
+    return GeneratedLayer(plan, layer)
+
+
+def initWorker(settings: Settings, maxLayer: int) -> None:
+    """
+    Create the generator of a worker process.
+
+    Args:
+        settings (Settings): Settings object
+        maxLayer (int): Number of layers, for the log messages
+    """
+    global workerGenerator, workerLogger
+    redirectPrints(settings)
+    workerLogger = Logger()
+    workerLogger.setMaxLayer(maxLayer)
+    workerGenerator = LayerGenerator(settings, workerLogger)
+
+
+def generateWorkerLayer(plan: LayerPlan) -> GeneratedLayer:
+    """
+    Generate a layer in a worker process.
+
+    Args:
+        plan (LayerPlan): Plan of the layer
+
+    Returns:
+        GeneratedLayer: The layer
+    """
+    return generateLayer(workerGenerator, workerLogger, plan)
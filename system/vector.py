@@ -0,0 +1,312 @@
+from abc import abstractmethod
+from math import hypot
+from typing import Dict, List, Tuple
+from geometry.point import Point
+from common.utility import Color, Logger
+from common.settings import Settings
+from system.backend import Backend, paletteSize
+
+# Largest number of points kept in memory before the paths are written
+maxPathPoints = 20000
+# Number of foreground colors between the center and the corners. Fewer
+# colors than in the palette let more runs be coalesced into one path.
+colorSteps = 128
+
+
+class VectorBackend(Backend):
+    """
+    VectorBackend writes the lines into a vector image file as they are
+    drawn.
+
+    Runs of the same color are coalesced into one path. At most
+    maxPathPoints points are kept in memory before the paths are written
+    into the file, so memory use does not depend on the size of the image.
+    The document is started by clear or gradient and finished by close.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            width: int,
+            height: int,
+            settings: Settings,
+            logger: Logger) -> None:
+        """
+        Initialize the backend.
+
+        Args:
+            path (str): Path of the output file
+            width (int): Width of the image in pixels
+            height (int): Height of the image in pixels
+            settings (Settings): Settings object
+            logger (Logger): Logger object
+        """
+        super().__init__(width, height, settings, logger)
+        self.path = path
+        self.lineWidth = settings.getItem("Graphics", "vectorLineWidth", float)
+        self.file = None
+        self.paths: Dict[Tuple[int, int, int], List[List[Point]]] = {}
+        self.pathPoints = 0
+
+    def emitRun(self, points: List[Point], color: int) -> None:
+        """
+        Add a screen space run to the path of its color. All paths are
+        written when they hold too many points.
+
+        Args:
+            points (List[Point]): Screen space points, at least two
+            color (int): Palette index of the color of the run
+        """
+        if self.file is None:
+            return
+        if color < paletteSize:
+            step = (paletteSize - 1) / (colorSteps - 1)
+            color = round(round(color / step) * step)
+        rgb = self.getPalette()[color]
+        self.paths.setdefault(rgb, []).append(points)
+        self.pathPoints += len(points)
+        if self.pathPoints >= maxPathPoints:
+            self.writePaths()
+
+    def writePaths(self) -> None:
+        """
+        Write the paths into the file.
+        """
+        for rgb, runs in self.paths.items():
+            self.writeRuns(rgb, runs)
+        self.paths = {}
+        self.pathPoints = 0
+
+    def flushBuffer(self) -> None:
+        """
+        Write the paths and flush the file.
+        """
+        if self.file is None:
+            return
+        self.writePaths()
+        self.file.flush()
+
+    def begin(self, c0: Color, c1: Color) -> None:
+        """
+        Start a new document, replacing the previous one.
+
+        Args:
+            c0 (Color): Background color at the center
+            c1 (Color): Background color at the corners
+        """
+        if self.file is not None:
+            self.file.close()
+        self.paths = {}
+        self.pathPoints = 0
+        self.file = open(self.path, "wb")
+        self.writeHeader(c0, c1)
+
+    def close(self) -> None:
+        """
+        Finish the document and close the file.
+        """
+        if self.file is None:
+            return
+        self.writePaths()
+        self.writeFooter()
+        self.file.close()
+        self.file = None
+
+    def clear(self) -> None:
+        """
+        Start a new document with a black background.
+        """
+        black = Color(0, 0, 0)
+        self.begin(black, black)
+
+    def gradient(self) -> None:
+        """
+        Start a new document with a radial gradient background.
+        """
+        self.begin(self.bgC0, self.bgC1)
+
+    def gradientRadius(self) -> float:
+        """
+        Get the radius of the background gradient, which reaches the
+        corners of the image.
+
+        Returns:
+            float: Radius in pixels
+        """
+        return int(hypot(self.width, self.height) / 2)
+
+    def write(self, text: str) -> None:
+        """
+        Write text into the file.
+
+        Args:
+            text (str): Text to write
+        """
+        self.file.write(text.encode("ascii"))
+
+    @abstractmethod
+    def writeHeader(self, c0: Color, c1: Color) -> None:
+        """
+        Write the beginning of the document and the background.
+
+        Args:
+            c0 (Color): Background color at the center
+            c1 (Color): Background color at the corners
+        """
+
+    @abstractmethod
+    def writeRuns(
+            self,
+            rgb: Tuple[int, int, int],
+            runs: List[List[Point]]) -> None:
+        """
+        Write runs of the same color as one path.
+
+        Args:
+            rgb (Tuple[int, int, int]): Color of the path
+            runs (List[List[Point]]): Screen space runs
+        """
+
+    @abstractmethod
+    def writeFooter(self) -> None:
+        """
+        Write the end of the document.
+        """
+
+
+class SVGBackend(VectorBackend):
+    """
+    SVGBackend writes an SVG image.
+    """
+
+    def writeHeader(self, c0: Color, c1: Color) -> None:
+        w = self.width
+        h = self.height
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" '
+            f'height="{h}" viewBox="0 0 {w} {h}">\n'
+            '<defs>\n'
+            '<radialGradient id="background" gradientUnits="userSpaceOnUse" '
+            f'cx="{w / 2}" cy="{h / 2}" r="{self.gradientRadius()}">\n'
+            f'<stop offset="0" stop-color="{self.colorCode(c0.rgb())}"/>\n'
+            f'<stop offset="1" stop-color="{self.colorCode(c1.rgb())}"/>\n'
+            '</radialGradient>\n'
+            '</defs>\n'
+            f'<rect width="{w}" height="{h}" fill="url(#background)"/>\n'
+            f'<g fill="none" stroke-width="{self.lineWidth}" '
+            'stroke-linecap="round" stroke-linejoin="round">\n')
+
+    def writeRuns(
+            self,
+            rgb: Tuple[int, int, int],
+            runs: List[List[Point]]) -> None:
+        self.write(f'<path stroke="{self.colorCode(rgb)}" d="')
+        for run in runs:
+            self.write("M" + " L".join(f"{p.x:.2f} {p.y:.2f}" for p in run))
+        self.write('"/>\n')
+
+    def writeFooter(self) -> None:
+        self.write('</g>\n</svg>\n')
+
+    @staticmethod
+    def colorCode(rgb: Tuple[int, int, int]) -> str:
+        """
+        Format a color as a hexadecimal color code.
+
+        Args:
+            rgb (Tuple[int, int, int]): Color
+
+        Returns:
+            str: Color code
+        """
+        return "#%02x%02x%02x" % rgb
+
+
+class PDFBackend(VectorBackend):
+    """
+    PDFBackend writes a single page PDF document.
+
+    The page content is written as one stream while the lines are drawn.
+    The rest of the objects and the cross reference table are written
+    when the document is closed.
+    """
+
+    def writeHeader(self, c0: Color, c1: Color) -> None:
+        self.offsets = {}
+        self.background = (c0, c1)
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.startObject(4)
+        self.write("<< /Length 5 0 R >>\nstream\n")
+        self.streamStart = self.file.tell()
+        self.write(
+            # flip the y axis so that screen coordinates can be used
+            f"1 0 0 -1 0 {self.height} cm\n"
+            f"{self.colorComponents(c1.rgb())} rg 0 0 {self.width} {self.height} re f\n"
+            "q /Background sh Q\n"
+            f"{self.lineWidth} w 1 J 1 j\n")
+
+    def writeRuns(
+            self,
+            rgb: Tuple[int, int, int],
+            runs: List[List[Point]]) -> None:
+        self.write(self.colorComponents(rgb) + " RG\n")
+        for run in runs:
+            self.write(f"{run[0].x:.2f} {run[0].y:.2f} m")
+            for p in run[1:]:
+                self.write(f" {p.x:.2f} {p.y:.2f} l")
+            self.write("\n")
+        self.write("S\n")
+
+    def writeFooter(self) -> None:
+        length = self.file.tell() - self.streamStart
+        self.write("endstream\nendobj\n")
+        self.startObject(5)
+        self.write(f"{length}\nendobj\n")
+        c0, c1 = self.background
+        self.startObject(6)
+        self.write(
+            "<< /ShadingType 3 /ColorSpace /DeviceRGB "
+            f"/Coords [{self.width / 2} {self.height / 2} 0 "
+            f"{self.width / 2} {self.height / 2} {self.gradientRadius()}] "
+            "/Function << /FunctionType 2 /Domain [0 1] "
+            f"/C0 [{self.colorComponents(c0.rgb())}] /C1 [{self.colorComponents(c1.rgb())}] /N 1 >> "
+            "/Extend [false false] >>\nendobj\n")
+        self.startObject(3)
+        self.write(
+            "<< /Type /Page /Parent 2 0 R "
+            f"/MediaBox [0 0 {self.width} {self.height}] /Contents 4 0 R "
+            "/Resources << /Shading << /Background 6 0 R >> >> >>\nendobj\n")
+        self.startObject(2)
+        self.write("<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n")
+        self.startObject(1)
+        self.write("<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        xref = self.file.tell()
+        self.write("xref\n0 7\n0000000000 65535 f \n")
+        for number in range(1, 7):
+            self.write(f"{self.offsets[number]:010d} 00000 n \n")
+        self.write(
+            f"trailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+
+    def startObject(self, number: int) -> None:
+        """
+        Start an indirect object and record its offset.
+
+        Args:
+            number (int): Object number
+        """
+        self.offsets[number] = self.file.tell()
+        self.write(f"{number} 0 obj\n")
+
+    @staticmethod
+    def colorComponents(rgb: Tuple[int, int, int]) -> str:
+        """
+        Format a color as PDF color components.
+
+        Args:
+            rgb (Tuple[int, int, int]): Color
+
+        Returns:
+            str: Red, green and blue between 0 and 1
+        """
+        return " ".join(f"{c / 255:.3f}" for c in rgb)
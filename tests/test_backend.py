@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from common.settings import Settings
+from common.utility import Logger
+from system.backend import Backend
+from system.vector import VectorBackend
+
+# Path to the settings file of the repository
+settingsPath = os.path.join(os.path.dirname(__file__), "..", "settings.ini")
+
+
+class TestBackend(unittest.TestCase):
+    """
+    Backends without all of the abstract methods can not be created.
+    """
+
+    def test_incompleteBackend(self) -> None:
+        class Incomplete(Backend):
+            def clear(self) -> None:
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(10, 10, Settings(settingsPath), Logger())
+
+    def test_incompleteVectorBackend(self) -> None:
+        class Incomplete(VectorBackend):
+            def writeHeader(self, c0, c1) -> None:
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(os.devnull, 10, 10, Settings(settingsPath), Logger())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from generation.bank import FeatureBank, numpy
+from geometry.point import Point
+from hierarchy.pattern import Pattern
+
+# Number of connection buckets of the test banks
+buckets = 8
+
+
+def randomPattern(rng: random.Random) -> Pattern:
+    """
+    Pattern of a few random runs with coordinates exact in float32.
+    """
+    pattern = Pattern()
+    for _ in range(rng.randint(1, 4)):
+        pattern.addRun([
+            Point(rng.randint(-64, 64) / 64, rng.randint(-64, 64) / 64)
+            for _ in range(rng.randint(2, 6))])
+    return pattern
+
+
+def coords(pattern: Pattern):
+    return [[(p.x, p.y) for p in run] for run in pattern.runs]
+
+
+@unittest.skipIf(numpy is None, "the feature bank needs numpy")
+class TestFeatureBank(unittest.TestCase):
+    """
+    FeatureBank saves features to memory-mapped files and draws them back
+    by their key.
+    """
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.path = os.path.join(self.folder.name, "bank")
+        self.rng = random.Random("bank test")
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def newBank(self, connectionOverride: bool = False) -> FeatureBank:
+        return FeatureBank(self.path, buckets, connectionOverride)
+
+    def test_buckets(self) -> None:
+        bank = self.newBank()
+        self.assertEqual(bank.bucket(None), -1)
+        self.assertEqual(bank.bucket(-1), 0)
+        self.assertEqual(bank.bucket(1), buckets - 1)
+        self.assertIsNone(bank.snap(None))
+        for y in (-1, -0.3, 0, 0.26, 1):
+            self.assertEqual(bank.bucket(bank.snap(y)), bank.bucket(y))
+            self.assertLessEqual(abs(bank.snap(y) - y), 1 / buckets)
+
+    def test_emptyLoad(self) -> None:
+        bank = self.newBank()
+        self.assertFalse(bank.load())
+        self.assertEqual(bank.size(), 0)
+        self.assertIsNone(bank.draw(bank.key(0, 0, False, False)))
+
+    def test_roundTrip(self) -> None:
+        bank = self.newBank()
+        key = bank.key(0.1, None, True, False)
+        pattern = randomPattern(self.rng)
+        bank.add(key, pattern)
+        bank.save()
+        self.assertEqual(bank.pending, [])
+        self.assertEqual(bank.size(), 1)
+        self.assertIsInstance(bank.points, numpy.memmap)
+
+        loaded = self.newBank()
+        self.assertTrue(loaded.load())
+        self.assertEqual(coords(loaded.draw(key)), coords(pattern))
+        self.assertIsNone(loaded.draw(loaded.key(0.1, None, False, False)))
+
+    def test_append(self) -> None:
+        bank = self.newBank()
+        saved = {}
+        for batch in range(3):
+            for _ in range(5):
+                key = bank.key(
+                    self.rng.uniform(-1, 1), None, batch == 1, False)
+                pattern = randomPattern(self.rng)
+                bank.add(key, pattern)
+                saved.setdefault(key, []).append(coords(pattern))
+            bank.save()
+        self.assertEqual(bank.size(), 15)
+
+        loaded = self.newBank()
+        self.assertTrue(loaded.load())
+        for key, patterns in saved.items():
+            for _ in range(20):
+                self.assertIn(coords(loaded.draw(key)), patterns)
+
+    def test_settingsMismatch(self) -> None:
+        bank = self.newBank()
+        bank.add(bank.key(0, 0, False, False), randomPattern(self.rng))
+        bank.save()
+        self.assertFalse(self.newBank(connectionOverride=True).load())
+        self.assertFalse(FeatureBank(self.path, buckets * 2, False).load())
+
+
+if __name__ == "__main__":
+    unittest.main()
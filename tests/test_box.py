@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from geometry.box import Box
+from geometry.point import Point
+
+
+def coords(points):
+    return [(round(p.x, 9), round(p.y, 9)) for p in points]
+
+
+class TestClip(unittest.TestCase):
+    """
+    Box.clip and Box.clipRun keep the parts of lines inside the box.
+    """
+
+    def setUp(self) -> None:
+        self.box = Box(0, 0, 10, 10)
+
+    def test_inside(self) -> None:
+        p0 = Point(1, 2)
+        p1 = Point(3, 4)
+        self.assertEqual(coords(self.box.clip(p0, p1)), [(1, 2), (3, 4)])
+        self.assertEqual((p0.x, p0.y, p1.x, p1.y), (1, 2, 3, 4))
+
+    def test_outside(self) -> None:
+        self.assertIsNone(self.box.clip(Point(-5, -1), Point(-1, 20)))
+        self.assertIsNone(self.box.clip(Point(11, 11), Point(20, 5)))
+
+    def test_crossing(self) -> None:
+        self.assertEqual(
+            coords(self.box.clip(Point(-5, 5), Point(15, 5))),
+            [(0, 5), (10, 5)])
+        self.assertEqual(
+            coords(self.box.clip(Point(5, 5), Point(5, 20))),
+            [(5, 5), (5, 10)])
+        self.assertEqual(
+            coords(self.box.clip(Point(-2, -2), Point(12, 12))),
+            [(0, 0), (10, 10)])
+
+    def test_cornerMiss(self) -> None:
+        # crosses the regions around a corner without entering the box
+        self.assertIsNone(self.box.clip(Point(-2, 9), Point(2, 13)))
+
+    def test_runInside(self) -> None:
+        run = [Point(1, 1), Point(2, 3), Point(4, 1)]
+        self.assertEqual(
+            [coords(r) for r in self.box.clipRun(run)], [coords(run)])
+
+    def test_runSplit(self) -> None:
+        run = [Point(5, 5), Point(15, 5), Point(15, 8), Point(5, 8)]
+        self.assertEqual(
+            [coords(r) for r in self.box.clipRun(run)],
+            [[(5, 5), (10, 5)], [(10, 8), (5, 8)]])
+
+    def test_runOutside(self) -> None:
+        run = [Point(-5, -5), Point(-1, -5), Point(-1, -1)]
+        self.assertEqual(self.box.clipRun(run), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import random
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from common.settings import Settings
+from common.utility import Logger
+from generation.color import ColorGenerator
+from generation.layer import LayerGenerator
+
+# Path to the settings file of the repository
+settingsPath = os.path.join(os.path.dirname(__file__), "..", "settings.ini")
+# Time budget that runs out before the first attempt is finished
+tinySeconds = "0.000000001"
+
+
+class TestBudgets(unittest.TestCase):
+    """
+    Every budgeted retry loop falls back to a result when its time budget
+    runs out before the first attempt.
+    """
+
+    def setUp(self) -> None:
+        self.settings = Settings(settingsPath)
+        self.settings.config.set("Program", "featureWorkers", "0")
+        self.settings.config.set("Ribbons", "candidateWorkers", "0")
+        random.seed("budget test")
+
+    def tinyBudget(self, name: str) -> None:
+        self.settings.config.set("Budgets", name + "Seconds", tinySeconds)
+
+    def getLayer(self) -> None:
+        generator = LayerGenerator(self.settings, Logger())
+        try:
+            layer = generator.getLayer(radius=0.5, width=0.06)
+        finally:
+            generator.close()
+        self.assertTrue(layer.ribbon.pattern.runs)
+
+    def test_color(self) -> None:
+        self.tinyBudget("color")
+        # no colors are different enough, so the budget always runs out
+        self.settings.config.set("Colors", "visualDiffThreshold", "1e9")
+        colors = ColorGenerator(self.settings, Logger())
+        self.assertIsNotNone(colors.getBackgroundColors()[0])
+        self.assertIsNotNone(colors.getLineColors()[0])
+
+    def test_ribbon(self) -> None:
+        self.tinyBudget("ribbon")
+        self.getLayer()
+
+    def test_curve(self) -> None:
+        self.tinyBudget("curve")
+        self.getLayer()
+
+    def test_point(self) -> None:
+        self.tinyBudget("point")
+        self.getLayer()
+
+    def test_rounding(self) -> None:
+        self.tinyBudget("rounding")
+        self.getLayer()
+
+
+if __name__ == "__main__":
+    unittest.main()
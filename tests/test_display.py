@@ -0,0 +1,80 @@
+import os
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"   # nopep8
+import random
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+import pygame
+from common.settings import Settings
+from common.utility import Logger
+from system.display import Display, dirtyTileSize
+
+# Path to the settings file of the repository
+settingsPath = os.path.join(os.path.dirname(__file__), "..", "settings.ini")
+
+
+class TestDirtyRects(unittest.TestCase):
+    """
+    Display.dirtyRects coalesces the dirty tiles into a few rectangles that
+    cover exactly the dirty tiles.
+    """
+
+    def setUp(self) -> None:
+        # not a multiple of the tile size, so the last tiles are clipped
+        self.display = Display(
+            pygame.Surface((10 * dirtyTileSize - 7, 6 * dirtyTileSize - 3)),
+            Settings(settingsPath),
+            Logger(),
+            deferred=False)
+
+    def covered(self, rects):
+        """
+        Set of the tiles covered by the rectangles, checking that they do
+        not overlap.
+        """
+        tiles = set()
+        for rect in rects:
+            for x in range(rect.left, rect.right, dirtyTileSize):
+                for y in range(rect.top, rect.bottom, dirtyTileSize):
+                    tile = (x // dirtyTileSize, y // dirtyTileSize)
+                    self.assertNotIn(tile, tiles)
+                    tiles.add(tile)
+        return tiles
+
+    def test_wholeSurface(self) -> None:
+        self.display.markDirty()
+        self.assertEqual(
+            self.display.dirtyRects(), [self.display.surf.get_rect()])
+
+    def test_smallArea(self) -> None:
+        self.display.markDirty(pygame.Rect(70, 10, 5, 5))
+        self.assertEqual(
+            self.display.dirtyRects(),
+            [pygame.Rect(dirtyTileSize, 0, dirtyTileSize, dirtyTileSize)])
+
+    def test_outside(self) -> None:
+        self.display.markDirty(pygame.Rect(-50, -50, 10, 10))
+        self.assertEqual(self.display.dirtyRects(), [])
+
+    def test_annulus(self) -> None:
+        # the edge of a rectangle of tiles becomes four rectangles
+        for tx in range(1, 8):
+            for ty in range(1, 5):
+                if tx in (1, 7) or ty in (1, 4):
+                    self.display.dirtyTiles.add((tx, ty))
+        rects = self.display.dirtyRects()
+        self.assertEqual(len(rects), 4)
+        self.assertEqual(self.covered(rects), self.display.dirtyTiles)
+
+    def test_randomTiles(self) -> None:
+        rng = random.Random("dirty test")
+        for _ in range(200):
+            self.display.dirtyTiles = {
+                (rng.randrange(10), rng.randrange(6))
+                for _ in range(rng.randrange(1, 40))}
+            rects = self.display.dirtyRects()
+            self.assertEqual(self.covered(rects), self.display.dirtyTiles)
+
+
+if __name__ == "__main__":
+    unittest.main()
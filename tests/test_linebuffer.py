@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from geometry.point import Point
+from system.linebuffer import LineBuffer, coordinateLimit, fixedPointScale
+
+
+class TestLineBuffer(unittest.TestCase):
+    """
+    LineBuffer stores runs as 32-bit fixed point coordinates.
+    """
+
+    def test_layout(self) -> None:
+        buffer = LineBuffer()
+        self.assertEqual(buffer.coords.itemsize, 4)
+        self.assertEqual(buffer.runEnds.itemsize, 4)
+
+    def test_roundTrip(self) -> None:
+        buffer = LineBuffer()
+        buffer.append([Point(0, 0), Point(1.5, -2.25), Point(3, 4)], 1)
+        buffer.append([Point(10.03, 20.97), Point(-5, 6)], 7)
+        runs = [(list(coords), color) for coords, color in buffer.runs()]
+        self.assertEqual(runs, [
+            ([0, 0, 24, -36, 48, 64], 1),
+            ([160, 336, -80, 96], 7)])
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.lineCount(), 3)
+        self.assertEqual(buffer.nbytes(), 10 * 4 + 2 * 4 + 2 * 2)
+
+    def test_precision(self) -> None:
+        buffer = LineBuffer()
+        x = 123.4567
+        buffer.append([Point(x, 0), Point(0, 0)], 0)
+        coords, _ = next(buffer.runs())
+        self.assertLessEqual(
+            abs(coords[0] / fixedPointScale - x), 0.5 / fixedPointScale)
+        del coords
+
+    def test_limits(self) -> None:
+        buffer = LineBuffer()
+        buffer.append([Point(1e12, -1e12), Point(0, 0)], 0)
+        coords, _ = next(buffer.runs())
+        self.assertEqual(list(coords[:2]), [coordinateLimit, -coordinateLimit])
+        del coords
+
+    def test_clear(self) -> None:
+        buffer = LineBuffer()
+        buffer.append([Point(0, 0), Point(1, 1)], 0)
+        buffer.clear()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.lineCount(), 0)
+        self.assertEqual(list(buffer.runs()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+from math import cos, sin
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from geometry.point import Point
+from hierarchy.pattern import Pattern, collinearThreshold
+
+
+class TestRemoveRedundancy(unittest.TestCase):
+    """
+    Pattern.removeRedundancy removes only redundant lines.
+    """
+
+    def test_shortSteps(self) -> None:
+        # an arc of steps shorter than the tolerance
+        radius = 0.05
+        step = collinearThreshold / 2 / radius
+        points = [Point(radius * cos(i * step), radius * sin(i * step))
+                  for i in range(200)]
+        pattern = Pattern()
+        pattern.addRun(points)
+        pattern.removeRedundancy()
+        self.assertEqual(len(pattern.runs), 1)
+        run = pattern.runs[0]
+        self.assertEqual((run[0].x, run[0].y), (points[0].x, points[0].y))
+        self.assertEqual((run[-1].x, run[-1].y), (points[-1].x, points[-1].y))
+
+    def test_zeroLength(self) -> None:
+        pattern = Pattern()
+        pattern.addRun(
+            [Point(0, 0), Point(0.5, 0), Point(0.5, 0), Point(0.5, 0.5)])
+        self.assertEqual(pattern.removeRedundancy(), 1)
+        self.assertEqual(len(pattern.runs), 1)
+        self.assertEqual(len(pattern.runs[0]), 3)
+
+    def test_duplicate(self) -> None:
+        pattern = Pattern()
+        pattern.addRun([Point(0, 0), Point(0.5, 0)])
+        pattern.addRun([Point(0.1, 0.5), Point(0.1, 0.6)])
+        pattern.addRun([Point(0.5, 0), Point(0, 0)])
+        self.assertEqual(pattern.removeRedundancy(), 1)
+        self.assertEqual(len(list(pattern.segments())), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
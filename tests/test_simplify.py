@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))  # nopep8
+from geometry.point import Point
+from geometry.utility import Sleeve, pointLineDistance, simplifyRun
+
+# Largest allowed deviation used in the tests
+tolerance = 0.5
+
+
+def deviation(original, simplified) -> float:
+    """
+    Largest distance of an original point from the simplified run.
+    """
+    return max(
+        min(pointLineDistance(p, simplified[i], simplified[i + 1])
+            for i in range(len(simplified) - 1))
+        for p in original)
+
+
+class TestSleeve(unittest.TestCase):
+    """
+    Sleeve allows only lines that pass close enough to every point.
+    """
+
+    def test_empty(self) -> None:
+        sleeve = Sleeve(Point(0, 0), tolerance)
+        self.assertTrue(sleeve.allows(Point(-3, 7)))
+
+    def test_direction(self) -> None:
+        sleeve = Sleeve(Point(0, 0), tolerance).added(Point(5, 0.3))
+        self.assertTrue(sleeve.allows(Point(10, 0)))
+        self.assertFalse(sleeve.allows(Point(10, 2)))
+        self.assertFalse(sleeve.allows(Point(-10, 0)))
+
+    def test_reach(self) -> None:
+        sleeve = Sleeve(Point(0, 0), tolerance).added(Point(5, 0))
+        self.assertFalse(sleeve.allows(Point(3, 0)))
+
+    def test_closePoint(self) -> None:
+        sleeve = Sleeve(Point(0, 0), tolerance).added(Point(0.2, 0.2))
+        self.assertTrue(sleeve.allows(Point(-3, 7)))
+
+    def test_addedCopies(self) -> None:
+        sleeve = Sleeve(Point(0, 0), tolerance)
+        sleeve.added(Point(5, 0))
+        self.assertTrue(sleeve.allows(Point(0, 5)))
+
+
+class TestSimplifyRun(unittest.TestCase):
+    """
+    simplifyRun removes points without moving the run further than the
+    tolerance.
+    """
+
+    def test_tolerance(self) -> None:
+        rng = random.Random("simplify test")
+        for _ in range(2000):
+            x = y = 0
+            points = []
+            for _ in range(rng.randint(3, 12)):
+                x += rng.uniform(-1.5, 1.5)
+                y += rng.uniform(-1.5, 1.5)
+                points.append(Point(x, y))
+            simplified = simplifyRun(points, tolerance)
+            if simplified is None:
+                continue
+            self.assertLessEqual(
+                deviation(points, simplified), tolerance + 1e-9)
+
+    def test_endpoints(self) -> None:
+        points = [Point(i * 0.3, (i % 2) * 0.1) for i in range(50)]
+        simplified = simplifyRun(points, tolerance)
+        self.assertIs(simplified[0], points[0])
+        self.assertIs(simplified[-1], points[-1])
+
+    def test_longTinyRun(self) -> None:
+        # a straight line of many tiny steps merges into one line
+        points = [Point(i * 0.01, (i % 2) * 0.001) for i in range(20000)]
+        simplified = simplifyRun(points, tolerance)
+        self.assertEqual(len(simplified), 2)
+
+    def test_visibleCorner(self) -> None:
+        points = [Point(0, 0), Point(5, 0), Point(5, 5)]
+        self.assertEqual(len(simplifyRun(points, tolerance)), 3)
+
+    def test_tooShort(self) -> None:
+        self.assertIsNone(simplifyRun([Point(0, 0), Point(0, 0)], tolerance))
+        self.assertIsNone(
+            simplifyRun([Point(0, 0), Point(0.2, 0.1)], tolerance))
+
+
+if __name__ == "__main__":
+    unittest.main()